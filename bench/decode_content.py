@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+Time to decode the content of an airport arrivals response, as APIRequest.get_content() did before it
+memoized the content and picked the JSON parser at import time, and as it does now.
+
+The payload is a synthetic board of 100 arrivals with the fields of the airport details endpoint. As
+requests decodes gzip transparently, the response holds the decompressed body with its Content-Encoding
+header, like a real one. Each response is decoded twice, as FlightRadar24API.search() used to do.
+Run it from the root of the repository:
+
+    python -m bench.decode_content [--responses 200]
+"""
+
+from typing import Dict, List
+
+import argparse
+import gzip
+import json
+import time
+
+import brotli
+import requests
+
+from flightradar24api.request import APIRequest, json_loads
+
+
+def build_payload(flights: int = 100) -> Dict:
+    """
+    Return an airport details payload with a page of arrivals.
+    """
+    now = int(time.time())
+    rows = list()
+
+    for index in range(flights):
+        rows.append({"flight": {
+            "identification": {"id": "3a{:04x}".format(index), "number": {"default": "QF{}".format(index), "alternative": None}},
+            "status": {"live": False, "text": "Scheduled", "generic": {"status": {"text": "scheduled", "type": "arrival"}}},
+            "aircraft": {"model": {"code": "B738", "text": "Boeing 737-838"}, "registration": "VH-X{:02d}".format(index % 100)},
+            "owner": {"name": "Qantas", "code": {"iata": "QF", "icao": "QFA"}},
+            "airline": {"name": "Qantas", "code": {"iata": "QF", "icao": "QFA"}},
+            "airport": {"origin": {
+                "name": "Melbourne Airport",
+                "code": {"iata": "MEL", "icao": "YMML"},
+                "position": {"latitude": -37.67, "longitude": 144.84, "country": {"name": "Australia", "code": "AU"}},
+                "timezone": {"name": "Australia/Melbourne", "offset": 36000},
+            }},
+            "time": {
+                "scheduled": {"departure": now + 60 * index, "arrival": now + 60 * index + 5400},
+                "real": {"departure": None, "arrival": None},
+                "estimated": {"departure": None, "arrival": None},
+            },
+        }})
+
+    return {"result": {"response": {"airport": {"pluginData": {
+        "details": {"name": "Sydney Kingsford Smith International Airport", "code": {"iata": "SYD", "icao": "YSSY"}},
+        "schedule": {"arrivals": {"item": {"current": flights}, "page": {"current": 1, "total": 1}, "data": rows}},
+    }}}}}
+
+
+def build_response(body: bytes) -> requests.Response:
+    """
+    Return a response as requests builds it for a gzip encoded JSON body.
+    """
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Content-Type"] = "application/json"
+    response.headers["Content-Encoding"] = "gzip"
+    response._content = body
+    return response
+
+
+class ResponseSession(object):
+    """
+    Session returning a prepared response, to build APIRequest instances without a server.
+    """
+    def __init__(self, response: requests.Response):
+        self.response = response
+
+    def get(self, *args, **kwargs) -> requests.Response:
+        return self.response
+
+
+def decode_before(response: requests.Response) -> Dict:
+    """
+    Decode the content of a response as APIRequest.get_content() did before, without memoizing it.
+    """
+    content = response.content
+    content_encodings = {"": lambda x: x, "br": brotli.decompress, "gzip": gzip.decompress}
+
+    # The body is already decompressed, so this always raises.
+    try: content = content_encodings[response.headers.get("Content-Encoding", "")](content)
+    except Exception: pass
+
+    return json.loads(content)
+
+
+def measure(responses: List[requests.Response], before: bool) -> float:
+    """
+    Decode each response twice and return the average time per response, in milliseconds.
+    """
+    start = time.perf_counter()
+
+    for response in responses:
+        if before:
+            decode_before(response)
+            decode_before(response)
+        else:
+            request = APIRequest("http://stub", session=ResponseSession(response))
+            request.get_content()
+            request.get_content()
+
+    return (time.perf_counter() - start) * 1000 / len(responses)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--responses", type=int, default=200, help="Number of responses decoded in each run")
+    args = parser.parse_args()
+
+    body = json.dumps(build_payload()).encode()
+    responses = [build_response(body) for _ in range(args.responses)]
+
+    print("payload: {:.0f} KB, {:.1f} KB gzipped, JSON parser: {}".format(
+        len(body) / 1024, len(gzip.compress(body)) / 1024, json_loads.__module__
+    ))
+    print("before: {:.2f} ms per response".format(measure(responses, True)))
+    print("after:  {:.2f} ms per response".format(measure(responses, False)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+Latency of the requests of FlightRadar24API with a new connection per request and with a pooled session.
+
+The requests are sent to a local keep-alive server, over plain HTTP, so the TLS handshake saved by the
+pool in production isn't included. Run it from the root of the repository:
+
+    python -m bench.request_latency [--requests 500]
+"""
+
+from typing import List, Optional
+
+import argparse
+import http.server
+import json
+import statistics
+import threading
+import time
+
+import requests
+import requests.adapters
+
+from flightradar24api.core import Core
+from flightradar24api.request import APIRequest
+
+# Body of a small response, similar to the one of airport.json.
+body = json.dumps({
+    "details": {
+        "name": "Sydney Kingsford Smith International Airport",
+        "code": {"iata": "SYD", "icao": "YSSY"},
+        "position": {"latitude": -33.946, "longitude": 151.177, "altitude": 21},
+        "timezone": {"name": "Australia/Sydney", "offset": 36000},
+    }
+}).encode()
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Handler answering every GET with the same JSON body, keeping the connection alive.
+    """
+    protocol_version = "HTTP/1.1"
+
+    # The headers and the body are written separately, don't let the second write wait for an ACK.
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def measure(url: str, count: int, session: Optional[requests.Session] = None) -> List[float]:
+    """
+    Send requests one after the other and return the latency of each one, in milliseconds.
+    """
+    latencies = list()
+
+    for _ in range(count):
+        start = time.perf_counter()
+        APIRequest(url, headers=Core.json_headers, session=session).get_content()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="Number of requests of each run")
+    parser.add_argument("--pool-size", type=int, default=10, help="Number of connections of the pooled session")
+    args = parser.parse_args()
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{}/common/v1/airport.json".format(server.server_address[1])
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=args.pool_size, pool_maxsize=args.pool_size)
+    session.mount("http://", adapter)
+
+    # Warm up both paths, e.g. the imports of requests and the first connection of the pool.
+    measure(url, 10)
+    measure(url, 10, session)
+
+    for name, latencies in (
+        ("fresh connection per call", measure(url, args.requests)),
+        ("pooled session", measure(url, args.requests, session)),
+    ):
+        print("{:<26} median {:.2f} ms, p95 {:.2f} ms".format(
+            name + ":", statistics.median(latencies), statistics.quantiles(latencies, n=20)[-1]
+        ))
+
+    session.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -16,4 +16,6 @@ __author__ = "Jean Loui Bernard Silva de Jesus"
 __version__ = "1.3.26"
 
 from .api import FlightRadar24API, FlightTrackerConfig
+from .cache import ResponseCache
 from .entities import Airport, Entity, Flight
+from .retry import CircuitBreaker, RetryPolicy
@@ -1,15 +1,22 @@
 # -*- coding: utf-8 -*-
 
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
+import concurrent.futures
 import dataclasses
+import http.cookiejar
 import math
 
+import requests
+import requests.adapters
+
+from .cache import ResponseCache
 from .core import Core
 from .entities.airport import Airport
 from .entities.flight import Flight
 from .errors import AirportNotFoundError, LoginError
 from .request import APIRequest
+from .retry import CircuitBreaker, RetryPolicy
 
 
 @dataclasses.dataclass
@@ -32,29 +39,120 @@ class FlightTrackerConfig(object):
     limit: str = "5000"
 
 
+# Retry budgets of each endpoint. Endpoints not listed here use the "default" policy.
+default_retry_policies = {
+    "default": RetryPolicy(max_retries=1),
+    "airport_details": RetryPolicy(max_retries=2),
+    "rego_details": RetryPolicy(max_retries=2),
+    "flight_details": RetryPolicy(max_retries=0),
+    "login": RetryPolicy(max_retries=0),
+    "logout": RetryPolicy(max_retries=0),
+}
+
+# Seconds the responses of each endpoint are cached. Endpoints not listed here are never cached.
+default_cache_ttls = {
+    "airlines": 24 * 60 * 60,
+    "airline_logo": 24 * 60 * 60,
+    "airports": 24 * 60 * 60,
+    "country_flag": 24 * 60 * 60,
+    "zones": 24 * 60 * 60,
+    "airport": 60 * 60,
+    "rego_details": 5 * 60,
+    "airport_details": 30,
+}
+
+
 class FlightRadar24API(object):
     """
     Main class of the FlightRadarAPI
     """
 
-    def __init__(self, user: Optional[str] = None, password: Optional[str] = None):
+    def __init__(
+        self,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        pool_size: int = 10,
+        retry_policies: Optional[Dict[str, RetryPolicy]] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        timeout: Optional[float] = 30,
+        cache_size: int = 0,
+        cache_ttls: Optional[Dict[str, float]] = None
+    ):
         """
         Constructor of the FlightRadar24API class.
 
         :param user: Your email (optional)
         :param password: Your password (optional)
+        :param pool_size: Maximum number of keep-alive connections kept open per host
+        :param retry_policies: Retry policy of each endpoint, overriding the default ones (optional)
+        :param circuit_breaker: Circuit breaker used to fail fast while FlightRadar24 is throttling the requests (optional)
+        :param timeout: Seconds to wait for the server on each attempt
+        :param cache_size: Maximum number of responses kept in the cache. If 0, responses are not cached
+        :param cache_ttls: Seconds the responses of each endpoint are cached, overriding the default ones (optional)
         """
         self.__flight_tracker_config = FlightTrackerConfig()
         self.__login_data: Optional[Dict] = None
 
+        self.__retry_policies = default_retry_policies.copy()
+        self.__retry_policies.update(retry_policies or dict())
+        self.__circuit_breaker = circuit_breaker
+        self.__timeout = timeout
+
+        self.__cache = ResponseCache(cache_size) if cache_size > 0 else None
+        self.__cache_ttls = default_cache_ttls.copy()
+        self.__cache_ttls.update(cache_ttls or dict())
+
+        # All requests of this instance share a single session, so connections are reused between calls.
+        self.__session = requests.Session()
+
+        # Cookies are passed explicitly to each request, the session must not keep its own.
+        self.__session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.__session.mount("https://", adapter)
+        self.__session.mount("http://", adapter)
+
         if user is not None and password is not None:
             self.login(user, password)
 
+    def __request(self, endpoint: str, *args: Any, **kwargs: Any) -> APIRequest:
+        """
+        Make a request through the session of this instance, with the retry policy of the endpoint.
+
+        :param endpoint: Name of the endpoint, used to choose the retry policy and the cache TTL
+        """
+        retry_policy = self.__retry_policies.get(endpoint, self.__retry_policies["default"])
+
+        return APIRequest(
+            *args, session=self.__session, retry_policy=retry_policy,
+            circuit_breaker=self.__circuit_breaker, timeout=self.__timeout,
+            cache=self.__cache, cache_ttl=self.__cache_ttls.get(endpoint), **kwargs
+        )
+
+    def clear_cache(self) -> None:
+        """
+        Remove all the cached responses.
+        """
+        if self.__cache is not None: self.__cache.clear()
+
+    def get_cache_stats(self) -> Dict[str, int]:
+        """
+        Return the hit, miss and eviction counters and the current size of the response cache.
+        """
+        if self.__cache is None: return {"hits": 0, "misses": 0, "evictions": 0, "size": 0}
+        return self.__cache.get_stats()
+
+    def close(self) -> None:
+        """
+        Close all the pooled connections of this instance.
+        """
+        self.__session.close()
+
     def get_airlines(self) -> List[Dict]:
         """
         Return a list with all airlines.
         """
-        response = APIRequest(Core.airlines_data_url, headers=Core.json_headers)
+        response = self.__request("airlines", Core.airlines_data_url, headers=Core.json_headers)
         return response.get_content()["rows"]
 
     def get_airline_logo(self, iata: str, icao: str) -> Optional[Tuple[bytes, str]]:
@@ -66,7 +164,7 @@ class FlightRadar24API(object):
         first_logo_url = Core.airline_logo_url.format(iata, icao)
 
         # Try to get the image by the first URL option.
-        response = APIRequest(first_logo_url, headers=Core.image_headers, exclude_status_codes=[403,])
+        response = self.__request("airline_logo", first_logo_url, headers=Core.image_headers, exclude_status_codes=[403,])
         status_code = response.get_status_code()
 
         if not str(status_code).startswith("4"):
@@ -75,7 +173,7 @@ class FlightRadar24API(object):
         # Get the image by the second airline logo URL.
         second_logo_url = Core.alternative_airline_logo_url.format(icao)
 
-        response = APIRequest(second_logo_url, headers=Core.image_headers)
+        response = self.__request("airline_logo", second_logo_url, headers=Core.image_headers)
         status_code = response.get_status_code()
 
         if not str(status_code).startswith("4"):
@@ -99,7 +197,7 @@ class FlightRadar24API(object):
 
             return airport
 
-        response = APIRequest(Core.airport_data_url.format(code), headers=Core.json_headers)
+        response = self.__request("airport", Core.airport_data_url.format(code), headers=Core.json_headers)
         content = response.get_content()
 
         if not content or not isinstance(content, dict) or not content.get("details"):
@@ -107,6 +205,106 @@ class FlightRadar24API(object):
 
         return Airport(info=content["details"])
 
+    def get_airport_arrival_pages(
+        self,
+        code: str,
+        pages: Iterable[int],
+        flight_limit: int = 100,
+        *,
+        max_workers: int = 4,
+        on_page_error: Optional[Callable[[int, Exception], None]] = None
+    ) -> List[Dict]:
+        """
+        Return the arrivals schedule of several pages of an airport, fetched concurrently.
+
+        Each item has the "page" information and the "data" of the arrivals, in the same order as the pages.
+
+        :param code: ICAO or IATA of the airport
+        :param pages: Pages of result to fetch. Negative pages are the arrivals history
+        :param flight_limit: Limit of flights of each page
+        :param max_workers: Maximum number of pages fetched at the same time
+        :param on_page_error: If given, it's called with the page and the exception of each page that
+                              could not be fetched, and the page is left out. Otherwise, the exception is raised
+        """
+        pages = list(pages)
+
+        if not pages:
+            return list()
+
+        def get_page(page: int) -> Dict:
+            airport_details = self.get_airport_details(code, flight_limit, page)
+            return airport_details["airport"]["pluginData"]["schedule"]["arrivals"]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pages)))) as executor:
+            futures = [executor.submit(get_page, page) for page in pages]
+
+        schedules: List[Dict] = list()
+
+        for page, future in zip(pages, futures):
+            try:
+                schedules.append(future.result())
+            except Exception as error:
+                if on_page_error is None: raise
+                on_page_error(page, error)
+
+        return schedules
+
+    def get_airport_arrivals(
+        self,
+        code: str,
+        pages: Optional[Iterable[int]] = None,
+        flight_limit: int = 100,
+        *,
+        history: bool = False,
+        max_workers: int = 4,
+        on_page_error: Optional[Callable[[int, Exception], None]] = None
+    ) -> List[Dict]:
+        """
+        Return the arrivals of several pages of an airport merged in a single list, fetched concurrently.
+
+        The arrivals keep the order of the pages and of each page. A flight listed again
+        on a later page, because the board moved while it was fetched, is only returned once.
+
+        :param code: ICAO or IATA of the airport
+        :param pages: Pages of result to fetch. If None, the first page is fetched to find the total of pages and then all of them are fetched
+        :param flight_limit: Limit of flights of each page
+        :param history: If True and pages is None, fetch the arrivals history (negative pages) instead of the upcoming arrivals
+        :param max_workers: Maximum number of pages fetched at the same time
+        :param on_page_error: If given, it's called with the page and the exception of each page that
+                              could not be fetched, and the page is left out. Otherwise, the exception is raised
+        """
+        if pages is not None:
+            schedules = self.get_airport_arrival_pages(
+                code, pages, flight_limit, max_workers=max_workers, on_page_error=on_page_error
+            )
+        else:
+            direction = -1 if history else 1
+            schedules = self.get_airport_arrival_pages(code, [direction], flight_limit, on_page_error=on_page_error)
+
+            if not schedules:
+                return list()
+
+            total_pages = schedules[0]["page"]["total"] or 1
+            schedules += self.get_airport_arrival_pages(
+                code, [direction * page for page in range(2, total_pages + 1)], flight_limit,
+                max_workers=max_workers, on_page_error=on_page_error
+            )
+
+        arrivals: List[Dict] = list()
+        flight_ids = set()
+
+        for schedule in schedules:
+            for arrival in schedule["data"] or list():
+                flight_id = ((arrival.get("flight") or dict()).get("identification") or dict()).get("id")
+
+                if flight_id is not None:
+                    if flight_id in flight_ids: continue
+                    flight_ids.add(flight_id)
+
+                arrivals.append(arrival)
+
+        return arrivals
+
     def get_airport_details(self, code: str, flight_limit: int = 100, page: int = 1) -> Dict:
         """
         Return the airport details from FlightRadar24.
@@ -129,7 +327,7 @@ class FlightRadar24API(object):
         request_params["page"] = page
 
         # Request details from the FlightRadar24.
-        response = APIRequest(Core.api_airport_data_url, request_params, Core.json_headers, exclude_status_codes=[400,])
+        response = self.__request("airport_details", Core.api_airport_data_url, request_params, Core.json_headers, exclude_status_codes=[400,])
         content: Dict = response.get_content()
 
         if response.get_status_code() == 400 and content.get("errors"):
@@ -155,14 +353,14 @@ class FlightRadar24API(object):
         """
         Return airport disruptions.
         """
-        response = APIRequest(Core.airport_disruptions_url, headers=Core.json_headers)
+        response = self.__request("airport_disruptions", Core.airport_disruptions_url, headers=Core.json_headers)
         return response.get_content()
 
     def get_airports(self) -> List[Airport]:
         """
         Return a list with all airports.
         """
-        response = APIRequest(Core.airports_data_url, headers=Core.json_headers)
+        response = self.__request("airports", Core.airports_data_url, headers=Core.json_headers)
 
         airports: List[Airport] = list()
 
@@ -184,7 +382,7 @@ class FlightRadar24API(object):
 
         cookies = self.__login_data["cookies"]
 
-        response = APIRequest(Core.bookmarks_url, headers=headers, cookies=cookies)
+        response = self.__request("bookmarks", Core.bookmarks_url, headers=headers, cookies=cookies)
         return response.get_content()
 
     def get_bounds(self, zone: Dict[str, float]) -> str:
@@ -261,7 +459,7 @@ class FlightRadar24API(object):
         if "origin" in headers:
             headers.pop("origin")  # Does not work for this request.
 
-        response = APIRequest(flag_url, headers=headers)
+        response = self.__request("country_flag", flag_url, headers=headers)
         status_code = response.get_status_code()
 
         if not str(status_code).startswith("4"):
@@ -273,7 +471,7 @@ class FlightRadar24API(object):
 
         :param flight: A Flight instance
         """
-        response = APIRequest(Core.flight_data_url.format(flight.id), headers=Core.json_headers)
+        response = self.__request("flight_details", Core.flight_data_url.format(flight.id), headers=Core.json_headers)
         return response.get_content()
 
     def get_rego_details(self, aircraft: str) -> Dict[Any, Any]:
@@ -288,7 +486,7 @@ class FlightRadar24API(object):
             request_params["token"] = self.__login_data["cookies"]["_frPl"]
 
         # Request details from the FlightRadar24.
-        response = APIRequest(Core.aircraft_detail_url.format(aircraft), request_params, headers=Core.json_headers)
+        response = self.__request("rego_details", Core.aircraft_detail_url.format(aircraft), request_params, headers=Core.json_headers)
         content: Dict = response.get_content()
 
         if response.get_status_code() == 400 and content.get("errors"):
@@ -310,16 +508,25 @@ class FlightRadar24API(object):
         registration: Optional[str] = None,
         aircraft_type: Optional[str] = None,
         *,
-        details: bool = False
+        details: bool = False,
+        details_filter: Optional[Callable[[Flight], bool]] = None,
+        details_timeout: Optional[float] = None,
+        max_workers: int = 8
     ) -> List[Flight]:
         """
         Return a list of flights. See more options at set_flight_tracker_config() method.
 
+        The detailed information is fetched concurrently. Flights whose details could not be
+        fetched, or were not fetched before the timeout, are returned without them.
+
         :param airline: The airline ICAO. Ex: "DAL"
         :param bounds: Coordinates (y1, y2 ,x1, x2). Ex: "75.78,-75.78,-427.56,427.56"
         :param registration: Aircraft registration
         :param aircraft_type: Aircraft model code. Ex: "B737"
         :param details: If True, it returns flights with detailed information
+        :param details_filter: If given, only the flights for which it returns True get detailed information
+        :param details_timeout: Seconds to wait for all the detailed information (optional)
+        :param max_workers: Maximum number of detailed information requests at the same time
         """
         request_params = dataclasses.asdict(self.__flight_tracker_config)
 
@@ -333,7 +540,7 @@ class FlightRadar24API(object):
         if aircraft_type: request_params["type"] = aircraft_type
 
         # Get all flights from Data Live FlightRadar24.
-        response = APIRequest(Core.real_time_flight_tracker_data_url, request_params, Core.json_headers)
+        response = self.__request("flights", Core.real_time_flight_tracker_data_url, request_params, Core.json_headers)
         response = response.get_content()
 
         flights: List[Flight] = list()
@@ -347,13 +554,37 @@ class FlightRadar24API(object):
             flight = Flight(flight_id, flight_info)
             flights.append(flight)
 
-            # Set flight details.
-            if details:
-                flight_details = self.get_flight_details(flight)
-                flight.set_flight_details(flight_details)
+        # Set flight details.
+        if details:
+            detailed_flights = [flight for flight in flights if details_filter is None or details_filter(flight)]
+            self.__set_flights_details(detailed_flights, details_timeout, max_workers)
 
         return flights
 
+    def __set_flights_details(self, flights: List[Flight], timeout: Optional[float], max_workers: int) -> None:
+        """
+        Fetch the details of several flights concurrently and set them to the instances.
+
+        :param flights: Flight instances to set the details
+        :param timeout: Seconds to wait for all the details. Details received later are discarded
+        :param max_workers: Maximum number of requests at the same time
+        """
+        if not flights:
+            return
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(flights))))
+        futures = {executor.submit(self.get_flight_details, flight): flight for flight in flights}
+
+        done, not_done = concurrent.futures.wait(futures, timeout=timeout)
+
+        # Don't wait for the requests left behind by the timeout.
+        for future in not_done: future.cancel()
+        executor.shutdown(wait=False)
+
+        for future in done:
+            if future.exception() is None:
+                futures[future].set_flight_details(future.result())
+
     def get_flight_tracker_config(self) -> FlightTrackerConfig:
         """
         Return a copy of the current config of the Real Time Flight Tracker, used by get_flights() method.
@@ -376,8 +607,8 @@ class FlightRadar24API(object):
         if file_type not in ["csv", "kml"]:
             raise ValueError(f"File type '{file_type}' is not supported. Only CSV and KML are supported.")
 
-        response = APIRequest(
-            Core.historical_data_url.format(flight.id, file_type, timestamp),
+        response = self.__request(
+            "history_data", Core.historical_data_url.format(flight.id, file_type, timestamp),
             headers=Core.json_headers, cookies=self.__login_data["cookies"],
         )
 
@@ -397,35 +628,32 @@ class FlightRadar24API(object):
         """
         Return the most tracked data.
         """
-        response = APIRequest(Core.most_tracked_url, headers=Core.json_headers)
+        response = self.__request("most_tracked", Core.most_tracked_url, headers=Core.json_headers)
         return response.get_content()
 
     def get_volcanic_eruptions(self) -> Dict:
         """
         Return boundaries of volcanic eruptions and ash clouds impacting aviation.
         """
-        response = APIRequest(Core.volcanic_eruption_data_url, headers=Core.json_headers)
+        response = self.__request("volcanic_eruptions", Core.volcanic_eruption_data_url, headers=Core.json_headers)
         return response.get_content()
 
     def get_zones(self) -> Dict[str, Dict]:
         """
         Return all major zones on the globe.
         """
-        response = APIRequest(Core.zones_data_url, headers=Core.json_headers)
-        zones = response.get_content()
-
-        if "version" in zones:
-            zones.pop("version")
-
-        return zones
+        response = self.__request("zones", Core.zones_data_url, headers=Core.json_headers)
+        # The content may be cached, so it's copied instead of being modified.
+        return {name: zone for name, zone in response.get_content().items() if name != "version"}
 
     def search(self, query: str, limit: int = 50) -> Dict:
         """
         Return the search result.
         """
-        response = APIRequest(Core.search_data_url.format(query, limit), headers=Core.json_headers)
-        results = response.get_content().get("results", [])
-        stats = response.get_content().get("stats", {})
+        response = self.__request("search", Core.search_data_url.format(query, limit), headers=Core.json_headers)
+        content = response.get_content()
+        results = content.get("results", [])
+        stats = content.get("stats", {})
 
         i = 0
         counted_total = 0
@@ -458,7 +686,7 @@ class FlightRadar24API(object):
             "type": "web"
         }
 
-        response = APIRequest(Core.user_login_url, headers=Core.json_headers, data=data)
+        response = self.__request("login", Core.user_login_url, headers=Core.json_headers, data=data)
         status_code = response.get_status_code()
         content = response.get_content()
 
@@ -482,7 +710,7 @@ class FlightRadar24API(object):
         cookies = self.__login_data["cookies"]
         self.__login_data = None
 
-        response = APIRequest(Core.user_login_url, headers=Core.json_headers, cookies=cookies)
+        response = self.__request("logout", Core.user_login_url, headers=Core.json_headers, cookies=cookies)
         return str(response.get_status_code()).startswith("2")
 
     def set_flight_tracker_config(
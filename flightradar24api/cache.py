@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import collections
+import threading
+import time
+
+
+class ResponseCache(object):
+    """
+    In-memory cache of responses with a time to live per entry and a least recently used eviction policy.
+    """
+    def __init__(self, max_size: int = 256):
+        """
+        Constructor of the ResponseCache class.
+
+        :param max_size: Maximum number of entries kept. The least recently used entry is evicted first
+        """
+        if max_size < 1:
+            raise ValueError(f"The cache size must be at least 1. Got '{max_size}'")
+
+        self.max_size = max_size
+
+        self.__lock = threading.Lock()
+        self.__entries: "collections.OrderedDict[Hashable, Tuple[float, Any]]" = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Return the cached value of a key, or None if it is missing or expired.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None: del self.__entries[key]
+                self.misses += 1
+                return None
+
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        """
+        Cache a value for a number of seconds.
+        """
+        with self.__lock:
+            self.__entries[key] = (time.monotonic() + ttl, value)
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Remove all the entries of the cache.
+        """
+        with self.__lock:
+            self.__entries.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Return the hit, miss and eviction counters and the current size of the cache.
+        """
+        with self.__lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self.__entries)}
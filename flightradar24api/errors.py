@@ -15,3 +15,12 @@ class CloudflareError(Exception):
 
 class LoginError(Exception):
     pass
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, message, retry_in):
+        self.message = message
+        self.retry_in = retry_in
+
+    def __str__(self):
+        return self.message
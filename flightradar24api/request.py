@@ -5,11 +5,23 @@ from typing import Dict, List, Optional, Union
 import brotli
 import json
 import gzip
+import time
 
 import requests
 import requests.structures
+import urllib3.response
 
+from .cache import ResponseCache
 from .errors import CloudflareError
+from .retry import CircuitBreaker, RetryPolicy, parse_retry_after
+
+# Use a faster JSON parser if it's installed.
+try:
+    import orjson
+    json_loads = orjson.loads
+
+except ImportError:
+    json_loads = json.loads
 
 
 class APIRequest(object):
@@ -22,6 +34,9 @@ class APIRequest(object):
         "gzip": gzip.decompress
     }
 
+    # Content encodings decoded by urllib3 when requests reads the response.
+    __transparent_encodings = frozenset(urllib3.response.HTTPResponse.CONTENT_DECODERS)
+
     def __init__(
         self,
         url: str,
@@ -29,7 +44,13 @@ class APIRequest(object):
         headers: Optional[Dict] = None,
         data: Optional[Dict] = None,
         cookies: Optional[Dict] = None,
-        exclude_status_codes: List[int] = list()
+        exclude_status_codes: List[int] = list(),
+        session: Optional[requests.Session] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        timeout: Optional[float] = None,
+        cache: Optional[ResponseCache] = None,
+        cache_ttl: Optional[float] = None
     ):
         """
         Constructor of the APIRequest class.
@@ -40,8 +61,15 @@ class APIRequest(object):
         :param data: data for the request. If "data" is None, request will be a GET. Otherwise, it will be a POST
         :param cookies: cookies for the request
         :param exclude_status_codes: raise for status code except those on the excluded list
+        :param session: session used to send the request, reusing its pooled connections. If None, a new connection is opened
+        :param retry_policy: how failed attempts are retried. If None, the request is sent only once
+        :param circuit_breaker: circuit breaker checked before each attempt and fed with its outcome (optional)
+        :param timeout: seconds to wait for the server before the attempt fails (optional)
+        :param cache: cache where successful GET responses are looked up and stored with their decoded content (optional)
+        :param cache_ttl: seconds a response stays in the cache. If None, the cache is not used
         """
         self.url = url
+        self.__content: Optional[Union[Dict, bytes]] = None
 
         self.request_params = {
             "params": params,
@@ -50,10 +78,54 @@ class APIRequest(object):
             "cookies": cookies
         }
 
-        request_method = requests.get if data is None else requests.post
+        requester = session if session is not None else requests
+        request_method = requester.get if data is None else requester.post
 
         if params: url += "?" + "&".join(["{}={}".format(k, v) for k, v in params.items()])
-        self.__response = request_method(url, headers=headers, cookies=cookies, data=data)
+
+        # The full URL, with the params, is the cache key.
+        use_cache = cache is not None and cache_ttl and data is None
+
+        if use_cache:
+            cached_response = cache.get(url)
+
+            if cached_response is not None:
+                self.__response, self.__content = cached_response
+                return
+
+        retry_policy = retry_policy if retry_policy is not None else RetryPolicy(max_retries=0)
+        attempt = 0
+
+        while True:
+            if circuit_breaker is not None: circuit_breaker.before_request()
+
+            try:
+                self.__response = request_method(url, headers=headers, cookies=cookies, data=data, timeout=timeout)
+
+            except (requests.ConnectionError, requests.Timeout):
+                if circuit_breaker is not None: circuit_breaker.record_failure()
+
+                delay = retry_policy.get_backoff(attempt)
+                if delay is None: raise
+
+            except requests.RequestException:
+                # Not worth retrying, but it must still end the trial request of the circuit breaker.
+                if circuit_breaker is not None: circuit_breaker.record_failure()
+                raise
+
+            else:
+                if self.get_status_code() not in retry_policy.retry_status_codes:
+                    if circuit_breaker is not None: circuit_breaker.record_success()
+                    break
+
+                retry_after = parse_retry_after(self.__response.headers.get("Retry-After"))
+                if circuit_breaker is not None: circuit_breaker.record_failure(retry_after)
+
+                delay = retry_policy.get_backoff(attempt, retry_after)
+                if delay is None: break
+
+            time.sleep(delay)
+            attempt += 1
 
         if self.get_status_code() == 520:
             raise CloudflareError(
@@ -64,23 +136,35 @@ class APIRequest(object):
         if self.get_status_code() not in exclude_status_codes:
             self.__response.raise_for_status()
 
+        # The content is decoded before it's cached, so the cache hits don't decode it again.
+        if use_cache and str(self.get_status_code()).startswith("2"):
+            cache.set(url, (self.__response, self.get_content()), cache_ttl)
+
     def get_content(self) -> Union[Dict, bytes]:
         """
         Return the received content from the request.
+
+        The content is decoded only once, further calls return the same object. The content of a cached
+        response is shared by all the requests hitting the cache, so it must not be modified.
         """
+        if self.__content is not None:
+            return self.__content
+
         content = self.__response.content
 
         content_encoding = self.__response.headers.get("Content-Encoding", "")
         content_type = self.__response.headers["Content-Type"]
 
-        # Try to decode the content.
-        try: content = self.__content_encodings[content_encoding](content)
-        except Exception: pass
+        # Try to decode the content, unless requests has already done it.
+        if content_encoding not in self.__transparent_encodings:
+            try: content = self.__content_encodings[content_encoding](content)
+            except Exception: pass
 
         # Return a dictionary if the content type is JSON.
         if "application/json" in content_type:
-            return json.loads(content)
+            content = json_loads(content)
 
+        self.__content = content
         return content
 
     def get_cookies(self) -> Dict:
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+from typing import Optional, Tuple
+
+import dataclasses
+import email.utils
+import random
+import threading
+import time
+
+from .errors import CircuitOpenError
+
+
+@dataclasses.dataclass
+class RetryPolicy(object):
+    """
+    Data class with the retry settings of an endpoint.
+    """
+    max_retries: int = 2
+    backoff_factor: float = 0.5
+    max_backoff: float = 8.0
+    retry_status_codes: Tuple[int, ...] = (429, 500, 502, 503, 504, 520)
+
+    def get_backoff(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        Return how many seconds to wait before the next attempt, or None if the request must not be retried.
+
+        The delay grows exponentially with full jitter. If the server sent a Retry-After longer
+        than the maximum backoff, the request is given up instead of blocking the caller.
+
+        :param attempt: Number of attempts already retried, starting at 0
+        :param retry_after: Seconds requested by the Retry-After header of the response (optional)
+        """
+        if attempt >= self.max_retries:
+            return None
+
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_backoff else None
+
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * (2 ** attempt)))
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker shared by the requests to the FlightRadar24.
+
+    After a number of consecutive failures, or when the server asks to retry later,
+    the circuit opens and requests fail fast with a CircuitOpenError until the reset timeout expires.
+    Then a single trial request is let through: it closes the circuit if it succeeds, or opens it again.
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        """
+        Constructor of the CircuitBreaker class.
+
+        :param failure_threshold: Number of consecutive failures that open the circuit
+        :param reset_timeout: Seconds the circuit stays open before a trial request is allowed
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.__lock = threading.Lock()
+        self.__failures = 0
+        self.__open_until: Optional[float] = None
+        self.__trial_in_flight = False
+
+    def before_request(self) -> None:
+        """
+        Raise CircuitOpenError if a request must not be sent now.
+        """
+        with self.__lock:
+            if self.__open_until is None:
+                return
+
+            retry_in = self.__open_until - time.monotonic()
+
+            if retry_in > 0 or self.__trial_in_flight:
+                raise CircuitOpenError(
+                    message="FlightRadar24 is throttling the requests. Retry in {:.0f} seconds.".format(max(retry_in, 0)),
+                    retry_in=max(retry_in, 0)
+                )
+
+            # Half-open: let this request through as the trial.
+            self.__trial_in_flight = True
+
+    def record_success(self) -> None:
+        """
+        Close the circuit after a successful request.
+        """
+        with self.__lock:
+            self.__failures = 0
+            self.__open_until = None
+            self.__trial_in_flight = False
+
+    def record_failure(self, retry_after: Optional[float] = None) -> None:
+        """
+        Count a failed request and open the circuit if needed.
+
+        :param retry_after: Seconds requested by the Retry-After header of the response (optional)
+        """
+        with self.__lock:
+            self.__failures += 1
+
+            if self.__trial_in_flight or retry_after is not None or self.__failures >= self.failure_threshold:
+                open_for = max(self.reset_timeout if retry_after is None else retry_after, 0)
+                self.__open_until = max(self.__open_until or 0, time.monotonic() + open_for)
+
+            self.__trial_in_flight = False
+
+    def is_open(self) -> bool:
+        """
+        Check if the requests are currently failing fast.
+        """
+        with self.__lock:
+            return self.__open_until is not None and self.__open_until > time.monotonic()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Convert the value of a Retry-After header, given in seconds or as an HTTP date, to seconds.
+    """
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+
+    try:
+        retry_date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(retry_date.timestamp() - time.time(), 0)
@@ -7,30 +7,46 @@
 ### Importing libraries
 #################################
 
-from flightradar24api import FlightRadar24API # local lib
-from telegram import Update, ReplyKeyboardMarkup
+from flightradar24api import FlightRadar24API, CircuitBreaker # local lib
+from flightradar24api.errors import CircuitOpenError
+from spmonitor import ArrivalRecord
+from spmonitor.airport import AirportDetails, AirportMonitor
+from spmonitor.history import collect_rare_plane_times
+from spmonitor.outbox import NotificationOutbox, OutboxSender
+from spmonitor.pager import ArrivalsPager
+from spmonitor.photo_cache import PhotoIdCache
+from spmonitor.rego_cache import RegoDetailsCache
+from spmonitor.scheduler import PollScheduler
+from spmonitor.seen import SeenFlightCache
+from spmonitor.shards import ShardOutbox, ShardPool, ShardStateStore
+from spmonitor.subscription import FilterSettings, Subscription
+from spmonitor.state import FilterStateStore, is_missing
+from spmonitor.sqlite_state import SqliteStateStore
+from spmonitor.sun_table import SunTableRegistry
+from spmonitor.time_helper import AirportClock, get_weekday_mask
+from telegram import Update, ReplyKeyboardMarkup, InputMediaPhoto
+from telegram.error import BadRequest, Unauthorized
 from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackContext, ConversationHandler
 import logging
+import html
+import functools
 from datetime import datetime
-import threading
-from time import sleep
-import pytz
 import pandas as pd
 import os
 import os.path
 import math
 import warnings
 from environs import Env
-from pathlib import Path
-from astral import LocationInfo
-from astral.sun import sun
+from dotenv import dotenv_values
 
 #################################
 ### Setting up enviroments
 #################################
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
-fr_api = FlightRadar24API()
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 # Read enviromental variables from config file
 env = Env()
@@ -51,27 +67,48 @@ env.read_env('config/config.env')
 
 # Define how often the notification check will run
 notification_delay = math.ceil(env.float('NOTIFICATION_DELAY')*60) # in mintues
+adaptive_polling = env.bool('ADAPTIVE_POLLING', True) # Adjust the delay to the traffic, the time of day and the watched planes
+polling_min_delay = env.float('POLLING_MIN_DELAY', 1)*60 # in minutes
+polling_max_delay = env.float('POLLING_MAX_DELAY', 15)*60 # in minutes
+polling_night_hours = env.list('POLLING_NIGHT_HOURS', [0,1,2,3,4], subcast=int) # Local hours polled at the maximum delay
+polling_watch_window = env.float('POLLING_WATCH_WINDOW', 30)*60 # in minutes before a watched plane arrives, polled at the minimum delay
 
 ## Telegram setting
 telegram_bot_token = env.str('TELEGRAM_BOT_TOKEN') # Define Telegram bot token
-chat_id = env.str('CHAT_ID') # use raw data bot to obtain user chat id # Define Telegram chat id
+chat_ids = [chat_id.strip() for chat_id in env.list('CHAT_ID') if chat_id.strip()] # use raw data bot to obtain user chat id # Define Telegram chat ids, separated by comma; each chat has its own filters
+telegram_chat_interval = env.float('TELEGRAM_CHAT_INTERVAL', 1) # in seconds, minimum delay between two messages to the chat
+digest_mode = env.str('DIGEST_MODE', 'Off').strip().capitalize() # Off, Message or Album; with a digest the matches of an update are sent together
+if digest_mode not in ['Off', 'Message', 'Album']:
+    raise Exception(f"Invalid DIGEST_MODE '{digest_mode}', it must be Off, Message or Album!")
+digest_max_photos = 10 # Telegram accepts at most 10 photos in an album
+digest_max_length = 4096 # Telegram accepts at most 4096 characters in a message
 
 ## Flightradar setting
-airport_code = env.str('AIRPORT_CODE') # Define airport and local time zone
-
-# Find location of the local airport
-try:
-    airport = fr_api.get_airport_details(code = airport_code)
-    airport_name = airport['airport']['pluginData']['details']['name']
-    airport_iata = airport['airport']['pluginData']['details']['code']['iata']
-    airport_icao = airport['airport']['pluginData']['details']['code']['icao']
-    airport_tz = airport['airport']['pluginData']['details']['timezone']['name']
-    airport_lat = airport['airport']['pluginData']['details']['position']['latitude']
-    airport_lon = airport['airport']['pluginData']['details']['position']['longitude']
-except:
-    sleep(60)
+airport_codes = [airport_code.strip() for airport_code in env.list('AIRPORT_CODE') if airport_code.strip()] # Define airports, separated by comma; each airport has its own filters and history
+http_pool_size = env.int('HTTP_POOL_SIZE', 10) # Number of keep-alive connections reused for FR24 requests
+circuit_breaker_threshold = env.int('CIRCUIT_BREAKER_THRESHOLD', 5) # Consecutive failed requests before FR24 calls fail fast
+circuit_breaker_reset = env.float('CIRCUIT_BREAKER_RESET', 60) # in seconds, how long FR24 calls fail fast once throttled
+response_cache_size = env.int('RESPONSE_CACHE_SIZE', 256) # Number of FR24 responses kept in memory, 0 disables the cache
+
+fr_api = FlightRadar24API(pool_size = http_pool_size, circuit_breaker = CircuitBreaker(circuit_breaker_threshold, circuit_breaker_reset),
+                          cache_size = response_cache_size)
+
+# Local time of the airports, shared by the airports of a time zone
+airport_clocks = dict()
+
+# Dawn and dusk of the airports, computed ahead for a rolling window of days and shared by the airports close to each other
+sun_table_days = env.int('SUN_TABLE_DAYS', 30)
+sun_tables = SunTableRegistry(sun_table_days)
 
 pages = list(range(1,(math.ceil(env.float('ENTRY_OBTAINED')/100)+1))) # defines the number of entries obtained in each run
+arrivals_lookahead = env.float('ARRIVALS_LOOKAHEAD', 6)*60*60 # in hours, the arrivals board is fetched up to this time ahead; 0 always fetches ENTRY_OBTAINED entries
+arrivals_max_pages = env.int('ARRIVALS_MAX_PAGES', 10) # Maximum number of pages fetched in each run with a lookahead
+fetch_workers = env.int('FETCH_WORKERS', 4) # Number of arrival pages fetched at the same time
+shard_processes = env.int('SHARD_PROCESSES', 0) # Number of worker processes the airports are split across, 0 updates them all in this process
+seen_flight_cache_size = env.int('SEEN_FLIGHT_CACHE_SIZE', 2048) # Number of processed arrivals remembered to skip the unchanged ones
+seen_flight_ttl = env.float('SEEN_FLIGHT_TTL', 60)*60 # in minutes, how long an arrival no longer on the board is remembered
+seen_flight_landed_ttl = env.float('SEEN_FLIGHT_LANDED_TTL', 30)*60 # in minutes, the same once it has landed
+rego_details_ttl = env.float('REGO_DETAILS_TTL', 30)*60 # in minutes, how long the photo and next flight of a rego are kept
 
 ## Speical Livery filter setting
 livery_history_time_interval = math.ceil(env.float('SPECIAL_LIVERY_TIME_INTERVAL')) # Define the time interval between the same special livery plane is notified, in hours
@@ -83,6 +120,8 @@ sp_keywords = env.list("SPECIAL_LIVERY_KEYWORDS") # Filter workds to check for s
 rare_plane_history_time_interval = math.ceil(env.float('RARE_PLANE_TIME_INTERVAL')) # in days
 rare_plane_days = env.list("RARE_PLANE_NOTIFICATION_DAYS")
 rare_plane_time = env.str('RARE_PLANE_NOTIFICATION_TIME')
+rare_plane_retention_factor = env.float('RARE_PLANE_RETENTION_FACTOR', 0) # Keys not seen for this many times the time interval (at least once) are removed; 0 keeps them forever
+rare_plane_compaction_interval = math.ceil(env.float('RARE_PLANE_COMPACTION_INTERVAL', 24)*60*60) # in hours
 
 ## Rego watchlist setting
 rego_watchlist_history_time_interval = math.ceil(env.float('REGO_WATCHLIST_TIME_INTERVAL')) # in hours
@@ -102,58 +141,60 @@ rare_plane_history_name = env.str('RARE_PLANE_HISTORY_FILE_NAME')
 rego_watchlist_name = env.str('REGO_WATCHLIST_FILE_NAME')
 type_watchlist_name = env.str('TYPE_WATCHLIST_FILE_NAME')
 notifi_record_name = env.str('NOTIFICATION_RECORD_FILE_NAME')
+state_backend = env.str('STATE_BACKEND', 'csv').lower() # csv or sqlite
+state_database_name = env.str('STATE_DATABASE_FILE_NAME', 'filters')
+photo_id_cache_name = env.str('PHOTO_ID_CACHE_FILE_NAME', 'photo_ids')
+outbox_name = env.str('OUTBOX_FILE_NAME', 'outbox')
 
-# Create filter and define file path
+# Create filter folder, the filters of the first chat at the first airport are in it
 filter_folder_path =  'config/filters/'
 if os.path.exists(filter_folder_path) == False:
     os.mkdir(filter_folder_path)
 
-exclusion_list_path = filter_folder_path + exclusion_list_name + '.csv'
-livery_history_path = filter_folder_path + livery_history_name + '.csv'
-rare_plane_history_path = filter_folder_path + rare_plane_history_name + '.csv'
-rego_watchlist_path = filter_folder_path + rego_watchlist_name + '.csv'
-type_watchlist_path = filter_folder_path + type_watchlist_name + '.csv'
-notifi_record_path = filter_folder_path + notifi_record_name + '.csv'
+# The settings of config.env can be overridden for a chat in a <chat id>.env file
+chat_settings_folder_path = config_folder_path + 'chats/'
+
+# Details of the regos, watched planes are fetched ahead of their arrival
+rego_cache = RegoDetailsCache(fr_api, rego_details_ttl)
+
+# Telegram file_id of the photos already sent
+photo_ids = PhotoIdCache(config_folder_path + photo_id_cache_name + '.json')
+
+# Notifications waiting to be sent, the sender thread is started with the bot
+outbox = NotificationOutbox(config_folder_path + outbox_name + '.db')
+outbox_sender = None
 
 #################################
 ### Utility functions
 #################################
 
 # Check the current flight status, return flight status as a str and current time as int
-def check_flight_status (flight_details):
-    departure_time = None
-    land_time = None
+def check_flight_status (flight_record):
     current_time = int(datetime.now().timestamp())
     
-    if flight_details['time']['real']['departure'] is not None:
-        departure_time = int(flight_details['time']['real']['departure'])
-        
-    if flight_details['time']['real']['arrival'] is not None:
-        land_time = int(flight_details['time']['real']['arrival'])
-    
-    try:
-        if land_time is not None:
-            flight_status = 'Landed'
-        elif departure_time is None:
-            flight_status = 'On Ground'
-        elif departure_time <= current_time:
-            flight_status = 'In Flight'
-    except:
+    if flight_record.real_arrival is not None:
+        flight_status = 'Landed'
+    elif flight_record.real_departure is None:
+        flight_status = 'On Ground'
+    elif int(flight_record.real_departure) <= current_time:
+        flight_status = 'In Flight'
+    else:
         flight_status = 'N/A'
     
     return flight_status,current_time
 
-# Find image link to an aircraft rego
+# Find the details of an aircraft rego, waiting for them if they're not cached yet. It's called by the sender
+# thread when a notification is sent, the updates only prefetch them
 def find_rego_details(registration_number):
     try:
-        rego_details = fr_api.get_rego_details(registration_number)
+        rego_details = rego_cache.get(registration_number)
         return rego_details
     except:
         return None
     
 # Find a given rego's next flight
-def check_next_flight(rego_details, airport_iata, airport_tz):
-    if rego_details['data'] is not None:
+def check_next_flight(rego_details, airport_iata):
+    if rego_details is not None and rego_details['data'] is not None:
         rego_flights = rego_details['data']
     else:
         return None, None, None, None
@@ -162,7 +203,7 @@ def check_next_flight(rego_details, airport_iata, airport_tz):
         if flight['airport']['origin']['code']['iata'] is not None:
             if flight['airport']['origin']['code']['iata'] == airport_iata and flight['time']['real']['departure'] == None:
                 if flight['time']['scheduled']['departure'] is not None:
-                    departure_time = datetime.fromtimestamp(flight['time']['scheduled']['departure']).astimezone(pytz.timezone(airport_tz))
+                    departure_time = flight['time']['scheduled']['departure']
                 else:
                     departure_time = None
                     
@@ -175,102 +216,95 @@ def check_next_flight(rego_details, airport_iata, airport_tz):
             
     return departure_time, departure_airport_name, departure_airport_iata, departure_airport_icao
 
-def check_flight_arrival_time (flight_details, airport_tz, airport_lat, airport_lon):
-    region, city = airport_tz.split('/')
-    airport_location = LocationInfo(city, region, airport_tz, airport_lat, airport_lon)
-    
-    if flight_details['time']['estimated']['arrival'] is not None:
-        arrival_time = flight_details['time']['estimated']['arrival']
-    elif flight_details['time']['scheduled']['arrival'] is not None:
-        arrival_time = flight_details['time']['scheduled']['arrival']
+def check_flight_arrival_time (flight_record, sun_table):
+    arrival_time = flight_record.get_arrival_time()
+    if arrival_time is None:
+        return 'N/A'
     
-    pytz_timezone = pytz.timezone(airport_tz)
-    arrival_date_time = datetime.fromtimestamp(arrival_time, pytz_timezone)
-    arrival_date = arrival_date_time.date()
+    daylight = sun_table.is_daylight(arrival_time)
     
-    sun_info = sun(airport_location.observer, date = arrival_date, tzinfo = airport_location.timezone)
-    dawn_time = int(sun_info['dawn'].timestamp())
-    dusk_time = int(sun_info['dusk'].timestamp())
-    
-    try:
-        if arrival_time > dawn_time and dusk_time > arrival_time:
-            arrival_period = 'Daylight Arrival'
-        else:
-            arrival_period = 'Night-time Arrival'
-    except:
+    if daylight is None:
         arrival_period = 'N/A'
+    elif daylight:
+        arrival_period = 'Daylight Arrival'
+    else:
+        arrival_period = 'Night-time Arrival'
     
     return arrival_period
 
-# Format push notification content
-def format_flight_details(flight_details, registration_number ,notif_type, rego_details, airport_iata, airport_icao):
+# Notification types, in the order of priority
+notification_types = ['Special Livery', 'Rare Plane/Airline', 'Watchlist Registration', 'Watchlist Aircraft Type', 'Status Change']
 
-    try:
+# Format push notification content, the next flight of the rego is added when the notification is sent
+def format_flight_details(flight_record, notif_type, airport):
+
+    if len(airport_codes) > 1:
+        formatted_info = f"<b>{notif_type} at {airport.details.iata}</b>\n"
+    else:
         formatted_info = f"<b>{notif_type}</b>\n"
-    except (KeyError, TypeError):
-        formatted_info = "<b>Flight Details:</b>\n"
     
-    try:
-        formatted_info += f"  Flight number: {flight_details['identification']['number']['default']}\n"
-    except (KeyError, TypeError):
+    if flight_record.flight_number is not None:
+        formatted_info += f"  Flight number: {flight_record.flight_number}\n"
+    else:
         formatted_info += "  Flight number: N/A\n"
     
-    try:
-        formatted_info += f"  Dep. Airport: {flight_details['airport']['origin']['name']} ({flight_details['airport']['origin']['code']['iata']}/{flight_details['airport']['origin']['code']['icao']})\n"
-    except:
+    if flight_record.origin_name is not None:
+        formatted_info += f"  Dep. Airport: {flight_record.origin_name} ({flight_record.origin_iata}/{flight_record.origin_icao})\n"
+    else:
         formatted_info += f"  Dep. Airport: N/A\n"
     
-    try:
-        flight_status, current_time = check_flight_status(flight_details)
-        formatted_info += (f'  Status: {flight_status}\n')
-    except (TypeError):
-        formatted_info += f"  Status: N/A\n"
+    flight_status, current_time = check_flight_status(flight_record)
+    formatted_info += (f'  Status: {flight_status}\n')
         
-    try:
-        formatted_info += f"  Aircraft Model: {flight_details['aircraft']['model']['text']} ({flight_details['aircraft']['model']['code']})\n"
-    except (KeyError, TypeError):
+    if flight_record.type_code is not None:
+        formatted_info += f"  Aircraft Model: {flight_record.type_name} ({flight_record.type_code})\n"
+    else:
         formatted_info += "  Aircraft Model: N/A\n"
         
-    try:
-        formatted_info += f"  Registration: {flight_details['aircraft']['registration']}\n"
-    except (KeyError, TypeError):
+    if flight_record.registration is not None:
+        formatted_info += f"  Registration: {flight_record.registration}\n"
+    else:
         formatted_info += "  Registration: N/A\n"
 
-    try:
-        formatted_info += f"  Airline: {flight_details['airline']['name']} " \
-                          f"({flight_details['airline']['code']['iata']}" \
-                          f"/{flight_details['airline']['code']['icao']})\n\n"
-    except (KeyError, TypeError):
+    if flight_record.airline_name is not None:
+        formatted_info += f"  Airline: {flight_record.airline_name} " \
+                          f"({flight_record.airline_iata}" \
+                          f"/{flight_record.airline_icao})\n\n"
+    else:
         formatted_info += "  Airline: N/A\n\n"
 
     formatted_info += "<b>Arrival Details:</b>\n"
     
     try:
-        arrival_period = check_flight_arrival_time(flight_details, airport_tz, airport_lat, airport_lon)
+        arrival_period = check_flight_arrival_time(flight_record, airport.sun_table)
         formatted_info += f"  Arrival Period: {arrival_period}\n"
     except:
         formatted_info += f"  Arrival Period: N/A\n"
     
     try:
-        scheduled_arrival = datetime.fromtimestamp(flight_details['time']['scheduled']['arrival']).astimezone(pytz.timezone(airport_tz))
-        formatted_info += f"  Scheduled Arrival: {scheduled_arrival.strftime('%a %H:%M')} (Local)\n"
+        formatted_info += f"  Scheduled Arrival: {airport.clock.format_local_time(flight_record.scheduled_arrival)} (Local)\n"
     except (KeyError, TypeError, OSError):
         formatted_info += "  Scheduled Arrival: N/A\n"
 
     try:
-        estimated_arrival = datetime.fromtimestamp(flight_details['time']['estimated']['arrival']).astimezone(pytz.timezone(airport_tz))
-        formatted_info += f"  Estimated Arrival: {estimated_arrival.strftime('%a %H:%M')} (Local)\n"
+        formatted_info += f"  Estimated Arrival: {airport.clock.format_local_time(flight_record.estimated_arrival)} (Local)\n"
     except (KeyError, TypeError, OSError):
         formatted_info += "  Estimated Arrival: N/A\n"
 
-    departure_time, departure_airport_name, departure_airport_iata, departure_airport_icao = check_next_flight(rego_details, airport_iata, airport_tz)
+    return formatted_info
+
+# Format the next flight of a rego, empty if it's not known
+def format_next_flight(rego_details, airport_iata, airport_clock):
+    departure_time, departure_airport_name, departure_airport_iata, departure_airport_icao = check_next_flight(rego_details, airport_iata)
+    
+    formatted_info = ''
     
     if departure_time is not None:
         
         formatted_info += "\n<b>Next Flight Details:</b>\n"
         
         try:
-            formatted_info += f"  Est. Departure: {departure_time.strftime('%a %H:%M')} (Local)\n"
+            formatted_info += f"  Est. Departure: {airport_clock.format_local_time(departure_time)} (Local)\n"
         except (KeyError, TypeError, OSError):
             formatted_info += "  Est. Departure: N/A\n"
         
@@ -279,17 +313,69 @@ def format_flight_details(flight_details, registration_number ,notif_type, rego_
         except (KeyError, TypeError, IndexError):
             formatted_info += "  Dest. Airport: N/A\n"
 
-    try:
-        if flight_details['identification']['id'] is None:
-            link_section = 'data/flights/' + flight_details['identification']['number']['default']
-        else:
-            link_section = flight_details['identification']['id']
-        formatted_info += f"\nhttps://www.flightradar24.com/{link_section}\n\n"
-    except (KeyError, TypeError, IndexError):
-        pass
-
     return formatted_info
 
+# Format the link to a flight on Flightradar24, empty if it has no id or number
+def format_flight_link(flight_record):
+    if flight_record.flight_id is not None:
+        return f"\nhttps://www.flightradar24.com/{flight_record.flight_id}\n\n"
+    elif flight_record.flight_number is not None:
+        return f"\nhttps://www.flightradar24.com/data/flights/{flight_record.flight_number}\n\n"
+    
+    return ''
+
+# Sort the matches of an update by notification type, then by arrival time
+def sort_digest_matches(matches):
+    def sort_key(match):
+        notif_type, flight_record = match
+        arrival_time = flight_record.get_arrival_time()
+        return notification_types.index(notif_type), arrival_time is None, arrival_time or 0
+    
+    return sorted(matches, key = sort_key)
+
+# Format the matches of an update as digest messages, grouped by notification type and sorted by arrival time
+def format_digest(matches, airport):
+    entries = list()
+    sorted_matches = sort_digest_matches(matches)
+    
+    for notif_type in notification_types:
+        type_matches = [flight_record for match_type, flight_record in sorted_matches if match_type == notif_type]
+        if len(type_matches) == 0:
+            continue
+        
+        entries.append(f"\n<b>{notif_type} ({len(type_matches)})</b>\n")
+        
+        for flight_record in type_matches:
+            flight_number = html.escape(flight_record.flight_number or 'N/A')
+            if flight_record.flight_id is not None:
+                flight_number = f'<a href="https://www.flightradar24.com/{flight_record.flight_id}">{flight_number}</a>'
+            
+            entry = f"  {flight_number} {html.escape(flight_record.registration or 'N/A')} ({html.escape(flight_record.type_code or 'N/A')})"
+            entry += f" {html.escape(flight_record.airline_name or 'N/A')}\n"
+            entry += f"    From: {html.escape(flight_record.origin_iata or 'N/A')}, {check_flight_status(flight_record)[0]}\n"
+            
+            try:
+                arrival = airport.clock.format_local_time(flight_record.get_arrival_time())
+            except (KeyError, TypeError, OSError):
+                arrival = 'N/A'
+            
+            try:
+                arrival_period = check_flight_arrival_time(flight_record, airport.sun_table)
+            except:
+                arrival_period = 'N/A'
+            
+            entry += f"    Arrival: {arrival} (Local), {arrival_period}\n"
+            entries.append(entry)
+    
+    # Split the digest in several messages if it's too long for one
+    digest_messages = [f"<b>Arrivals at {airport.details.iata}: {len(matches)} planes</b>\n"]
+    for entry in entries:
+        if len(digest_messages[-1]) + len(entry) > digest_max_length:
+            digest_messages.append('')
+        digest_messages[-1] += entry
+    
+    return digest_messages
+
 # Convert a dataframe to text to be displayed by telegram
 def convert_df_text(selected_filter, pass_filter, show_index):
     num_of_entries = len(pass_filter)
@@ -314,455 +400,826 @@ def convert_df_text(selected_filter, pass_filter, show_index):
 
 
 # Record the pushed notification
-def record_notification (flight_details, registration_number, notifi_record_path):
-    flight_status, current_time = check_flight_status(flight_details)
+def record_notification (flight_record, state_store):
+    flight_status, current_time = check_flight_status(flight_record)
     
     if flight_status == 'On Ground':
-        if os.path.isfile(notifi_record_path) == False:
-            flight_entry = {'Registration':registration_number,'Flight Status':flight_status,'Time':current_time}
-            df_notifi_record = pd.DataFrame(data = flight_entry,index = [0])
-            df_notifi_record.to_csv(notifi_record_path,index = False)
-            
-        else:
-            df_notifi_record = pd.read_csv(notifi_record_path,header = 0)
-            
-            
-            if (registration_number in df_notifi_record['Registration'].values) == True:
-                    
-                    rego_location = df_notifi_record.index[df_notifi_record['Registration'] == registration_number].tolist()
-                    
-                    if len(rego_location) != 0:
-                        df_notifi_record.loc[rego_location[0],'Time'] = current_time
-                        df_notifi_record.to_csv(notifi_record_path,index = False)
-            else:
-                flight_entry = {'Registration':registration_number,'Flight Status':flight_status,'Time':current_time}
-                df_notifi_record_new_entry = pd.DataFrame(data = flight_entry,index = [0])
-                df_notifi_record = pd.concat([df_notifi_record,df_notifi_record_new_entry], ignore_index = True)
-                df_notifi_record.to_csv(notifi_record_path,index = False)
+        state_store.set_notification_record(flight_record.registration, flight_status, current_time)
 
-# Build a rare plane history database wtih a fresh installation
-def build_rare_plane_history (airport_code, rare_plane_history_path):
-    current_page = 1
-    total_page = 1
+# Log an arrival page that could not be fetched, the rest of the pages are still processed
+def log_page_error(page, error):
+    if isinstance(error, CircuitOpenError):
+        logger.warning('Skipped page %s: %s', page, error)
+    else:
+        logger.error('Error when fetching page %s: %s', page, error)
+
+# Build the rare plane history from the arrivals history of the airport. With a fresh installation
+# the whole history is read, otherwise only the arrivals since the latest recorded time are added
+def build_rare_plane_history (airport_code, state_stores):
+    # The history is read once for all the chats, from the oldest of their latest recorded times
+    watermarks = [state_store.get_rare_plane_watermark() for state_store in state_stores]
+    since = None if None in watermarks else min(watermarks)
     
     try:
-        while current_page <= total_page:
-            airport = fr_api.get_airport_details(code = airport_code, page = -current_page)
-            total_page = airport['airport']['pluginData']['schedule']['arrivals']['page']['total']
-            current_page += 1
-            
-            airport_arrival_history = airport['airport']['pluginData']['schedule']['arrivals']['data']
-            
-            for arrived_flight in airport_arrival_history:
-                if arrived_flight['flight']['owner'] is not None:
-                    airline_name = arrived_flight['flight']['owner']['code']['icao']
-                else:
-                    continue
+        read_time = int(datetime.now().timestamp())
+        rare_plane_times = collect_rare_plane_times(fr_api, airport_code, since,
+                                                    max_workers = fetch_workers, on_page_error = log_page_error)
+        for state_store, watermark in zip(state_stores, watermarks):
+            state_store.merge_rare_plane_times(rare_plane_times.times)
+            # A new history keeps how far back it was read, 0 once it was read to its end
+            if watermark is None and (rare_plane_times.complete or rare_plane_times.oldest is not None):
+                state_store.set_rare_plane_low_watermark(0 if rare_plane_times.complete else rare_plane_times.oldest)
+            # The latest time has moved past the arrivals not read yet, they're kept as a gap read by the next runs
+            elif watermark is not None and not rare_plane_times.complete:
+                gap_until = rare_plane_times.oldest if rare_plane_times.oldest is not None else read_time
+                if gap_until > watermark:
+                    add_rare_plane_gap(state_store, (watermark, gap_until))
         
-                if arrived_flight['flight']['aircraft'] is not None:
-                    aircraft_type = arrived_flight['flight']['aircraft']['model']['code']
-                    flight_details = arrived_flight['flight']
-                else:
+        # Read the gaps left by the readings that stopped, as one span for all the chats
+        gaps = [state_store.get_rare_plane_gap() for state_store in state_stores]
+        if any(gaps):
+            gap_times = collect_rare_plane_times(fr_api, airport_code, min(gap[0] for gap in gaps if gap), max(gap[1] for gap in gaps if gap),
+                                                 max_workers = fetch_workers, on_page_error = log_page_error)
+            logger.info('Rare plane history of %s read back to %s to fill a gap, complete: %s', airport_code, gap_times.oldest, gap_times.complete)
+            for state_store, gap in zip(state_stores, gaps):
+                if not gap:
                     continue
-                
-                if arrived_flight['flight']['time']['real']['arrival'] is not None:
-                    arrived_time = arrived_flight['flight']['time']['real']['arrival']
-                else:
+                state_store.merge_rare_plane_times(gap_times.times)
+                if gap_times.complete or (gap_times.oldest is not None and gap_times.oldest <= gap[0]):
+                    state_store.set_rare_plane_gap(None)
+                elif gap_times.oldest is not None:
+                    state_store.set_rare_plane_gap((gap[0], min(gap[1], gap_times.oldest)))
+        
+        # Resume reading the older arrivals where an earlier reading stopped, e.g. when the circuit breaker opened.
+        # The histories built before the low watermark was kept are taken as complete
+        low_watermarks = [state_store.get_rare_plane_low_watermark() for state_store in state_stores]
+        until = max([low_watermark for low_watermark in low_watermarks if low_watermark], default=None)
+        
+        if until is not None:
+            older_times = collect_rare_plane_times(fr_api, airport_code, until = until,
+                                                   max_workers = fetch_workers, on_page_error = log_page_error)
+            logger.info('Rare plane history of %s read back to %s, complete: %s', airport_code, older_times.oldest, older_times.complete)
+            for state_store, low_watermark in zip(state_stores, low_watermarks):
+                if not low_watermark:
                     continue
-                
-                if os.path.isfile(rare_plane_history_path) == False:
-                    current_flight_data = {'Airline':airline_name,'Aircraft Type':aircraft_type,'Time':arrived_time}
-                    df_rare_plane_history = pd.DataFrame(data = current_flight_data,index = [0])
-                    df_rare_plane_history.to_csv(rare_plane_history_path,index = False)
-            
-                else:
-                    df_rare_plane_history = pd.read_csv(rare_plane_history_path)
-                    
-                    df_rare_airline = df_rare_plane_history.loc[df_rare_plane_history['Airline'] == airline_name]
-                
-                    if len(df_rare_airline) == 0:
-                        current_flight_data = {'Airline':airline_name,'Aircraft Type':aircraft_type,'Time':arrived_time}
-                        df_new_flight = pd.DataFrame(data = current_flight_data,index = [0])
-                        df_rare_plane_history = pd.concat([df_rare_plane_history,df_new_flight], ignore_index = True)
-                        df_rare_plane_history.to_csv(rare_plane_history_path,index = False)
-                    else:
-                        df_rare_airline_aircraft = df_rare_airline.loc[df_rare_airline['Aircraft Type'] == aircraft_type]   
-                        
-                        if len(df_rare_airline_aircraft) == 0:
-                            current_flight_data = {'Airline':airline_name,'Aircraft Type':aircraft_type,'Time':arrived_time}
-                            df_new_flight = pd.DataFrame(data = current_flight_data,index = [0])
-                            df_rare_plane_history = pd.concat([df_rare_plane_history,df_new_flight], ignore_index = True)
-                            df_rare_plane_history.to_csv(rare_plane_history_path,index = False)
-    except Exception as e:
-        sleep(60)
-
-if os.path.isfile(rare_plane_history_path) == False:
-    build_rare_plane_history (airport_code, rare_plane_history_path)
+                state_store.merge_rare_plane_times(older_times.times)
+                if older_times.complete:
+                    state_store.set_rare_plane_low_watermark(0)
+                elif older_times.oldest is not None:
+                    state_store.set_rare_plane_low_watermark(min(low_watermark, older_times.oldest))
+    except Exception:
+        logger.exception('Error when building rare plane history!')
+    
+    for state_store in state_stores:
+        state_store.flush()
+
+# Add a gap to read to the rare plane history, joined with the one it already has
+def add_rare_plane_gap (state_store, gap):
+    previous_gap = state_store.get_rare_plane_gap()
+    if previous_gap is not None:
+        gap = (min(gap[0], previous_gap[0]), max(gap[1], previous_gap[1]))
+    
+    state_store.set_rare_plane_gap(gap)
+
+# Load the filters of an airport, changes are written back at the end of each update
+def load_state_store (airport_filter_folder_path):
+    if os.path.exists(airport_filter_folder_path) == False:
+        os.makedirs(airport_filter_folder_path)
+    
+    filter_paths = {'exclusion_list':airport_filter_folder_path + exclusion_list_name + '.csv',
+                    'special_livery_history':airport_filter_folder_path + livery_history_name + '.csv',
+                    'rare_plane_history':airport_filter_folder_path + rare_plane_history_name + '.csv',
+                    'rego_watchlist':airport_filter_folder_path + rego_watchlist_name + '.csv',
+                    'type_watchlist':airport_filter_folder_path + type_watchlist_name + '.csv',
+                    'notifi_record':airport_filter_folder_path + notifi_record_name + '.csv'}
+    
+    if state_backend == 'sqlite':
+        # The CSV files are imported once, when the database is created
+        state_database_path = airport_filter_folder_path + state_database_name + '.db'
+        import_filters = os.path.isfile(state_database_path) == False
+        state_store = SqliteStateStore(state_database_path)
+        if import_filters:
+            state_store.import_csv(filter_paths)
+    else:
+        state_store = FilterStateStore(filter_paths)
+    
+    return state_store
+
+# Settings of a filter, the ones given by a chat override the ones of config.env
+def load_filter_settings (chat_env, prefix, time_interval, days, notification_time):
+    if chat_env.get(prefix + '_TIME_INTERVAL'):
+        time_interval = math.ceil(float(chat_env[prefix + '_TIME_INTERVAL']))
+    if prefix + '_NOTIFICATION_DAYS' in chat_env:
+        days = (chat_env[prefix + '_NOTIFICATION_DAYS'] or '').split(',')
+    if chat_env.get(prefix + '_NOTIFICATION_TIME'):
+        notification_time = chat_env[prefix + '_NOTIFICATION_TIME']
+    
+    return FilterSettings(time_interval, get_weekday_mask(days), notification_time)
+
+# Load the settings and the filters of a chat at an airport
+def load_subscription (chat_id, airport_code):
+    chat_env = dict()
+    chat_env_path = chat_settings_folder_path + chat_id + '.env'
+    if os.path.isfile(chat_env_path):
+        chat_env = dotenv_values(chat_env_path)
+    
+    return Subscription(chat_id,
+                        load_filter_settings(chat_env, 'SPECIAL_LIVERY', livery_history_time_interval, livery_days, livery_time),
+                        load_filter_settings(chat_env, 'RARE_PLANE', rare_plane_history_time_interval, rare_plane_days, rare_plane_time),
+                        load_filter_settings(chat_env, 'REGO_WATCHLIST', rego_watchlist_history_time_interval, rego_watchlist_days, rego_watchlist_time),
+                        load_filter_settings(chat_env, 'TYPE_WATCHLIST', type_watchlist_history_time_interval, type_watchlist_days, type_watchlist_time),
+                        load_state_store(get_filter_folder_path(chat_id, airport_code)),
+                        # Arrivals already processed, only the new or changed ones go through the filters
+                        SeenFlightCache(seen_flight_cache_size, seen_flight_ttl, seen_flight_landed_ttl))
+
+# Local time of a time zone, shared by its airports and by the notifications sent for them
+def get_airport_clock (timezone):
+    if timezone not in airport_clocks:
+        airport_clocks[timezone] = AirportClock(timezone)
+    
+    return airport_clocks[timezone]
+
+# Find the location of an airport and load the filters and history of the chats
+def load_airport (airport_code):
+    # The request is already retried with a backoff, an error is raised right away
+    airport_details = AirportDetails.from_airport(airport_code, fr_api.get_airport_details(code = airport_code))
+    
+    airport_clock = get_airport_clock(airport_details.timezone)
+    
+    subscriptions = [load_subscription(chat_id, airport_code) for chat_id in chat_ids]
+    build_rare_plane_history(airport_code, [subscription.state_store for subscription in subscriptions])
+    
+    # Choose when the next update runs
+    poll_scheduler = PollScheduler(notification_delay, polling_min_delay, max(polling_min_delay, polling_max_delay), airport_clock,
+                                   night_hours = polling_night_hours, watch_window = polling_watch_window)
+    
+    # Fetch the arrivals board up to the lookahead window, with as few pages as needed
+    arrivals_pager = None
+    if arrivals_lookahead > 0:
+        arrivals_pager = ArrivalsPager(fr_api, airport_code, arrivals_lookahead, max_pages = arrivals_max_pages,
+                                       max_workers = fetch_workers, on_page_error = log_page_error)
+    
+    return AirportMonitor(airport_details, airport_clock, sun_tables.get(airport_details.latitude, airport_details.longitude, airport_details.timezone),
+                          subscriptions, arrivals_pager, poll_scheduler)
+
+# Folder of the filters of a chat at an airport. The other chats have a folder in chats/ named after their id,
+# and the other airports a folder named after their code
+def get_filter_folder_path (chat_id, airport_code):
+    folder_path = filter_folder_path
+    if chat_id != chat_ids[0]:
+        folder_path += 'chats/' + chat_id + '/'
+    if airport_code != airport_codes[0]:
+        folder_path += airport_code + '/'
+    
+    return folder_path
+
+# Airports updated by this process, with worker processes they're loaded by the workers instead
+if shard_processes > 0:
+    monitored_airports = list()
+else:
+    monitored_airports = [load_airport(airport_code) for airport_code in airport_codes]
+
+# Dispatcher of the bot, running the updates of the airports in its worker threads, set when the bot is started
+dispatcher = None
+
+# Worker processes updating the airports and the last metrics they sent, the pool is started with the bot
+shard_pool = None
+shard_stats = dict()
 
 #################################
 ### Filter functions
 #################################
 
-# Function to check if a plane has been manually added to the exclusion list
-def check_exclusion_list(exclusion_list_path,registration_number):
-    if os.path.isfile(exclusion_list_path) == False:
-        exclusion_list = {'Airline':'','Registration':'','Description':''}
-        df_exclusion_list = pd.DataFrame(data = exclusion_list,index = [0])
-        df_exclusion_list.to_csv(exclusion_list_path,index = False)
-        return None
-    else:
-        df_exclusion_list = pd.read_csv(exclusion_list_path,header = 0)
-        return registration_number in df_exclusion_list['Registration'].values
-
 # Check if a plane has speical livery and notify the user if it's not in the exclusion list and has not been notified in the past x hours
-def check_speical_livery(livery_history_path, sp_keywords, arriving_flight, livery_history_time_interval, livery_days, livery_time, exclusion_list_path):
-    if arriving_flight['flight']['airline'] is not None:
-        airline_name = arriving_flight['flight']['airline']['name']
+def check_speical_livery(airport, state_store, sp_keywords, arriving_flight, livery_history_time_interval, livery_weekdays, livery_time):
+    if arriving_flight.airline_name is not None:
+        airline_name = arriving_flight.airline_name
     else:
         return None
     
-    if arriving_flight['flight']['aircraft'] is not None:
-        registration_number = arriving_flight['flight']['aircraft']['registration'] 
-        flight_details = arriving_flight['flight']
+    if arriving_flight.registration is not None:
+        registration_number = arriving_flight.registration
     else:
         return None
     
-    if len(livery_days) != 0:
-        if arriving_flight['flight']['time'] is not None:
-            arrival_day = datetime.fromtimestamp(arriving_flight['flight']['time']['scheduled']['arrival']).astimezone(pytz.timezone(airport_tz)).strftime('%a')
-            if arrival_day not in livery_days: 
+    if livery_weekdays is not None:
+        if arriving_flight.scheduled_arrival is not None:
+            if airport.clock.is_on_weekdays(arriving_flight.scheduled_arrival, livery_weekdays) == False:
                 return None
             
     if livery_time == 'Off':
         return None
     elif livery_time == 'Daylight':
-        arrival_period = check_flight_arrival_time(arriving_flight['flight'], airport_tz, airport_lat, airport_lon)
+        arrival_period = check_flight_arrival_time(arriving_flight, airport.sun_table)
         if arrival_period != 'Daylight Arrival':
             return None
 
     if any(key in airline_name for key in sp_keywords):
-        if check_exclusion_list(exclusion_list_path, registration_number) == False:
-            if os.path.isfile(livery_history_path) == False:
-                current_flight_data = {'Registration':registration_number,'Time':int(datetime.now().timestamp())}
-                df_livery_history = pd.DataFrame(data = current_flight_data,index = [0])
-                df_livery_history.to_csv(livery_history_path,index = False)
-                return [flight_details, registration_number]
+        if state_store.is_excluded(registration_number, arriving_flight.owner_icao) == False:
+            current_time = int(datetime.now().timestamp())
+            last_seen_time = state_store.get_livery_time(registration_number)
+            state_store.set_livery_time(registration_number, current_time)
+            
+            if last_seen_time is None:
+                return arriving_flight
+            
+            calculated_time_interval = (current_time - int(last_seen_time))/(60*60)
+            
+            if calculated_time_interval > livery_history_time_interval:
+                return arriving_flight
             else:
-                df_livery_history = pd.read_csv(livery_history_path)
-                
-                rego_location = df_livery_history.index[df_livery_history['Registration'] == registration_number].tolist()
-                
-                if len(rego_location) != 0:
-                    calculated_time_interval = (int(datetime.now().timestamp()) - int(df_livery_history.loc[rego_location[0],'Time']))/(60*60)
-                    
-                    if calculated_time_interval > livery_history_time_interval:
-                        df_livery_history.loc[rego_location[0],'Time'] = int(datetime.now().timestamp())
-                        df_livery_history.to_csv(livery_history_path,index = False)
-                        return [flight_details, registration_number]
-                    else:
-                        df_livery_history.loc[rego_location[0],'Time'] = int(datetime.now().timestamp())
-                        df_livery_history.to_csv(livery_history_path,index = False)
-                        return None
-                else:
-                    df_new_flight = pd.DataFrame({'Registration':registration_number,'Time':int(datetime.now().timestamp())},index = [0])
-                    df_livery_history = pd.concat([df_livery_history,df_new_flight], ignore_index = True)
-                    df_livery_history.to_csv(livery_history_path,index = False)
-                    return [flight_details, registration_number]
+                return None
         else:
             return None
     else:
         return None
 
 # Check if an aircraft type or airline has been in the airport in the past x days
-def check_rare_plane (rare_plane_history_path, arriving_flight, rare_plane_history_time_interval, rare_plane_days, rare_plane_time, exclusion_list_path):
-    if arriving_flight['flight']['owner'] is not None:
-        airline_name = arriving_flight['flight']['owner']['code']['icao']
+def check_rare_plane (airport, state_store, arriving_flight, rare_plane_history_time_interval, rare_plane_weekdays, rare_plane_time):
+    if arriving_flight.owner_icao is not None:
+        airline_name = arriving_flight.owner_icao
     else:
         return None
     
-    if arriving_flight['flight']['aircraft'] is not None:
-        aircraft_type = arriving_flight['flight']['aircraft']['model']['code']
-        registration_number = arriving_flight['flight']['aircraft']['registration'] 
-        flight_details = arriving_flight['flight']
+    if arriving_flight.registration is not None:
+        aircraft_type = arriving_flight.type_code
+        registration_number = arriving_flight.registration
     else:
         return None
     
-    if len(rare_plane_days) != 0:
-        if arriving_flight['flight']['time'] is not None:
-            arrival_day = datetime.fromtimestamp(arriving_flight['flight']['time']['scheduled']['arrival']).astimezone(pytz.timezone(airport_tz)).strftime('%a')
-            if arrival_day not in rare_plane_days: 
+    if rare_plane_weekdays is not None:
+        if arriving_flight.scheduled_arrival is not None:
+            if airport.clock.is_on_weekdays(arriving_flight.scheduled_arrival, rare_plane_weekdays) == False:
                 return None
     
     if rare_plane_time == 'Off':
         return None
     elif rare_plane_time == 'Daylight':
-        arrival_period = check_flight_arrival_time(arriving_flight['flight'], airport_tz, airport_lat, airport_lon)
+        arrival_period = check_flight_arrival_time(arriving_flight, airport.sun_table)
         if arrival_period != 'Daylight Arrival':
             return None
 
-    if check_exclusion_list(exclusion_list_path, registration_number) == False:  
-        if os.path.isfile(rare_plane_history_path) == False:
-            current_flight_data = {'Airline':airline_name,'Aircraft Type':aircraft_type,'Time':int(datetime.now().timestamp())}
-            df_rare_plane_history = pd.DataFrame(data = current_flight_data,index = [0])
-            df_rare_plane_history.to_csv(rare_plane_history_path,index = False)
-            return [flight_details, registration_number]
+    if state_store.is_excluded(registration_number, arriving_flight.owner_icao) == False:  
+        current_time = int(datetime.now().timestamp())
+        last_seen_time = state_store.get_rare_plane_time(airline_name, aircraft_type)
+        state_store.set_rare_plane_time(airline_name, aircraft_type, current_time)
+        
+        if last_seen_time is None:
+            return arriving_flight
+        
+        calculated_time_interval =  (current_time - int(last_seen_time))/(60*60*24)
+        
+        if calculated_time_interval > rare_plane_history_time_interval:
+            return arriving_flight
         else:
-            df_rare_plane_history = pd.read_csv(rare_plane_history_path)
-            
-            df_rare_airline = df_rare_plane_history.loc[df_rare_plane_history['Airline'] == airline_name]
-            
-            if len(df_rare_airline) == 0:
-                current_flight_data = {'Airline':airline_name,'Aircraft Type':aircraft_type,'Time':int(datetime.now().timestamp())}
-                df_new_flight = pd.DataFrame(data = current_flight_data,index = [0])
-                df_rare_plane_history = pd.concat([df_rare_plane_history,df_new_flight], ignore_index = True)
-                df_rare_plane_history.to_csv(rare_plane_history_path,index = False)
-                return [flight_details, registration_number]
-            else:
-                df_rare_airline_aircraft = df_rare_airline.loc[df_rare_airline['Aircraft Type'] == aircraft_type]   
-                
-                if len(df_rare_airline_aircraft) == 0:
-                    current_flight_data = {'Airline':airline_name,'Aircraft Type':aircraft_type,'Time':int(datetime.now().timestamp())}
-                    df_new_flight = pd.DataFrame(data = current_flight_data,index = [0])
-                    df_rare_plane_history = pd.concat([df_rare_plane_history,df_new_flight], ignore_index = True)
-                    df_rare_plane_history.to_csv(rare_plane_history_path,index = False)
-                    return [flight_details, registration_number]
-                else:
-                    calculated_time_interval =  (int(datetime.now().timestamp()) - int(df_rare_airline_aircraft['Time'].max()))/(60*60*24)
-                    
-                    if calculated_time_interval > rare_plane_history_time_interval:
-                        df_rare_plane_history.loc[(df_rare_plane_history['Airline'] == airline_name) & (df_rare_plane_history['Aircraft Type'] == aircraft_type) 
-                                                  & (df_rare_plane_history['Time'] == int(df_rare_airline_aircraft['Time'].max())),['Time']]= int(datetime.now().timestamp())
-                        df_rare_plane_history.to_csv(rare_plane_history_path,index = False)
-                        return [flight_details, registration_number]
-                    else:
-                        df_rare_plane_history.loc[(df_rare_plane_history['Airline'] == airline_name) & (df_rare_plane_history['Aircraft Type'] == aircraft_type) 
-                                                  & (df_rare_plane_history['Time'] == int(df_rare_airline_aircraft['Time'].max())),['Time']]= int(datetime.now().timestamp())
-                        df_rare_plane_history.to_csv(rare_plane_history_path,index = False)
-                        return None
+            return None
     else:
         return None
 
 # Check if a rego is in the watchlist                    
-def check_rego_watchlist(rego_watchlist_path, arriving_flight, rego_watchlist_history_time_interval, rego_watchlist_days, rego_watchlist_time, exclusion_list_path):
-    if arriving_flight['flight']['aircraft'] is not None:
-        registration_number = arriving_flight['flight']['aircraft']['registration']
-        flight_details = arriving_flight['flight']
+def check_rego_watchlist(airport, state_store, arriving_flight, rego_watchlist_history_time_interval, rego_watchlist_weekdays, rego_watchlist_time):
+    if arriving_flight.registration is not None:
+        registration_number = arriving_flight.registration
     else:
         return None
     
-    if len(rego_watchlist_days) != 0:
-        if arriving_flight['flight']['time'] is not None:
-            arrival_day = datetime.fromtimestamp(arriving_flight['flight']['time']['scheduled']['arrival']).astimezone(pytz.timezone(airport_tz)).strftime('%a')
-            if arrival_day not in rego_watchlist_days: 
+    if rego_watchlist_weekdays is not None:
+        if arriving_flight.scheduled_arrival is not None:
+            if airport.clock.is_on_weekdays(arriving_flight.scheduled_arrival, rego_watchlist_weekdays) == False:
                 return None
     
     if rego_watchlist_time == 'Off':
         return None
     elif rego_watchlist_time == 'Daylight':
-        arrival_period = check_flight_arrival_time(arriving_flight['flight'], airport_tz, airport_lat, airport_lon)
+        arrival_period = check_flight_arrival_time(arriving_flight, airport.sun_table)
         if arrival_period != 'Daylight Arrival':
             return None
     
-    if check_exclusion_list(exclusion_list_path, registration_number) == False:
-        if os.path.isfile(rego_watchlist_path) == False:
-            rego_watchlist = {'Airline':'','Registration':'','Description':'','Time':''}
-            df_rego_watchlist = pd.DataFrame(data = rego_watchlist,index = [0])
-            df_rego_watchlist.to_csv(rego_watchlist_path,index = False)
+    if state_store.is_excluded(registration_number, arriving_flight.owner_icao) == False:
+        watchlist_entry = state_store.get_rego_watchlist_entry(registration_number)
+        
+        if watchlist_entry is None:
             return None
         
+        current_time = int(datetime.now().timestamp())
+        state_store.set_rego_watchlist_time(registration_number, current_time)
+        
+        if is_missing(watchlist_entry['Time']):
+            return arriving_flight
+        
+        calculated_time_interval = (current_time - int(watchlist_entry['Time']))/(60*60)
+        
+        if calculated_time_interval > rego_watchlist_history_time_interval:
+            return arriving_flight
         else:
-            df_rego_watchlist = pd.read_csv(rego_watchlist_path,header = 0)
-            
-            if (registration_number in df_rego_watchlist['Registration'].values) == True:
-                
-                rego_location = df_rego_watchlist.index[df_rego_watchlist['Registration'] == registration_number].tolist()
-                
-                if len(rego_location) != 0:
-                    if (math.isnan(df_rego_watchlist.loc[rego_location[0],'Time'])) == True:
-                        df_rego_watchlist.loc[rego_location[0],'Time'] = int(datetime.now().timestamp())
-                        df_rego_watchlist.to_csv(rego_watchlist_path,index = False)
-                        return[flight_details, registration_number]
-                    else:
-                        calculated_time_interval = (int(datetime.now().timestamp()) - int(df_rego_watchlist.loc[rego_location[0],'Time']))/(60*60)
-                        
-                        if calculated_time_interval > rego_watchlist_history_time_interval:
-                            df_rego_watchlist.loc[rego_location[0],'Time'] = int(datetime.now().timestamp())
-                            df_rego_watchlist.to_csv(rego_watchlist_path,index = False)
-                            return[flight_details, registration_number]
-                        else:
-                            df_rego_watchlist.loc[rego_location[0],'Time'] = int(datetime.now().timestamp())
-                            df_rego_watchlist.to_csv(rego_watchlist_path,index = False)
-                            return None
-                else: 
-                    return None
-            else: 
-                    return None
+            return None
     else:
         return None
 
 # Check if an aircraft type or airline is in the watchlist    
-def check_type_watchlist(type_watchlist_path, arriving_flight, type_watchlist_history_time_interval, type_watchlist_days, type_watchlist_time, exclusion_list_path):
-    if arriving_flight['flight']['owner'] is not None:
-        airline_name = arriving_flight['flight']['owner']['code']['icao']
+def check_type_watchlist(airport, state_store, arriving_flight, type_watchlist_history_time_interval, type_watchlist_weekdays, type_watchlist_time):
+    if arriving_flight.owner_icao is not None:
+        airline_name = arriving_flight.owner_icao
     else:
         return None
     
-    if arriving_flight['flight']['aircraft'] is not None:
-        aircraft_type = arriving_flight['flight']['aircraft']['model']['code']
-        registration_number = arriving_flight['flight']['aircraft']['registration'] 
-        flight_details = arriving_flight['flight']
+    if arriving_flight.registration is not None:
+        aircraft_type = arriving_flight.type_code
+        registration_number = arriving_flight.registration
     else:
         return None
     
     if type_watchlist_time == 'Off':
         return None
     elif type_watchlist_time == 'Daylight':
-        arrival_period = check_flight_arrival_time(arriving_flight['flight'], airport_tz, airport_lat, airport_lon)
+        arrival_period = check_flight_arrival_time(arriving_flight, airport.sun_table)
         if arrival_period != 'Daylight Arrival':
             return None
     
-    if len(type_watchlist_days) != 0:
-        if arriving_flight['flight']['time'] is not None:
-            arrival_day = datetime.fromtimestamp(arriving_flight['flight']['time']['scheduled']['arrival']).astimezone(pytz.timezone(airport_tz)).strftime('%a')
-            if arrival_day not in type_watchlist_days: 
+    if type_watchlist_weekdays is not None:
+        if arriving_flight.scheduled_arrival is not None:
+            if airport.clock.is_on_weekdays(arriving_flight.scheduled_arrival, type_watchlist_weekdays) == False:
                 return None
     
-    if check_exclusion_list(exclusion_list_path, registration_number) == False:
-        if os.path.isfile(type_watchlist_path) == False:
-            type_watchlist = {'Airline':'','Aircraft Type':'','Time':''}
-            df_type_watchlist = pd.DataFrame(data = type_watchlist,index = [0])
-            df_type_watchlist.to_csv(type_watchlist_path,index = False)
+    if state_store.is_excluded(registration_number, arriving_flight.owner_icao) == False:
+        watchlist_entry = state_store.get_type_watchlist_entry(airline_name, aircraft_type)
+        
+        if watchlist_entry is None:
             return None
+        
+        current_time = int(datetime.now().timestamp())
+        state_store.set_type_watchlist_time(airline_name, aircraft_type, current_time)
+        
+        if is_missing(watchlist_entry['Time']):
+            return arriving_flight
+        
+        calculated_time_interval = (current_time - int(watchlist_entry['Time']))/(60*60)
+        
+        if calculated_time_interval > type_watchlist_history_time_interval:
+            return arriving_flight
         else:
-            df_type_watchlist = pd.read_csv(type_watchlist_path,header = 0)
-            
-            if (airline_name in df_type_watchlist['Airline'].values) == True and (aircraft_type in df_type_watchlist['Aircraft Type'].values) == True:
-                rego_location = df_type_watchlist.index[(df_type_watchlist['Airline'] == airline_name) & (df_type_watchlist['Aircraft Type'] == aircraft_type)].tolist()
-                
-                if len(rego_location) != 0:
-                    if (math.isnan(df_type_watchlist.loc[rego_location[0],'Time'])) == True:
-                        df_type_watchlist.loc[rego_location[0],'Time'] = int(datetime.now().timestamp())
-                        df_type_watchlist.to_csv(type_watchlist_path,index = False)
-                        return[flight_details, registration_number]
-                    else:
-                        calculated_time_interval = (int(datetime.now().timestamp()) - int(df_type_watchlist.loc[rego_location[0],'Time']))/(60*60)
-                        
-                        if calculated_time_interval > type_watchlist_history_time_interval:
-                            df_type_watchlist.loc[rego_location[0],'Time'] = int(datetime.now().timestamp())
-                            df_type_watchlist.to_csv(type_watchlist_path,index = False)
-                            return[flight_details, registration_number]
-                        else:
-                            df_type_watchlist.loc[rego_location[0],'Time'] = int(datetime.now().timestamp())
-                            df_type_watchlist.to_csv(type_watchlist_path,index = False)
-                            return None
-                else: 
-                    return None
-            else:
-                return None
+            return None
     else:
         return None
 
+# Check if a plane is in the rego or type watchlist, used to poll more often when it's about to land
+def is_watched(state_store, arriving_flight):
+    if arriving_flight.registration is None or state_store.is_excluded(arriving_flight.registration, arriving_flight.owner_icao):
+        return False
+    
+    if state_store.get_rego_watchlist_entry(arriving_flight.registration) is not None:
+        return True
+    
+    return state_store.get_type_watchlist_entry(arriving_flight.owner_icao, arriving_flight.type_code) is not None
+
 # Send notification when a notified plane has changed status
-def check_record_notification (arriving_flight, notifi_record_path):
-    if arriving_flight['flight']['aircraft'] is not None:
-        registration_number = arriving_flight['flight']['aircraft']['registration'] 
-        flight_details = arriving_flight['flight']
+def check_record_notification (state_store, arriving_flight):
+    if arriving_flight.registration is not None:
+        registration_number = arriving_flight.registration
     else:
         return None
 
-    flight_status, current_time = check_flight_status(flight_details)
+    flight_status, current_time = check_flight_status(arriving_flight)
     
-    if check_exclusion_list(exclusion_list_path, registration_number) == False:
-        if os.path.isfile(notifi_record_path) == False:
+    if state_store.is_excluded(registration_number, arriving_flight.owner_icao) == False:
+        notification_record = state_store.get_notification_record(registration_number)
+        
+        if notification_record is None:
             return None
+        
+        if ((current_time - notification_record['Time'])/(60*60)) > 24:
+            state_store.delete_notification_record(registration_number)
+            return None
+        elif notification_record['Flight Status'] == 'On Ground' and flight_status == 'In Flight':
+            state_store.delete_notification_record(registration_number)
+            return arriving_flight
         else:
-            df_notifi_record = pd.read_csv(notifi_record_path,header = 0)
-            
-            if (registration_number in df_notifi_record['Registration'].values) == True:
-                rego_location = df_notifi_record.index[(df_notifi_record['Registration'] == registration_number)].tolist()
-                
-                if ((current_time - df_notifi_record.loc[rego_location[0],'Time'])/(60*60)) > 24:
-                    df_notifi_record.drop(rego_location[0], inplace=True)
-                    df_notifi_record.to_csv(notifi_record_path,index = False)
-                    return None
-                elif df_notifi_record.loc[rego_location[0],'Flight Status'] == 'On Ground' and flight_status == 'In Flight':
-                    df_notifi_record.drop(rego_location[0], inplace=True)
-                    df_notifi_record.to_csv(notifi_record_path,index = False)
-                    return[flight_details, registration_number]
-                else:
-                    return None
-                
-            else:
-                return None
+            return None
     else:
         return None
 
 #################################    
 ### Telegram Bot Functions       
 #################################
+
+# Move the window of the dawn and dusk tables to the current day
+def refresh_sun_table(context: CallbackContext):
+    if shard_pool is not None:
+        shard_pool.broadcast(('run', refresh_sun_table))
+        return
+    
+    try:
+        sun_tables.refresh()
+    except Exception:
+        logger.exception('Error when refreshing sun table!')
+
+# Write the file_ids of the photos sent since the last time, once per update interval rather than after each photo
+def save_photo_ids(context: CallbackContext):
+    try:
+        photo_ids.save()
+    except Exception:
+        logger.exception('Error when saving photo ids!')
+
+# Remove the duplicated and expired keys of the rare plane history, run apart from the updates. An airport being
+# updated is not waited for, so the other jobs don't wait either, it's compacted by a run shortly after
+def compact_rare_plane_history(context: CallbackContext):
+    if shard_pool is not None:
+        shard_pool.broadcast(('run', compact_rare_plane_history))
+        return
+    
+    min_time = None
+    if rare_plane_retention_factor > 0:
+        min_time = int(datetime.now().timestamp() - max(rare_plane_retention_factor, 1)*rare_plane_history_time_interval*60*60*24)
+    
+    skipped_airports = list()
+    
+    for airport in monitored_airports:
+        if airport.lock.acquire(blocking=False) == False:
+            skipped_airports.append(airport.details.code)
+            continue
+        
+        try:
+            for subscription in airport.subscriptions:
+                try:
+                    removed = subscription.state_store.compact_rare_plane_history(min_time)
+                    subscription.state_store.flush()
+                    logger.info('Rare plane history of %s for %s compacted, %s rows removed', airport.details.code, subscription.chat_id, removed)
+                except Exception:
+                    logger.exception('Error when compacting rare plane history!')
+        finally:
+            airport.lock.release()
+    
+    if len(skipped_airports) > 0:
+        logger.warning('Skipped compaction of %s, an update is running', ', '.join(skipped_airports))
+        if context is not None:
+            context.job_queue.run_once(compact_rare_plane_history, polling_min_delay)
              
-# Main functions to send notifications
-def send_notification(context: CallbackContext):
+# Send the photo of a rego, by the file_id Telegram gave the first time it was sent if there's one
+def send_rego_photo(bot, chat_id, photo_url, registration_number, caption=None):
+    if caption is None:
+        caption = f'Aircraft Photo: {registration_number}'
+    file_id = photo_ids.get(photo_url)
+    
+    if file_id is not None:
+        try:
+            return bot.send_photo(chat_id=chat_id, photo=file_id, caption=caption)
+        except BadRequest:
+            photo_ids.delete(photo_url)
+    
+    message = bot.send_photo(chat_id=chat_id, photo=photo_url, caption=caption)
+    if message is not None and message.photo:
+        photo_ids.set(photo_url, message.photo[-1].file_id)
+    
+    return message
+
+# Send the photos of a digest as an album, by their file_id when there's one
+def send_rego_album(bot, chat_id, photos):
+    if len(photos) == 1:
+        return [send_rego_photo(bot, chat_id, photos[0]['photo_url'], photos[0]['registration'], photos[0]['caption'])]
+    
+    file_ids = [photo_ids.get(photo['photo_url']) for photo in photos]
+    
     try:
-        print('Checking for updates...')
-        for page in pages:
-            airport = fr_api.get_airport_details(code = airport_code, page = page)
-            airport_arrivals = airport['airport']['pluginData']['schedule']['arrivals']['data']
-            for arriving_flight in airport_arrivals:
-                special_livery_res = check_speical_livery(livery_history_path, sp_keywords, arriving_flight, livery_history_time_interval, livery_days, livery_time, exclusion_list_path)
-                rare_plane_res = check_rare_plane(rare_plane_history_path, arriving_flight, rare_plane_history_time_interval, rare_plane_days, rare_plane_time, exclusion_list_path)
-                rego_watchlist_res = check_rego_watchlist(rego_watchlist_path, arriving_flight, rego_watchlist_history_time_interval, rego_watchlist_days, rego_watchlist_time, exclusion_list_path)
-                type_watchlist_res = check_type_watchlist(type_watchlist_path, arriving_flight, type_watchlist_history_time_interval, type_watchlist_days, type_watchlist_time, exclusion_list_path)
-                status_change_res = check_record_notification(arriving_flight, notifi_record_path)
-                
-                res_flight_details = None
-                res_registration_number = None
-                res_notif_type = None
+        messages = bot.send_media_group(chat_id=chat_id, media=[InputMediaPhoto(file_id or photo['photo_url'], caption=photo['caption'])
+                                                               for photo, file_id in zip(photos, file_ids)])
+    except BadRequest:
+        if all(file_id is None for file_id in file_ids):
+            raise
+        # One of the file_ids isn't accepted anymore, all the photos are sent by URL
+        for photo in photos:
+            photo_ids.delete(photo['photo_url'])
+        messages = bot.send_media_group(chat_id=chat_id, media=[InputMediaPhoto(photo['photo_url'], caption=photo['caption']) for photo in photos])
+    
+    for photo, message in zip(photos, messages or []):
+        if message is not None and message.photo:
+            photo_ids.set(photo['photo_url'], message.photo[-1].file_id)
+    
+    return messages
+
+# Send a notification of the outbox, called by the sender thread. The photo and the next flight of a rego
+# are looked up here rather than when the notification is queued, so waiting for them doesn't hold the update
+def deliver_notification(bot, chat_id, kind, payload):
+    if kind == 'photo':
+        photo_url = payload.get('photo_url') or find_rego_photo(find_rego_details(payload['registration']))
+        if photo_url is not None:
+            send_rego_photo(bot, chat_id, photo_url, payload['registration'])
+    elif kind == 'album':
+        photos = list()
+        for photo in payload['photos']:
+            if len(photos) >= digest_max_photos:
+                break
             
-                if special_livery_res is not None:
-                    res_flight_details = special_livery_res[0]
-                    res_registration_number = special_livery_res[1]
-                    res_notif_type = 'Special Livery'
-                elif rare_plane_res is not None:
-                    res_flight_details = rare_plane_res[0]
-                    res_registration_number = rare_plane_res[1]
-                    res_notif_type = 'Rare Plane/Airline'
-                elif rego_watchlist_res is not None:
-                    res_flight_details = rego_watchlist_res[0]
-                    res_registration_number = rego_watchlist_res[1]
-                    res_notif_type = 'Watchlist Registration'
-                elif type_watchlist_res is not None:
-                    res_flight_details = type_watchlist_res[0]
-                    res_registration_number = type_watchlist_res[1]
-                    res_notif_type = 'Watchlist Aircraft Type'
-                elif status_change_res is not None:
-                    res_flight_details = status_change_res[0]
-                    res_registration_number = status_change_res[1]
-                    res_notif_type = 'Status Change'
-                
-                if res_flight_details is not None and res_registration_number is not None and res_notif_type is not None:
-                    rego_details = find_rego_details(res_registration_number)
-                    
-                    if rego_details is not None:
-                        photo_url = rego_details['aircraftImages'][0]['images']['medium'][0]['link']
-                    
-                    flight_info = format_flight_details(res_flight_details, res_registration_number, res_notif_type, rego_details, airport_iata, airport_icao)
+            photo_url = photo.get('photo_url') or find_rego_photo(find_rego_details(photo['registration']))
+            if photo_url is not None:
+                photos.append(dict(photo, photo_url = photo_url))
+        
+        if len(photos) > 0:
+            send_rego_album(bot, chat_id, photos)
+    elif kind == 'flight':
+        rego_details = find_rego_details(payload['registration']) if payload['registration'] is not None else None
+        flight_info = payload['text'] + format_next_flight(rego_details, payload['airport_iata'], get_airport_clock(payload['timezone'])) + payload['link']
+        bot.send_message(chat_id=chat_id, text = flight_info, parse_mode='HTML')
+    else:
+        bot.send_message(chat_id=chat_id, text = payload['text'], parse_mode='HTML')
 
-                    if photo_url is not None: 
-                        context.bot.send_photo(chat_id=context.job.context, photo=photo_url, caption=f'Aircraft Photo: {res_registration_number}')
-                    
-                    context.bot.send_message(chat_id=context.job.context, text = flight_info, parse_mode='HTML')
-                    record_notification(res_flight_details, res_registration_number, notifi_record_path)
-                    
-    except:
-        print('Error when updating!')
-        sleep(60)
+# Find the photo of a rego, None if there's none
+def find_rego_photo(rego_details):
+    if rego_details is None:
+        return None
+
+    # Many regos have no image, or no image of this size, the notification is then sent without a photo
+    try:
+        return rego_details['aircraftImages'][0]['images']['medium'][0]['link']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+# Add the photo and the details of a match to the outbox, the details of the rego are fetched in the background
+# meanwhile and added when the notification is sent
+def queue_notification(chat_id, airport, flight_record, notif_type):
+    flight_info = format_flight_details(flight_record, notif_type, airport)
+
+    if flight_record.registration is not None: 
+        rego_cache.prefetch([flight_record.registration])
+        outbox.put(chat_id, 'photo', {'registration':flight_record.registration})
+
+    outbox.put(chat_id, 'flight', {'text':flight_info, 'link':format_flight_link(flight_record), 'registration':flight_record.registration,
+                                   'airport_iata':airport.details.iata, 'timezone':airport.details.timezone})
+
+# Add the matches of an update to the outbox as a digest, a single match is sent as usual
+def queue_digest(chat_id, airport, matches):
+    if len(matches) == 1:
+        notif_type, flight_record = matches[0]
+        queue_notification(chat_id, airport, flight_record, notif_type)
+        return
+    
+    digest_messages = format_digest(matches, airport)
+    
+    if digest_mode == 'Album':
+        # The regos are fetched in the background, the album has the first photos found when it's sent
+        rego_cache.prefetch([flight_record.registration for notif_type, flight_record in matches if flight_record.registration is not None])
+        
+        photos = [{'registration':flight_record.registration, 'caption':f'{notif_type}: {flight_record.registration}'}
+                  for notif_type, flight_record in sort_digest_matches(matches) if flight_record.registration is not None]
+        
+        if len(photos) > 0:
+            outbox.put(chat_id, 'album', {'photos':photos})
+    
+    for digest_message in digest_messages:
+        outbox.put(chat_id, 'message', {'text':digest_message})
+
+# Check the arrivals of an airport against the filters of each chat, the arrivals board is fetched once for all of them
+def check_airport(airport):
+    logger.info('Checking for updates of %s...', airport.details.code)
+    if airport.arrivals_pager is not None:
+        arriving_flights = airport.arrivals_pager.get_arrivals()
+        logger.info('Arrivals board of %s: %s', airport.details.code, airport.arrivals_pager.get_stats())
+    else:
+        airport_arrivals = fr_api.get_airport_arrivals(airport.details.code, pages, max_workers = fetch_workers, on_page_error = log_page_error)
+        arriving_flights = [ArrivalRecord.from_schedule_row(arrival) for arrival in airport_arrivals]
+        del airport_arrivals
+    
+    watched_etas = list()
+    
+    for subscription in airport.subscriptions:
+        try:
+            watched_etas.extend(check_subscription(airport, subscription, arriving_flights))
+        except Exception:
+            logger.exception('Error when updating!')
+    
+    if outbox_sender is not None:
+        outbox_sender.notify()
+
+    logger.info('Response cache: %s', fr_api.get_cache_stats())
+    
+    return arriving_flights, watched_etas
+
+# Check the arrivals of an airport against the filters of a chat and add the notifications to the outbox,
+# return the estimated arrivals of the planes the chat watches
+def check_subscription(airport, subscription, arriving_flights):
+    state_store = subscription.state_store
+    seen_flights = subscription.seen_flights
+    
+    state_store.refresh()
+    seen_flights.sync(state_store.version)
+    
+    watched_etas = list()
+    digest_matches = list()
+    
+    for arriving_flight in arriving_flights:
+        if is_watched(state_store, arriving_flight):
+            rego_cache.prefetch([arriving_flight.registration])
+            if arriving_flight.get_arrival_time() is not None:
+                watched_etas.append(arriving_flight.get_arrival_time())
+        
+        if seen_flights.is_changed(arriving_flight) == False:
+            continue
+        
+        try:
+            special_livery_res = check_speical_livery(airport, state_store, sp_keywords, arriving_flight, subscription.livery.time_interval, subscription.livery.weekdays, subscription.livery.notification_time)
+            rare_plane_res = check_rare_plane(airport, state_store, arriving_flight, subscription.rare_plane.time_interval, subscription.rare_plane.weekdays, subscription.rare_plane.notification_time)
+            rego_watchlist_res = check_rego_watchlist(airport, state_store, arriving_flight, subscription.rego_watchlist.time_interval, subscription.rego_watchlist.weekdays, subscription.rego_watchlist.notification_time)
+            type_watchlist_res = check_type_watchlist(airport, state_store, arriving_flight, subscription.type_watchlist.time_interval, subscription.type_watchlist.weekdays, subscription.type_watchlist.notification_time)
+            status_change_res = check_record_notification(state_store, arriving_flight)
+        
+            res_flight_record = None
+            res_notif_type = None
+    
+            if special_livery_res is not None:
+                res_flight_record = special_livery_res
+                res_notif_type = 'Special Livery'
+            elif rare_plane_res is not None:
+                res_flight_record = rare_plane_res
+                res_notif_type = 'Rare Plane/Airline'
+            elif rego_watchlist_res is not None:
+                res_flight_record = rego_watchlist_res
+                res_notif_type = 'Watchlist Registration'
+            elif type_watchlist_res is not None:
+                res_flight_record = type_watchlist_res
+                res_notif_type = 'Watchlist Aircraft Type'
+            elif status_change_res is not None:
+                res_flight_record = status_change_res
+                res_notif_type = 'Status Change'
+        
+            if res_flight_record is not None and res_notif_type is not None:
+                if digest_mode == 'Off':
+                    queue_notification(subscription.chat_id, airport, res_flight_record, res_notif_type)
+                else:
+                    digest_matches.append((res_notif_type, res_flight_record))
+                record_notification(res_flight_record, state_store)
+            
+            seen_flights.mark(arriving_flight)
+        except Exception:
+            logger.exception('Error when updating!')
+    
+    seen_flights.evict_expired()
+    
+    if len(digest_matches) > 0:
+        try:
+            queue_digest(subscription.chat_id, airport, digest_matches)
+        except Exception:
+            logger.exception('Error when sending digest!')
+    
+    try:
+        state_store.flush()
+    except Exception:
+        logger.exception('Error when saving filters!')
+
+    logger.info('Seen flights of %s for %s: %s', airport.details.code, subscription.chat_id, seen_flights.get_stats())
+    
+    return watched_etas
+
+# Main functions to send notifications, the job context is the airport to update
+def send_notification(context: CallbackContext):
+    return check_airport(context.job.context)
+
+# Choose when the next update of an airport runs, after the minimum delay if it can't be chosen
+def get_next_update_delay(airport, arriving_flights, watched_etas):
+    try:
+        decision = airport.poll_scheduler.get_next_interval(arriving_flights, watched_etas)
+        logger.info('Next update of %s in %s seconds: %s (%s arrivals in the next hour)', airport.details.code, round(decision.interval), decision.reason, decision.upcoming_arrivals)
+        return decision.interval
+    except Exception:
+        logger.exception('Error when scheduling the next update!')
+        return polling_min_delay
+
+# Run an update, then schedule the next one, whatever happens so the updates of the airport never stop
+def run_adaptive_update(context: CallbackContext):
+    airport = context.job.context
+    arriving_flights, watched_etas = list(), list()
+    
+    try:
+        arriving_flights, watched_etas = send_notification(context)
+    except Exception:
+        logger.exception('Error when updating!')
+    finally:
+        context.job_queue.run_once(run_airport_update, get_next_update_delay(airport, arriving_flights, watched_etas), context=context.job.context)
+
+# Update an airport, one update at a time
+def update_airport(context: CallbackContext):
+    airport = context.job.context
+    
+    if airport.lock.acquire(blocking=False) == False:
+        logger.warning('Skipped update of %s, the previous one is still running', airport.details.code)
+        if adaptive_polling:
+            context.job_queue.run_once(run_airport_update, polling_min_delay, context=context.job.context)
+        return
+    
+    try:
+        if adaptive_polling:
+            run_adaptive_update(context)
+        else:
+            send_notification(context)
+    finally:
+        airport.lock.release()
+
+# Run the update of an airport in a worker thread of the dispatcher, so the airports are updated at the same time
+def run_airport_update(context: CallbackContext):
+    dispatcher.run_async(update_airport, context)
+
+# Run the updates of a shard of the airports in a worker process, until the coordinator stops it
+def run_shard(connection):
+    global monitored_airports, outbox, outbox_sender, shard_pool
+    
+    # The notifications are sent by the coordinator
+    outbox = ShardOutbox(connection)
+    outbox_sender = None
+    shard_pool = None
+    
+    monitored_airports = [load_airport(airport_code) for airport_code in connection.airport_codes]
+    airports = {airport.details.code: airport for airport in monitored_airports}
+    next_updates = {airport_code: 0 for airport_code in airports}
+    
+    while True:
+        for airport_code, airport in airports.items():
+            if next_updates[airport_code] > datetime.now().timestamp():
+                continue
+            
+            arriving_flights, watched_etas = list(), list()
+            try:
+                arriving_flights, watched_etas = check_airport(airport)
+            except Exception:
+                logger.exception('Error when updating!')
+            
+            if adaptive_polling:
+                next_updates[airport_code] = datetime.now().timestamp() + get_next_update_delay(airport, arriving_flights, watched_etas)
+            else:
+                next_updates[airport_code] = datetime.now().timestamp() + notification_delay
+            
+            connection.send(('stats', airport_code, get_airport_stats(airport)))
+        
+        # Handle the commands of the coordinator until the next update is due
+        command = connection.get_command(max(0, min(next_updates.values()) - datetime.now().timestamp()))
+        
+        if command is None:
+            continue
+        elif command[0] == 'stop':
+            break
+        elif command[0] == 'call':
+            request_id, airport_code, subscription_chat_id, method, args = command[1:]
+            connection.reply(request_id, lambda: getattr(get_state_store(subscription_chat_id, airport_code), method)(*args))
+        elif command[0] == 'run':
+            command[1](None)
+
+# Handle a message of a worker process, called by the coordinator
+def handle_shard_message(message):
+    if message[0] == 'notification':
+        outbox.put(*message[1:])
+        if outbox_sender is not None:
+            outbox_sender.notify()
+    elif message[0] == 'stats':
+        shard_stats[message[1]] = message[2]
+
+# Filters of a chat at an airport, the ones owned by a worker process are read and replaced through the pool
+def get_state_store(chat_id, airport_code):
+    if shard_pool is not None:
+        return ShardStateStore(shard_pool, airport_code, chat_id)
+    
+    for airport in monitored_airports:
+        if airport.details.code == airport_code:
+            for subscription in airport.subscriptions:
+                if subscription.chat_id == chat_id:
+                    return subscription.state_store
+    
+    raise KeyError((chat_id, airport_code))
+
+# Metrics of the updates of an airport
+def get_airport_stats(airport):
+    stats = dict()
+    for subscription in airport.subscriptions:
+        suffix = ' ' + subscription.chat_id if len(airport.subscriptions) > 1 else ''
+        stats['Seen flights' + suffix] = subscription.seen_flights.get_stats()
+    if airport.arrivals_pager is not None:
+        stats['Arrivals board'] = airport.arrivals_pager.get_stats()
+    if adaptive_polling:
+        stats['Polling'] = airport.poll_scheduler.get_stats()
+    
+    return stats
+
+# Reply with the metrics of the updates
+def show_stats(update: Update, context: CallbackContext):
+    stats = {'Response cache': fr_api.get_cache_stats(), 'Rego details': rego_cache.get_stats()}
+    if outbox_sender is not None:
+        stats['Outbox'] = outbox_sender.get_stats()
+    if shard_pool is not None:
+        stats['Shards'] = shard_pool.get_stats()
+    
+    airport_stats = {airport.details.code: get_airport_stats(airport) for airport in monitored_airports}
+    airport_stats.update(shard_stats)
+    for airport_code, airport_stat in airport_stats.items():
+        prefix = airport_code + ' ' if len(airport_codes) > 1 else ''
+        for name, value in airport_stat.items():
+            stats[prefix + name] = value
+    
+    update.message.reply_text('\n\n'.join(f'{name}:\n{value}' for name, value in stats.items()))
                 
 ## Telegram bot menu functions
 
-FILTER_CHOICE, OP_CHOICE, ADD_ENTRY, ADD_ENTRY_RICH, DELETE_ENTRY = range(5)
+FILTER_CHOICE, OP_CHOICE, ADD_ENTRY, ADD_ENTRY_RICH, DELETE_ENTRY, AIRPORT_CHOICE = range(6)
 
 # Define the main menu keyboard
+airports_keyboard = [airport_codes]
+airports_markup = ReplyKeyboardMarkup(airports_keyboard, resize_keyboard=True)
+
 filters_keyboard = [['Exclusion List', 'Rego Watchlist', 'Type Watchlist']]
 filters_markup = ReplyKeyboardMarkup(filters_keyboard, resize_keyboard=True)
 
@@ -772,30 +1229,71 @@ op_markup = ReplyKeyboardMarkup(op_keyboard, resize_keyboard=True)
 empty_op_keyboard = [['Add Entry', 'Exit']]
 empty_op_markup = ReplyKeyboardMarkup(empty_op_keyboard, resize_keyboard=True)
 
+# Reply that the filters are busy when the worker process of the airport doesn't answer in time, e.g. while it
+# builds the rare plane history at startup, and end the conversation rather than leave it waiting
+def reply_when_busy(handler):
+    @functools.wraps(handler)
+    def handle(update: Update, context: CallbackContext) -> int:
+        try:
+            return handler(update, context)
+        except TimeoutError:
+            logger.warning('Filters of %s are busy', update.effective_chat.id, exc_info=True)
+            update.message.reply_text("The filters are busy, please try again in a minute with /filters.")
+            return ConversationHandler.END
+    
+    return handle
+
 # Define a function to handle the start command
 def start(update: Update, context: CallbackContext) -> int:
+    # Each chat edits its own filters, the chats that aren't notified don't have any
+    if str(update.effective_chat.id) not in chat_ids:
+        update.message.reply_text("This chat isn't subscribed to any notification.")
+        return ConversationHandler.END
+    
+    if len(airport_codes) > 1:
+        update.message.reply_text(
+            "Please choose the airport whose filters you would like to modify:",
+            reply_markup=airports_markup
+        )
+        return AIRPORT_CHOICE
+    
+    # The filters edited by the menu are kept with the chat, several chats may use it at the same time
+    context.chat_data['state_store'] = get_state_store(str(update.effective_chat.id), airport_codes[0])
     update.message.reply_text(
         "Please choose the filter you would like to modify:",
         reply_markup=filters_markup
     )
     return FILTER_CHOICE
 
+# Define a function to handle the user's choice of airport
+def airport_choice(update: Update, context: CallbackContext) -> int:
+    for airport_code in airport_codes:
+        if airport_code.upper() == update.message.text.strip().upper():
+            context.chat_data['state_store'] = get_state_store(str(update.effective_chat.id), airport_code)
+            update.message.reply_text(
+                "Please choose the filter you would like to modify:",
+                reply_markup=filters_markup
+            )
+            return FILTER_CHOICE
+    
+    update.message.reply_text("Invalid choice. Please select an airport from the menu.")
+    return AIRPORT_CHOICE
+
 # Define a function to handle the user's choice from the main menu
 def filter_choice(update: Update, context: CallbackContext) -> int:
-    global user_choice
-    global num_of_entries
-    user_choice = update.message.text
+    state_store = context.chat_data['state_store']
+    user_choice = context.chat_data['user_choice'] = update.message.text
     
     if user_choice == 'Exclusion List':
-        df_exclusion_list = pd.read_csv(exclusion_list_path,header = 0)
+        df_exclusion_list = state_store.get_table('exclusion_list')
         display_text, num_of_entries = convert_df_text(user_choice, df_exclusion_list, True)
         update.message.reply_html(display_text)
     elif user_choice == 'Rego Watchlist':
-        df_rego_watchlist = pd.read_csv(rego_watchlist_path,header = 0)
+        df_rego_watchlist = state_store.get_table('rego_watchlist')
         display_text, num_of_entries = convert_df_text(user_choice, df_rego_watchlist, True)
         update.message.reply_html(display_text)
     elif user_choice == 'Type Watchlist':
-        df_type_watchlist = pd.read_csv(type_watchlist_path,header = 0)
+        df_type_watchlist = state_store.get_table('type_watchlist')
         display_text, num_of_entries = convert_df_text(user_choice, df_type_watchlist, True)
         update.message.reply_html(display_text)
     else:
@@ -811,30 +1309,40 @@ def filter_choice(update: Update, context: CallbackContext) -> int:
 
 # Define a function to add a new entry to the DataFrame
 def add_entry(update: Update, context: CallbackContext) -> int:
+    user_choice = context.chat_data['user_choice']
+    
     if user_choice == 'Exclusion List':    
         update.message.reply_text("Copy a notification, or enter the ICAO code of the airline, registration number and description of the new entry, separated by comma (e.g., QFA,VH-XZP,Qantas Retro Roo):")
     elif user_choice == 'Rego Watchlist':
-        update.message.reply_text("Copy a notification, or enter the ICAO code of the airline, registration number and description of the new entry, separated by comma (e.g., QFA,VH-XZP,Qantas Retro Roo):")
+        update.message.reply_text("Copy a notification, or enter the ICAO code of the airline, registration number and description of the new entry, separated by comma (e.g., QFA,VH-XZP,Qantas Retro Roo). End the registration with * to watch all the registrations starting with it (e.g., QFA,VH-*,Australian planes):")
     elif user_choice == 'Type Watchlist':
-        update.message.reply_text("Copy a notification, or enter the ICAO code of the airline and the aircraft type, separated by a comma (e.g., QFA,B744):")
+        update.message.reply_text("Copy a notification, or enter the ICAO code of the airline and the aircraft type, separated by a comma (e.g., QFA,B744). End either of them with * to watch all the airlines or types starting with it (e.g., *,A388 or QFA,B7*):")
     
     return ADD_ENTRY
 
 # Define a function to handle adding a new entry
 def add_new_entry(update: Update, context: CallbackContext) -> int:
-    global new_entry_text
-    new_entry_text = update.message.text.splitlines()
+    state_store = context.chat_data['state_store']
+    user_choice = context.chat_data['user_choice']
+    new_entry_text = context.chat_data['new_entry_text'] = update.message.text.splitlines()
     
     if len(new_entry_text) != 1:
         update.message.reply_text("Please enter description!")
         return ADD_ENTRY_RICH
     
     else:
-        new_entry = new_entry_text.split(',')
+        # The type watchlist has 2 fields, the other lists 3 and the description may contain commas
+        num_of_fields = 2 if user_choice == 'Type Watchlist' else 3
+        new_entry = [field.strip() for field in new_entry_text[0].split(',', 2)]
+        
+        if len(new_entry) != num_of_fields:
+            update.message.reply_text("Invalid format. Please enter the information separated by comma.")
+            return ADD_ENTRY
+        
         if len(new_entry) == 3:
             if user_choice == 'Exclusion List':
                 airline, rego, description = new_entry
-                df_exclusion_list = pd.read_csv(exclusion_list_path,header = 0)
+                df_exclusion_list = state_store.get_table('exclusion_list')
                 
                 new_entry_data = {'Airline':airline,'Registration':rego,'Description':description}
                 df_new_entry_data = pd.DataFrame(data = new_entry_data,index = [0])
@@ -847,11 +1355,11 @@ def add_new_entry(update: Update, context: CallbackContext) -> int:
                 new_df_display_text, num_of_entries = convert_df_text(('Updated ' + user_choice), df_exclusion_list, True)
                 update.message.reply_html(new_df_display_text)
                 
-                df_exclusion_list.to_csv(exclusion_list_path,index = False)
+                state_store.replace_table('exclusion_list', df_exclusion_list)
             
             elif user_choice == 'Rego Watchlist':
                 airline, rego, description = new_entry
-                df_rego_watchlist = pd.read_csv(rego_watchlist_path,header = 0)
+                df_rego_watchlist = state_store.get_table('rego_watchlist')
                 
                 new_entry_data = {'Airline':airline,'Registration':rego,'Description':description,'Time':int(0)}
                 df_new_entry_data = pd.DataFrame(data = new_entry_data,index = [0])
@@ -864,7 +1372,7 @@ def add_new_entry(update: Update, context: CallbackContext) -> int:
                 new_df_display_text, num_of_entries = convert_df_text(('Updated ' + user_choice), df_rego_watchlist, True)
                 update.message.reply_html(new_df_display_text)
                 
-                df_rego_watchlist.to_csv(rego_watchlist_path,index = False)
+                state_store.replace_table('rego_watchlist', df_rego_watchlist)
             
             
             context.bot.send_message(chat_id=update.effective_chat.id, text="Operation Complete!")
@@ -873,7 +1381,7 @@ def add_new_entry(update: Update, context: CallbackContext) -> int:
         elif len(new_entry) == 2:
             if user_choice == 'Type Watchlist':
                 airline, aircraft_type = new_entry
-                df_type_watchlist = pd.read_csv(type_watchlist_path,header = 0)
+                df_type_watchlist = state_store.get_table('type_watchlist')
                 
                 new_entry_data = {'Airline':airline,'Aircraft Type':aircraft_type,'Time':int(0)}
                 df_new_entry_data = pd.DataFrame(data = new_entry_data,index = [0])
@@ -886,22 +1394,23 @@ def add_new_entry(update: Update, context: CallbackContext) -> int:
                 new_df_display_text, num_of_entries = convert_df_text(('Updated ' + user_choice), df_type_watchlist, True)
                 update.message.reply_html(new_df_display_text)
                 
-                df_type_watchlist.to_csv(type_watchlist_path,index = False)
+                state_store.replace_table('type_watchlist', df_type_watchlist)
                 
             context.bot.send_message(chat_id=update.effective_chat.id, text="Operation Complete!")
             return ConversationHandler.END
-        else:
-            update.message.reply_text("Invalid format. Please enter the information separated by comma.")
-            return ADD_ENTRY
 
 def add_new_entry_rich_text(update: Update, context: CallbackContext) -> int:
+    state_store = context.chat_data['state_store']
+    user_choice = context.chat_data['user_choice']
+    new_entry_text = context.chat_data['new_entry_text']
+    
     rego = new_entry_text[5].replace('  Registration: ','')
     airline = ''.join(list(new_entry_text[6].split()[-1])[-4:-1])
     aircraft_type = ''.join(list(new_entry_text[4].split()[-1])[-5:-1])
     description = update.message.text
     
     if user_choice == 'Exclusion List':
-        df_exclusion_list = pd.read_csv(exclusion_list_path,header = 0)
+        df_exclusion_list = state_store.get_table('exclusion_list')
                 
         new_entry_data = {'Airline':airline,'Registration':rego,'Description':description}
         df_new_entry_data = pd.DataFrame(data = new_entry_data,index = [0])
@@ -914,13 +1423,13 @@ def add_new_entry_rich_text(update: Update, context: CallbackContext) -> int:
         new_df_display_text, num_of_entries = convert_df_text(('Updated ' + user_choice), df_exclusion_list, True)
         update.message.reply_html(new_df_display_text)
         
-        df_exclusion_list.to_csv(exclusion_list_path,index = False)
+        state_store.replace_table('exclusion_list', df_exclusion_list)
             
         context.bot.send_message(chat_id=update.effective_chat.id, text="Operation Complete!")
         return ConversationHandler.END
     
     elif user_choice == 'Rego Watchlist':
-        df_rego_watchlist = pd.read_csv(rego_watchlist_path,header = 0)
+        df_rego_watchlist = state_store.get_table('rego_watchlist')
         
         new_entry_data = {'Airline':airline,'Registration':rego,'Description':description,'Time':int(0)}
         df_new_entry_data = pd.DataFrame(data = new_entry_data,index = [0])
@@ -933,13 +1442,13 @@ def add_new_entry_rich_text(update: Update, context: CallbackContext) -> int:
         new_df_display_text, num_of_entries = convert_df_text(('Updated ' + user_choice), df_rego_watchlist, True)
         update.message.reply_html(new_df_display_text)
         
-        df_rego_watchlist.to_csv(rego_watchlist_path,index = False)
+        state_store.replace_table('rego_watchlist', df_rego_watchlist)
         
         context.bot.send_message(chat_id=update.effective_chat.id, text="Operation Complete!")
         return ConversationHandler.END
         
     elif user_choice == 'Type Watchlist':
-        df_type_watchlist = pd.read_csv(type_watchlist_path,header = 0)
+        df_type_watchlist = state_store.get_table('type_watchlist')
             
         new_entry_data = {'Airline':airline,'Aircraft Type':aircraft_type,'Time':int(0)}
         df_new_entry_data = pd.DataFrame(data = new_entry_data,index = [0])
@@ -952,7 +1461,7 @@ def add_new_entry_rich_text(update: Update, context: CallbackContext) -> int:
         new_df_display_text, num_of_entries = convert_df_text(('Updated ' + user_choice), df_type_watchlist, True)
         update.message.reply_html(new_df_display_text)
         
-        df_type_watchlist.to_csv(type_watchlist_path,index = False)
+        state_store.replace_table('type_watchlist', df_type_watchlist)
                 
         context.bot.send_message(chat_id=update.effective_chat.id, text="Operation Complete!")
         return ConversationHandler.END
@@ -964,6 +1473,9 @@ def delete_entry(update: Update, context: CallbackContext) -> int:
 
 # Define a function to handle deleting an entry
 def delete_existing_entry(update: Update, context: CallbackContext) -> int:
+    state_store = context.chat_data['state_store']
+    user_choice = context.chat_data['user_choice']
+    
     try:
         if ',' in update.message.text:
             delete_indexes = [int(x) for x in update.message.text.split(',')]
@@ -976,13 +1488,13 @@ def delete_existing_entry(update: Update, context: CallbackContext) -> int:
         
     try:
         if user_choice == 'Exclusion List':
-            list_path = exclusion_list_path
+            list_name = 'exclusion_list'
         elif user_choice == 'Rego Watchlist':
-            list_path = rego_watchlist_path
+            list_name = 'rego_watchlist'
         elif user_choice == 'Type Watchlist':
-            list_path = type_watchlist_path
+            list_name = 'type_watchlist'
         
-        df_list = pd.read_csv(list_path,header = 0)
+        df_list = state_store.get_table(list_name)
         df_deleted_entry = df_list.iloc[delete_indexes]
             
         deleted_entry_display_text, num_of_entries = convert_df_text('Deleted Index(es)', df_deleted_entry, False)
@@ -993,7 +1505,7 @@ def delete_existing_entry(update: Update, context: CallbackContext) -> int:
         new_df_display_text, num_of_entries = convert_df_text(('Updated ' + user_choice), df_list, True)
         update.message.reply_html(new_df_display_text)
              
-        df_list.to_csv(list_path,index = False)
+        state_store.replace_table(list_name, df_list)
             
     except (ValueError, IndexError):
         update.message.reply_text("Invalid input. Please enter a valid index.")
@@ -1009,40 +1521,66 @@ def end_conversation(update: Update, context: CallbackContext) -> int:
 
 ## Start the telegram bot
 def main():
+    global dispatcher, outbox_sender, shard_pool
+    
+    # Start the worker processes, they load the settings again and send their notifications to the outbox of the bot
+    if shard_processes > 0:
+        shard_pool = ShardPool(airport_codes, shard_processes, run_shard, handle_shard_message)
+        shard_pool.start()
+    
     # Initialize the Telegram Bot
-    updater = Updater(telegram_bot_token, use_context=True)
+    updater = Updater(telegram_bot_token, use_context=True, workers=4 + len(monitored_airports))
 
-    # Get the dispatcher to register handlers
-    dp = updater.dispatcher
+    # Send the notifications of the outbox, including the ones left by a previous run
+    outbox_sender = OutboxSender(outbox, lambda chat_id, kind, payload: deliver_notification(updater.bot, chat_id, kind, payload),
+                                 chat_interval = telegram_chat_interval, permanent_errors = (BadRequest, Unauthorized))
+    outbox_sender.start()
+
+    # Get the dispatcher to register handlers, and to run the updates of the airports
+    dp = dispatcher = updater.dispatcher
 
     # Register command handlers
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler('filters', start)],
         states={
-            FILTER_CHOICE: [MessageHandler(Filters.text & ~Filters.command, filter_choice)],
+            AIRPORT_CHOICE: [MessageHandler(Filters.text & ~Filters.command, airport_choice)],
+            FILTER_CHOICE: [MessageHandler(Filters.text & ~Filters.command, reply_when_busy(filter_choice))],
             OP_CHOICE: [
                 MessageHandler(Filters.regex('Add Entry'), add_entry),
                 MessageHandler(Filters.regex('Delete Entry'), delete_entry),
                 MessageHandler(Filters.regex('Exit'), end_conversation)
             ],
-            ADD_ENTRY: [MessageHandler(Filters.text & ~Filters.command, add_new_entry)],
-            ADD_ENTRY_RICH: [MessageHandler(Filters.text & ~Filters.command, add_new_entry_rich_text)],
-            DELETE_ENTRY: [MessageHandler(Filters.text & ~Filters.command, delete_existing_entry)]
+            ADD_ENTRY: [MessageHandler(Filters.text & ~Filters.command, reply_when_busy(add_new_entry))],
+            ADD_ENTRY_RICH: [MessageHandler(Filters.text & ~Filters.command, reply_when_busy(add_new_entry_rich_text))],
+            DELETE_ENTRY: [MessageHandler(Filters.text & ~Filters.command, reply_when_busy(delete_existing_entry))]
         },
         fallbacks=[]
     )
 
     # Register the ConversationHandler with the dispatcher
     dp.add_handler(conv_handler)
+    dp.add_handler(CommandHandler('stats', show_stats))
     # Start the Bot
     updater.start_polling()
 
     # Schedule periodic updates (every 60 seconds in this example)
     job_queue = updater.job_queue
-    job_queue.run_repeating(send_notification, interval=notification_delay, first=0, context=chat_id)  # Replace 123456789 with your chat ID
+    for airport in monitored_airports:
+        if adaptive_polling:
+            job_queue.run_once(run_airport_update, 0, context=airport)
+        else:
+            job_queue.run_repeating(run_airport_update, interval=notification_delay, first=0, context=airport)
+    job_queue.run_repeating(compact_rare_plane_history, interval=rare_plane_compaction_interval, first=notification_delay)
+    job_queue.run_repeating(refresh_sun_table, interval=24*60*60, first=24*60*60)
+    job_queue.run_repeating(save_photo_ids, interval=notification_delay, first=notification_delay)
 
     # Run the bot until you press Ctrl-C
     updater.idle()
+    
+    if shard_pool is not None:
+        shard_pool.stop(10)
+    
+    save_photo_ids(None)
 
 if __name__ == '__main__':
     main()
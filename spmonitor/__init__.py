@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+
+"""
+Building blocks of the Special Plane Monitor bot.
+"""
+
+from .records import ArrivalRecord
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+from typing import Dict, List, Optional
+
+import dataclasses
+import threading
+
+from .pager import ArrivalsPager
+from .scheduler import PollScheduler
+from .subscription import Subscription
+from .sun_table import SunTable
+from .time_helper import AirportClock
+
+
+@dataclasses.dataclass
+class AirportDetails(object):
+    """
+    Data class with the name, codes, time zone and position of an airport.
+    """
+    code: str
+    name: str
+    iata: str
+    icao: str
+    timezone: str
+    latitude: float
+    longitude: float
+
+    @classmethod
+    def from_airport(cls, code: str, airport: Dict) -> "AirportDetails":
+        """
+        Build the details from the response of FlightRadar24API.get_airport_details().
+
+        :param code: Code the airport was requested with
+        :param airport: Response of the request
+        """
+        details = airport["airport"]["pluginData"]["details"]
+
+        return cls(
+            code=code,
+            name=details["name"],
+            iata=details["code"]["iata"],
+            icao=details["code"]["icao"],
+            timezone=details["timezone"]["name"],
+            latitude=details["position"]["latitude"],
+            longitude=details["position"]["longitude"],
+        )
+
+
+@dataclasses.dataclass
+class AirportMonitor(object):
+    """
+    Data class with a monitored airport, the chats subscribed to it and the state of its updates.
+
+    The clock and the sun table may be shared with other airports. The arrivals board is fetched once
+    per update and checked against the filters of each subscription.
+    """
+    details: AirportDetails
+    clock: AirportClock
+    sun_table: SunTable
+    subscriptions: List[Subscription]
+    arrivals_pager: Optional[ArrivalsPager] = None
+    poll_scheduler: Optional[PollScheduler] = None
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock, repr=False, compare=False)
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import dataclasses
+
+from flightradar24api import FlightRadar24API
+
+from .records import ArrivalRecord
+
+
+@dataclasses.dataclass
+class RarePlaneTimes(object):
+    """
+    Data class with the latest arrival time of each (airline ICAO, aircraft type) read from the arrivals history
+    of an airport, and how far back the history was read.
+
+    The pages are read from the most recent one, and the reading stops at the first page that could not be
+    fetched, so the history is read without a gap back to the oldest time. It's complete once it was read back
+    to the time it was read since, or to its end.
+    """
+    times: Dict[Tuple[str, str], int]
+    oldest: Optional[int] = None
+    complete: bool = False
+
+
+def get_oldest_arrival(schedule: Dict) -> Optional[int]:
+    """
+    Return the oldest real arrival time of a page of the arrivals history, or None if it doesn't have any.
+    """
+    times = [
+        record.real_arrival for record in map(ArrivalRecord.from_schedule_row, schedule["data"] or list())
+        if record.real_arrival is not None
+    ]
+    return min(times) if times else None
+
+
+def find_history_page(
+    fr_api: FlightRadar24API,
+    code: str,
+    until: int,
+    total_pages: int,
+    *,
+    flight_limit: int = 100,
+    on_page_error: Optional[Callable[[int, Exception], None]] = None
+) -> Optional[int]:
+    """
+    Return the first page of the arrivals history with arrivals before a timestamp, found by bisecting the pages,
+    or None if a page could not be fetched.
+
+    :param fr_api: API used to fetch the history
+    :param code: ICAO or IATA of the airport
+    :param until: Timestamp to look for
+    :param total_pages: Number of pages of the history
+    :param flight_limit: Limit of flights of each page
+    :param on_page_error: Called with the page and the exception of each page that could not be fetched
+    """
+    first, last = 1, total_pages
+
+    while first < last:
+        middle = (first + last) // 2
+        schedules = fr_api.get_airport_arrival_pages(code, [-middle], flight_limit, on_page_error=on_page_error)
+
+        if not schedules:
+            return None
+
+        oldest = get_oldest_arrival(schedules[0])
+
+        if oldest is not None and oldest < until:
+            last = middle
+        else:
+            first = middle + 1
+
+    return first
+
+
+def collect_rare_plane_times(
+    fr_api: FlightRadar24API,
+    code: str,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    *,
+    flight_limit: int = 100,
+    max_workers: int = 4,
+    on_page_error: Optional[Callable[[int, Exception], None]] = None
+) -> RarePlaneTimes:
+    """
+    Return the latest arrival time of each (airline ICAO, aircraft type) in the arrivals history of an airport.
+
+    The history pages are fetched concurrently, max_workers at a time, starting from the most recent one.
+
+    :param fr_api: API used to fetch the history
+    :param code: ICAO or IATA of the airport
+    :param since: If given, only arrivals from this timestamp are collected, and no more pages are fetched once it's reached
+    :param until: If given, only arrivals before this timestamp are collected, and the pages are fetched from the
+                  first one with such arrivals, e.g. to resume reading the history where an earlier reading stopped
+    :param flight_limit: Limit of flights of each page
+    :param max_workers: Maximum number of pages fetched at the same time
+    :param on_page_error: Called with the page and the exception of each page that could not be fetched
+    """
+    result = RarePlaneTimes(dict())
+    failed_pages: Set[int] = set()
+
+    def on_error(page: int, error: Exception) -> None:
+        failed_pages.add(page)
+        if on_page_error is not None: on_page_error(page, error)
+
+    pages: List[int] = [-1]
+    next_page = 1
+    total_pages: Optional[int] = None
+
+    while pages:
+        schedules = iter(fr_api.get_airport_arrival_pages(
+            code, pages, flight_limit, max_workers=max_workers, on_page_error=on_error
+        ))
+        since_reached = False
+
+        for page in pages:
+            # A page that could not be fetched leaves a gap, the older ones are read another time.
+            if page in failed_pages:
+                return result
+
+            schedule = next(schedules)
+
+            if total_pages is None:
+                total_pages = (schedule.get("page") or dict()).get("total") or 1
+
+                if until is not None and total_pages > 1:
+                    next_page = find_history_page(
+                        fr_api, code, until, total_pages, flight_limit=flight_limit, on_page_error=on_error
+                    )
+
+                    if next_page is None:
+                        return result
+                    if next_page > 1:
+                        break
+
+            for row in schedule["data"] or list():
+                record = ArrivalRecord.from_schedule_row(row)
+
+                if record.real_arrival is None:
+                    continue
+
+                if result.oldest is None or record.real_arrival < result.oldest:
+                    result.oldest = record.real_arrival
+
+                if since is not None and record.real_arrival < since:
+                    since_reached = True
+                    continue
+
+                if until is not None and record.real_arrival >= until:
+                    continue
+
+                if record.owner_icao is None or record.type_code is None:
+                    continue
+
+                key = (record.owner_icao, record.type_code)
+
+                if result.times.get(key, 0) < record.real_arrival:
+                    result.times[key] = record.real_arrival
+
+        else:
+            next_page += len(pages)
+
+        if total_pages is None:
+            return result
+        if since_reached:
+            break
+
+        pages = [-page for page in range(next_page, min(next_page + max_workers, total_pages + 1))]
+
+    result.complete = True
+    return result
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationOutbox(object):
+    """
+    Queue of the notifications to send, kept in an SQLite database so they survive a restart.
+
+    The notifications of a chat are sent in the order they were added.
+    """
+    __schema = """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS outbox_chat_id ON outbox (chat_id, id);
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Constructor of the NotificationOutbox class.
+
+        :param db_path: Path of the database file. It's created if it doesn't exist
+        """
+        self.db_path = db_path
+
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.__connection.executescript(self.__schema)
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return self.__connection.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def put(self, chat_id: str, kind: str, payload: Dict[str, Any]) -> None:
+        """
+        Add a notification to the end of the queue of a chat.
+
+        :param chat_id: Chat the notification is sent to
+        :param kind: Kind of notification, e.g. "photo" or "message"
+        :param payload: Content of the notification. It must be serializable to JSON
+        """
+        with self.__lock:
+            self.__connection.execute(
+                "INSERT INTO outbox (chat_id, kind, payload) VALUES (?, ?, ?)", (str(chat_id), kind, json.dumps(payload))
+            )
+            self.__connection.commit()
+
+    def get_heads(self) -> List[Tuple[int, str, str, Dict[str, Any], int, float]]:
+        """
+        Return the first notification of each chat, as (id, chat_id, kind, payload, attempts, next_attempt).
+        """
+        with self.__lock:
+            rows = self.__connection.execute(
+                "SELECT id, chat_id, kind, payload, attempts, next_attempt FROM outbox "
+                "WHERE id IN (SELECT MIN(id) FROM outbox GROUP BY chat_id) ORDER BY id"
+            ).fetchall()
+
+        return [(id, chat_id, kind, json.loads(payload), attempts, next_attempt) for id, chat_id, kind, payload, attempts, next_attempt in rows]
+
+    def delete(self, id: int) -> None:
+        """
+        Remove a notification from the queue, once it's sent or dropped.
+        """
+        with self.__lock:
+            self.__connection.execute("DELETE FROM outbox WHERE id = ?", (id,))
+            self.__connection.commit()
+
+    def postpone(self, id: int, next_attempt: float) -> None:
+        """
+        Count a failed attempt to send a notification and set when it's tried again.
+        """
+        with self.__lock:
+            self.__connection.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt = ? WHERE id = ?", (next_attempt, id)
+            )
+            self.__connection.commit()
+
+    def close(self) -> None:
+        """
+        Close the database.
+        """
+        with self.__lock:
+            self.__connection.close()
+
+
+class OutboxSender(object):
+    """
+    Worker thread sending the notifications of an outbox, with a minimum delay between
+    two notifications of the same chat and a backoff when a notification fails.
+    """
+    def __init__(
+        self,
+        outbox: NotificationOutbox,
+        send: Callable[[str, str, Dict[str, Any]], Any],
+        *,
+        chat_interval: float = 1.0,
+        global_interval: float = 1 / 25,
+        max_attempts: int = 8,
+        backoff_factor: float = 2.0,
+        max_backoff: float = 300.0,
+        permanent_errors: Tuple[Type[Exception], ...] = ()
+    ):
+        """
+        Constructor of the OutboxSender class.
+
+        :param outbox: Outbox of the notifications
+        :param send: Called with the chat id, the kind and the payload of each notification to send it
+        :param chat_interval: Minimum seconds between two notifications of the same chat
+        :param global_interval: Minimum seconds between two notifications of any chat
+        :param max_attempts: Number of attempts after which a notification is dropped
+        :param backoff_factor: Factor of the exponential backoff between two attempts, in seconds
+        :param max_backoff: Maximum seconds between two attempts
+        :param permanent_errors: Errors after which a notification is dropped without trying again
+        """
+        self.outbox = outbox
+        self.send = send
+        self.chat_interval = chat_interval
+        self.global_interval = global_interval
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.permanent_errors = permanent_errors
+
+        self.__wake_up = threading.Event()
+        self.__stopped = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+        self.__next_send: Dict[str, float] = dict()
+
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        """
+        Start the worker thread.
+        """
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__run, name="outbox-sender", daemon=True)
+        self.__thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stop the worker thread. The notifications not sent yet stay in the outbox.
+        """
+        self.__stopped.set()
+        self.__wake_up.set()
+
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+    def notify(self) -> None:
+        """
+        Wake the worker thread up, e.g. after notifications were added to the outbox.
+        """
+        self.__wake_up.set()
+
+    def __get_backoff(self, attempts: int, error: Exception) -> float:
+        retry_after = getattr(error, "retry_after", None)
+
+        if retry_after is not None:
+            return float(retry_after)
+
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempts))
+
+    def run_once(self) -> Optional[float]:
+        """
+        Send the notifications due now, and return the seconds until the next one is due, or None if the outbox is empty.
+        """
+        heads = self.outbox.get_heads()
+        next_due: Optional[float] = None
+
+        for id, chat_id, kind, payload, attempts, next_attempt in heads:
+            if self.__stopped.is_set():
+                return 0
+
+            wait = max(self.__next_send.get(chat_id, 0), next_attempt) - time.time()
+
+            if wait > 0:
+                next_due = min(next_due, wait) if next_due is not None else wait
+                continue
+
+            try:
+                self.send(chat_id, kind, payload)
+            except Exception as error:
+                self.failed += 1
+
+                if isinstance(error, self.permanent_errors) or attempts + 1 >= self.max_attempts:
+                    logger.error("Dropped %s notification to %s after %s attempts: %s", kind, chat_id, attempts + 1, error)
+                    self.outbox.delete(id)
+                    self.dropped += 1
+                else:
+                    backoff = self.__get_backoff(attempts, error)
+                    logger.warning("Failed to send %s notification to %s, retrying in %.1fs: %s", kind, chat_id, backoff, error)
+                    self.outbox.postpone(id, time.time() + backoff)
+            else:
+                self.outbox.delete(id)
+                self.sent += 1
+
+            self.__next_send[chat_id] = time.time() + self.chat_interval
+            time.sleep(self.global_interval)
+
+        if heads and next_due is None:
+            # Some notifications were sent, the next ones of their chats may be due after the chat interval.
+            next_due = 0
+
+        return next_due
+
+    def __run(self) -> None:
+        while not self.__stopped.is_set():
+            self.__wake_up.clear()
+
+            try:
+                next_due = self.run_once()
+            except Exception:
+                logger.exception("Error when sending notifications!")
+                next_due = self.max_backoff
+
+            if next_due is None or next_due > 0:
+                self.__wake_up.wait(next_due)
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Return the number of notifications sent, failed and dropped, and of the notifications waiting in the outbox.
+        """
+        return {"sent": self.sent, "failed": self.failed, "dropped": self.dropped, "pending": len(self.outbox)}
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, Callable, Dict, List, Optional
+
+import math
+import threading
+import time
+
+from flightradar24api import FlightRadar24API
+
+from .records import ArrivalRecord
+
+
+class ArrivalsPager(object):
+    """
+    Fetch the upcoming arrivals of an airport up to a lookahead window, requesting only the pages it needs.
+
+    The number of pages of each update is estimated from a running average of scheduled arrivals per hour,
+    and more pages are fetched only while the last arrival is still within the window.
+    """
+    def __init__(
+        self,
+        fr_api: FlightRadar24API,
+        code: str,
+        lookahead: float = 6 * 60 * 60,
+        flight_limit: int = 100,
+        *,
+        max_pages: Optional[int] = None,
+        smoothing: float = 0.3,
+        max_workers: int = 4,
+        on_page_error: Optional[Callable[[int, Exception], None]] = None
+    ):
+        """
+        Constructor of the ArrivalsPager class.
+
+        :param fr_api: API used to fetch the arrivals
+        :param code: ICAO or IATA of the airport
+        :param lookahead: Seconds ahead of the current time the arrivals must cover
+        :param flight_limit: Limit of flights of each page
+        :param max_pages: Maximum number of pages of an update, or None to only stop at the last page of the board
+        :param smoothing: Weight of the last update in the average of arrivals per hour, between 0 and 1
+        :param max_workers: Maximum number of pages fetched at the same time
+        :param on_page_error: Called with the page and the exception of each page that could not be fetched
+        """
+        if lookahead <= 0:
+            raise ValueError(f"The lookahead must be positive. Got '{lookahead}'")
+
+        self.fr_api = fr_api
+        self.code = code
+        self.lookahead = lookahead
+        self.flight_limit = flight_limit
+        self.max_pages = max_pages
+        self.smoothing = smoothing
+        self.max_workers = max_workers
+        self.on_page_error = on_page_error
+
+        self.__lock = threading.Lock()
+        self.__rows_per_hour: Optional[float] = None
+        self.__total_pages: Optional[int] = None
+        self.__last_pages = 0
+
+    def __estimate_pages(self, hours: float) -> int:
+        if self.__rows_per_hour is None:
+            return 1
+
+        return max(1, math.ceil(self.__rows_per_hour * hours / self.flight_limit))
+
+    def __bound_pages(self, first_page: int, pages: int, total_pages: Optional[int]) -> List[int]:
+        last_page = first_page + pages - 1
+
+        if total_pages is not None:
+            last_page = min(last_page, total_pages)
+
+        if self.max_pages is not None:
+            last_page = min(last_page, self.max_pages)
+
+        return list(range(first_page, last_page + 1))
+
+    def get_arrivals(self) -> List[ArrivalRecord]:
+        """
+        Return the arrivals of the board, in order, from its first page up to the end of the lookahead window.
+        """
+        now = time.time()
+        horizon = now + self.lookahead
+
+        with self.__lock:
+            total_pages = self.__total_pages
+            pages = self.__bound_pages(1, self.__estimate_pages(self.lookahead / 3600), total_pages)
+
+        records: List[ArrivalRecord] = list()
+        flight_ids = set()
+        latest_arrival: Optional[int] = None
+        fetched_pages = 0
+
+        while pages:
+            schedules = self.fr_api.get_airport_arrival_pages(
+                self.code, pages, self.flight_limit, max_workers=self.max_workers, on_page_error=self.on_page_error
+            )
+            fetched_pages = pages[-1]
+
+            if not schedules:
+                break
+
+            for schedule in schedules:
+                total_pages = (schedule.get("page") or dict()).get("total") or total_pages
+
+                for row in schedule["data"] or list():
+                    record = ArrivalRecord.from_schedule_row(row)
+
+                    if record.flight_id is not None:
+                        if record.flight_id in flight_ids: continue
+                        flight_ids.add(record.flight_id)
+
+                    records.append(record)
+
+                    if record.scheduled_arrival is not None:
+                        latest_arrival = max(latest_arrival, record.scheduled_arrival) if latest_arrival is not None else record.scheduled_arrival
+
+            if latest_arrival is None or latest_arrival >= horizon:
+                break
+
+            # Fetch the pages expected to cover the rest of the window at the rate seen so far.
+            upcoming = sum(1 for record in records if record.scheduled_arrival is not None and record.scheduled_arrival >= now)
+            hours = max(latest_arrival - now, 60) / 3600
+            remaining = math.ceil(upcoming / hours * (horizon - latest_arrival) / 3600 / self.flight_limit)
+
+            pages = self.__bound_pages(fetched_pages + 1, max(1, remaining), total_pages)
+
+        self.__update(records, now, total_pages, fetched_pages)
+
+        return records
+
+    def __update(self, records: List[ArrivalRecord], now: float, total_pages: Optional[int], fetched_pages: int) -> None:
+        upcoming = [
+            record.scheduled_arrival for record in records
+            if record.scheduled_arrival is not None and now <= record.scheduled_arrival
+        ]
+
+        with self.__lock:
+            self.__total_pages = total_pages
+            self.__last_pages = fetched_pages
+
+            if not upcoming:
+                return
+
+            # Only the arrivals within the window are counted, the rest of the last page is a partial hour.
+            span = min(max(upcoming), now + self.lookahead) - now
+            rows_per_hour = sum(1 for arrival in upcoming if arrival <= now + span) / max(span / 3600, 1 / 60)
+
+            if self.__rows_per_hour is None:
+                self.__rows_per_hour = rows_per_hour
+            else:
+                self.__rows_per_hour += self.smoothing * (rows_per_hour - self.__rows_per_hour)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Return the estimate of arrivals per hour, the total of pages of the board and the pages fetched by the last update.
+        """
+        with self.__lock:
+            rows_per_hour = round(self.__rows_per_hour, 1) if self.__rows_per_hour is not None else None
+            return {"rows_per_hour": rows_per_hour, "total_pages": self.__total_pages, "last_pages": self.__last_pages}
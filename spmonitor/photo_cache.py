@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+from typing import Optional
+
+import collections
+import json
+import os
+import threading
+
+
+class PhotoIdCache(object):
+    """
+    Telegram file_id of the photos already sent, by photo URL, saved in a JSON file.
+
+    A photo sent again by its file_id isn't downloaded by Telegram again.
+    """
+    def __init__(self, path: str, max_size: int = 2048):
+        """
+        Constructor of the PhotoIdCache class.
+
+        :param path: Path of the JSON file. It's read if it exists
+        :param max_size: Maximum number of photos kept. The least recently used is evicted first
+        """
+        self.path = path
+        self.max_size = max_size
+        self.dirty = False
+
+        self.__lock = threading.Lock()
+        self.__file_ids: "collections.OrderedDict[str, str]" = collections.OrderedDict()
+
+        if os.path.isfile(path):
+            try:
+                with open(path, encoding="utf-8") as file:
+                    self.__file_ids.update(json.load(file))
+            except (OSError, ValueError):
+                # A corrupted file only means the photos are uploaded again.
+                self.__file_ids.clear()
+
+    def __len__(self) -> int:
+        return len(self.__file_ids)
+
+    def get(self, photo_url: str) -> Optional[str]:
+        """
+        Return the file_id of a photo, or None if it wasn't sent yet.
+        """
+        with self.__lock:
+            file_id = self.__file_ids.get(photo_url)
+
+            if file_id is not None:
+                self.__file_ids.move_to_end(photo_url)
+
+            return file_id
+
+    def set(self, photo_url: str, file_id: str) -> None:
+        """
+        Set the file_id of a photo.
+        """
+        with self.__lock:
+            if self.__file_ids.get(photo_url) != file_id:
+                self.__file_ids[photo_url] = file_id
+                self.dirty = True
+
+            self.__file_ids.move_to_end(photo_url)
+
+            while len(self.__file_ids) > self.max_size:
+                self.__file_ids.popitem(last=False)
+
+    def delete(self, photo_url: str) -> None:
+        """
+        Forget the file_id of a photo, e.g. when Telegram doesn't accept it anymore.
+        """
+        with self.__lock:
+            if self.__file_ids.pop(photo_url, None) is not None:
+                self.dirty = True
+
+    def save(self) -> None:
+        """
+        Write the file_ids to the JSON file if they changed since it was read or written.
+        """
+        with self.__lock:
+            if not self.dirty:
+                return
+
+            temporary_path = self.path + ".tmp"
+
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump(self.__file_ids, file)
+
+            os.replace(temporary_path, self.path)
+            self.dirty = False
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, Dict, Optional, Tuple
+
+
+def _get(data: Optional[Dict], *keys: str) -> Any:
+    """
+    Walk nested dictionaries, returning None as soon as a level is missing.
+    """
+    for key in keys:
+        if data is None:
+            return None
+        data = data.get(key)
+
+    return data
+
+
+class ArrivalRecord(object):
+    """
+    Compact representation of a row of the arrivals schedule of an airport.
+
+    It keeps only the fields used by the filters and notifications, so the nested
+    FlightRadar24 data is walked once per row.
+    """
+    __slots__ = (
+        "flight_id", "flight_number",
+        "registration", "type_code", "type_name",
+        "airline_name", "airline_iata", "airline_icao", "owner_icao",
+        "origin_name", "origin_iata", "origin_icao",
+        "scheduled_arrival", "estimated_arrival", "real_arrival", "real_departure",
+    )
+
+    def __init__(self, **fields: Any):
+        """
+        Constructor of the ArrivalRecord class. Fields not given are set to None.
+        """
+        for name in self.__slots__:
+            setattr(self, name, fields.pop(name, None))
+
+        if fields:
+            raise TypeError(f"Unknown fields: {', '.join(fields)}")
+
+    def __repr__(self) -> str:
+        template = "<({}) {} - {} - Arrival: {}>"
+        return template.format(self.type_code, self.registration, self.flight_number, self.get_arrival_time())
+
+    @classmethod
+    def from_schedule_row(cls, row: Dict) -> "ArrivalRecord":
+        """
+        Create a record from a row of the arrivals returned by FlightRadar24API.get_airport_details(...).
+        """
+        flight = row.get("flight") or dict()
+        aircraft = flight.get("aircraft")
+        airline = flight.get("airline")
+        origin = _get(flight, "airport", "origin")
+        time = flight.get("time")
+
+        return cls(
+            flight_id=_get(flight, "identification", "id"),
+            flight_number=_get(flight, "identification", "number", "default"),
+            registration=_get(aircraft, "registration"),
+            type_code=_get(aircraft, "model", "code"),
+            type_name=_get(aircraft, "model", "text"),
+            airline_name=_get(airline, "name"),
+            airline_iata=_get(airline, "code", "iata"),
+            airline_icao=_get(airline, "code", "icao"),
+            owner_icao=_get(flight, "owner", "code", "icao"),
+            origin_name=_get(origin, "name"),
+            origin_iata=_get(origin, "code", "iata"),
+            origin_icao=_get(origin, "code", "icao"),
+            scheduled_arrival=_get(time, "scheduled", "arrival"),
+            estimated_arrival=_get(time, "estimated", "arrival"),
+            real_arrival=_get(time, "real", "arrival"),
+            real_departure=_get(time, "real", "departure"),
+        )
+
+    def get_fingerprint(self) -> Tuple:
+        """
+        Return the values of all the fields, to find out if a flight changed between two updates.
+        """
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def get_arrival_time(self) -> Optional[int]:
+        """
+        Return the best known arrival time: estimated if available, otherwise scheduled.
+        """
+        return self.estimated_arrival if self.estimated_arrival is not None else self.scheduled_arrival
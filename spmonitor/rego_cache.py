@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+from typing import Dict, Iterable, Optional, Tuple
+
+import collections
+import concurrent.futures
+import threading
+import time
+
+from flightradar24api import FlightRadar24API
+
+
+class RegoDetailsCache(object):
+    """
+    Cache of the details of registrations, fetched in the background.
+
+    A lookup waits at most a given time for a registration that isn't cached yet, and the
+    registrations expected soon can be prefetched so their lookup doesn't wait at all.
+    """
+    def __init__(
+        self,
+        fr_api: FlightRadar24API,
+        ttl: float = 30 * 60,
+        max_size: int = 512,
+        *,
+        max_workers: int = 2
+    ):
+        """
+        Constructor of the RegoDetailsCache class.
+
+        :param fr_api: API used to fetch the details
+        :param ttl: Seconds the details of a registration are kept. Half-way through, a prefetch fetches them again
+        :param max_size: Maximum number of registrations kept. The least recently used is evicted first
+        :param max_workers: Maximum number of registrations fetched at the same time
+        """
+        if max_size < 1:
+            raise ValueError(f"The cache size must be at least 1. Got '{max_size}'")
+
+        self.fr_api = fr_api
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self.__lock = threading.Lock()
+        self.__entries: "collections.OrderedDict[str, Tuple[float, Dict]]" = collections.OrderedDict()
+        self.__pending: Dict[str, concurrent.futures.Future] = dict()
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def __fetch(self, registration: str) -> Dict:
+        try:
+            rego_details = self.fr_api.get_rego_details(registration)
+        except Exception:
+            with self.__lock:
+                self.__pending.pop(registration, None)
+                self.errors += 1
+            raise
+
+        with self.__lock:
+            self.__pending.pop(registration, None)
+            self.__entries[registration] = (time.monotonic(), rego_details)
+            self.__entries.move_to_end(registration)
+
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+        return rego_details
+
+    def __submit(self, registration: str) -> concurrent.futures.Future:
+        # Called with the lock held, so a registration is only fetched once at a time.
+        future = self.__pending.get(registration)
+
+        if future is None:
+            future = self.__executor.submit(self.__fetch, registration)
+            self.__pending[registration] = future
+
+        return future
+
+    def get(self, registration: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        """
+        Return the details of a registration, or None if they could not be fetched in time.
+
+        :param registration: Registration of the aircraft
+        :param timeout: Maximum seconds to wait for details not cached yet, or None to wait until they're fetched.
+                        Expired details are still returned if fresh ones are not fetched in time, and the fetch goes on
+                        in the background, e.g. with a timeout of 0 to never wait
+        """
+        with self.__lock:
+            entry = self.__entries.get(registration)
+
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self.__entries.move_to_end(registration)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            future = self.__submit(registration)
+
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            with self.__lock:
+                self.timeouts += 1
+        except Exception:
+            pass
+
+        return entry[1] if entry is not None else None
+
+    def prefetch(self, registrations: Iterable[str]) -> None:
+        """
+        Fetch in the background the details of the registrations that aren't cached or are half-way to expire.
+        """
+        with self.__lock:
+            now = time.monotonic()
+
+            for registration in registrations:
+                entry = self.__entries.get(registration)
+
+                if entry is None or now - entry[0] >= self.ttl / 2:
+                    self.__submit(registration)
+
+    def close(self) -> None:
+        """
+        Stop fetching details, without waiting for the pending fetches.
+        """
+        self.__executor.shutdown(wait=False)
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Return the hit, miss, timeout and error counters, the current size of the cache and the number of pending fetches.
+        """
+        with self.__lock:
+            return {
+                "hits": self.hits, "misses": self.misses, "timeouts": self.timeouts, "errors": self.errors,
+                "size": len(self.__entries), "pending": len(self.__pending),
+            }
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, Dict, Iterable, Optional
+
+import dataclasses
+import threading
+import time
+
+from .records import ArrivalRecord
+from .time_helper import AirportClock
+
+
+@dataclasses.dataclass
+class PollDecision(object):
+    """
+    Data class with the delay chosen before the next update, and why.
+    """
+    interval: float
+    reason: str
+    upcoming_arrivals: int = 0
+    watched_eta: Optional[int] = None
+
+
+class PollScheduler(object):
+    """
+    Choose the delay before the next update from the density of arrivals, the time of day
+    and the nearest estimated arrival of a watched plane, within a minimum and a maximum.
+    """
+    def __init__(
+        self,
+        base_interval: float,
+        min_interval: float,
+        max_interval: float,
+        clock: AirportClock,
+        *,
+        night_hours: Iterable[int] = range(0, 5),
+        watch_window: float = 30 * 60,
+        smoothing: float = 0.2
+    ):
+        """
+        Constructor of the PollScheduler class.
+
+        :param base_interval: Seconds between two updates with an average traffic
+        :param min_interval: Minimum seconds between two updates
+        :param max_interval: Maximum seconds between two updates
+        :param clock: Local time of the airport
+        :param night_hours: Local hours when the updates are spaced out to the maximum interval
+        :param watch_window: Seconds before the arrival of a watched plane during which the updates are made at the minimum interval
+        :param smoothing: Weight of the last update in the average of upcoming arrivals, between 0 and 1
+        """
+        if not 0 < min_interval <= max_interval:
+            raise ValueError(f"The intervals must verify 0 < min ({min_interval}) <= max ({max_interval}).")
+
+        self.base_interval = min(max(base_interval, min_interval), max_interval)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.clock = clock
+        self.night_hours = frozenset(night_hours)
+        self.watch_window = watch_window
+        self.smoothing = smoothing
+
+        self.__lock = threading.Lock()
+        self.__average_arrivals: Optional[float] = None
+        self.__last_decision: Optional[PollDecision] = None
+        self.__decisions = 0
+        self.__total_interval = 0.0
+
+    def __bound(self, interval: float) -> float:
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def get_next_interval(self, arrivals: Iterable[ArrivalRecord], watched_etas: Iterable[int]) -> PollDecision:
+        """
+        Return the delay before the next update.
+
+        :param arrivals: Arrivals of the last update
+        :param watched_etas: Estimated arrival times of the watched planes of the last update
+        """
+        now = time.time()
+
+        upcoming_arrivals = sum(
+            1 for arrival in arrivals
+            if arrival.get_arrival_time() is not None and now <= arrival.get_arrival_time() <= now + 60 * 60
+        )
+        watched_eta = min((eta for eta in watched_etas if eta >= now), default=None)
+
+        with self.__lock:
+            if self.__average_arrivals is None:
+                self.__average_arrivals = float(upcoming_arrivals)
+            else:
+                self.__average_arrivals += self.smoothing * (upcoming_arrivals - self.__average_arrivals)
+
+            average_arrivals = self.__average_arrivals
+
+        if watched_eta is not None and watched_eta - now <= self.watch_window:
+            decision = PollDecision(self.min_interval, "watched plane arriving", upcoming_arrivals, watched_eta)
+        elif self.clock.get_local_hour(int(now)) in self.night_hours:
+            decision = PollDecision(self.max_interval, "night", upcoming_arrivals, watched_eta)
+        elif upcoming_arrivals == 0:
+            decision = PollDecision(self.max_interval, "no arrival in the next hour", upcoming_arrivals, watched_eta)
+        else:
+            # Busier than usual polls more often, quieter than usual less often, up to twice the base interval either way.
+            factor = min(max(average_arrivals / upcoming_arrivals, 0.5), 2.0)
+            decision = PollDecision(self.__bound(self.base_interval * factor), "traffic density", upcoming_arrivals, watched_eta)
+
+        # Don't wait past the watch window of the next watched plane.
+        if watched_eta is not None and decision.interval > watched_eta - self.watch_window - now > 0:
+            decision.interval = self.__bound(watched_eta - self.watch_window - now)
+            decision.reason += ", until watched plane"
+
+        with self.__lock:
+            self.__last_decision = decision
+            self.__decisions += 1
+            self.__total_interval += decision.interval
+
+        return decision
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Return the last decision, the number of decisions and their average interval.
+        """
+        with self.__lock:
+            return {
+                "last_decision": dataclasses.asdict(self.__last_decision) if self.__last_decision is not None else None,
+                "decisions": self.__decisions,
+                "average_interval": round(self.__total_interval / self.__decisions) if self.__decisions else None,
+                "average_upcoming_arrivals": round(self.__average_arrivals, 1) if self.__average_arrivals is not None else None,
+            }
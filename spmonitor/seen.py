@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+from typing import Dict, Hashable, Optional, Tuple
+
+import collections
+import threading
+import time
+
+from .records import ArrivalRecord
+
+
+class SeenFlightCache(object):
+    """
+    Fingerprints of the arrivals already processed, used to skip the ones that didn't change since.
+
+    A flight is skipped as long as its fingerprint doesn't change, however long ago it landed. The entries are evicted
+    by a least recently used policy, and once the flight wasn't seen for a time to live, which is shorter once it has landed.
+    """
+    def __init__(self, max_size: int = 2048, ttl: float = 3600, landed_ttl: float = 1800):
+        """
+        Constructor of the SeenFlightCache class.
+
+        :param max_size: Maximum number of flights kept. The least recently seen flight is evicted first
+        :param ttl: Seconds a flight is kept after it was last seen
+        :param landed_ttl: Seconds a landed flight is kept after it was last seen
+        """
+        if max_size < 1:
+            raise ValueError(f"The cache size must be at least 1. Got '{max_size}'")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.landed_ttl = landed_ttl
+
+        self.__lock = threading.Lock()
+        self.__entries: "collections.OrderedDict[Hashable, Tuple[float, Tuple]]" = collections.OrderedDict()
+        self.__version: Optional[Hashable] = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def sync(self, version: Hashable) -> None:
+        """
+        Forget all the flights if the version of the filters changed, e.g. after a watchlist was edited.
+        """
+        with self.__lock:
+            if version != self.__version:
+                self.__entries.clear()
+                self.__version = version
+
+    def __get_expiry(self, record: ArrivalRecord) -> float:
+        return time.time() + (self.landed_ttl if record.real_arrival is not None else self.ttl)
+
+    def is_changed(self, record: ArrivalRecord) -> bool:
+        """
+        Check if a flight is new or changed since it was last marked as processed. An unchanged flight is kept for another time to live.
+        """
+        if record.flight_id is None:
+            return True
+
+        with self.__lock:
+            entry = self.__entries.get(record.flight_id)
+
+            if entry is None or entry[1] != record.get_fingerprint():
+                self.misses += 1
+                return True
+
+            self.__entries[record.flight_id] = (self.__get_expiry(record), entry[1])
+            self.__entries.move_to_end(record.flight_id)
+            self.hits += 1
+            return False
+
+    def mark(self, record: ArrivalRecord) -> None:
+        """
+        Mark a flight as processed with its current fields.
+        """
+        if record.flight_id is None:
+            return
+
+        expires_at = self.__get_expiry(record)
+
+        with self.__lock:
+            self.__entries[record.flight_id] = (expires_at, record.get_fingerprint())
+            self.__entries.move_to_end(record.flight_id)
+
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def evict_expired(self) -> int:
+        """
+        Remove the flights not seen for their time to live, e.g. the ones no longer on the arrivals board, and return their number.
+        """
+        now = time.time()
+
+        with self.__lock:
+            expired = [flight_id for flight_id, (expires_at, fingerprint) in self.__entries.items() if expires_at <= now]
+
+            for flight_id in expired:
+                del self.__entries[flight_id]
+
+        return len(expired)
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Return the hit and miss counters and the current size of the cache.
+        """
+        with self.__lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.__entries)}
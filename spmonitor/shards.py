@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ShardConnection(object):
+    """
+    End of a worker process: the airports of its shard, the commands sent to it and the messages it sends back.
+    """
+    def __init__(self, index: int, airport_codes: List[str], commands: "multiprocessing.Queue", messages: "multiprocessing.Queue"):
+        """
+        Constructor of the ShardConnection class.
+
+        :param index: Index of the shard
+        :param airport_codes: Airports of the shard
+        :param commands: Queue of the commands sent by the coordinator
+        :param messages: Queue of the messages sent to the coordinator
+        """
+        self.index = index
+        self.airport_codes = airport_codes
+
+        self.__commands = commands
+        self.__messages = messages
+
+    def send(self, message: Any) -> None:
+        """
+        Send a message to the coordinator, e.g. a notification. It must be picklable.
+        """
+        self.__messages.put(("message", message))
+
+    def get_command(self, timeout: Optional[float] = None) -> Optional[Tuple]:
+        """
+        Wait for the next command of the coordinator, and return None if there wasn't any in time.
+        """
+        try:
+            return self.__commands.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def reply(self, request_id: int, call: Callable[[], Any]) -> None:
+        """
+        Run a call requested by the coordinator and send back its result, or the error it raised.
+        """
+        try:
+            result, error = call(), None
+        except Exception as exception:
+            result, error = None, exception
+
+        self.__messages.put(("result", request_id, result, error))
+
+
+class ShardOutbox(object):
+    """
+    Outbox of a worker process, forwarding the notifications to the outbox of the coordinator.
+    """
+    def __init__(self, connection: ShardConnection):
+        """
+        Constructor of the ShardOutbox class.
+
+        :param connection: Connection of the worker process
+        """
+        self.connection = connection
+
+    def put(self, chat_id: str, kind: str, payload: Dict[str, Any]) -> None:
+        """
+        Forward a notification, see NotificationOutbox.put().
+        """
+        self.connection.send(("notification", chat_id, kind, payload))
+
+
+class ShardPool(object):
+    """
+    Worker processes each running the updates of a shard of the airports.
+
+    The messages of the workers are handled by the coordinator in a thread, and a worker that exits is started again.
+    The workers are spawned rather than forked, so they don't inherit the threads and locks of the coordinator
+    and may be started at any time. The worker function must be importable, and loads its settings again.
+    """
+    def __init__(
+        self,
+        airport_codes: List[str],
+        processes: int,
+        worker: Callable[[ShardConnection], None],
+        on_message: Callable[[Any], None],
+        *,
+        call_timeout: float = 60.0
+    ):
+        """
+        Constructor of the ShardPool class.
+
+        :param airport_codes: Airports to update. They're split across the processes in turn
+        :param processes: Number of worker processes, at most one per airport
+        :param worker: Function run by each worker process with its connection. It must be defined at the top level of a module
+        :param on_message: Called by the coordinator with each message sent by a worker
+        :param call_timeout: Maximum seconds to wait for the result of a call to a worker
+        """
+        if processes < 1:
+            raise ValueError(f"The number of processes must be at least 1. Got '{processes}'")
+
+        processes = min(processes, len(airport_codes))
+
+        self.shards = [airport_codes[index::processes] for index in range(processes)]
+        self.worker = worker
+        self.on_message = on_message
+        self.call_timeout = call_timeout
+
+        self.__context = multiprocessing.get_context("spawn")
+        self.__messages = self.__context.Queue()
+        self.__commands = [self.__context.Queue() for _ in self.shards]
+        self.__processes: List[Optional[multiprocessing.Process]] = [None] * len(self.shards)
+        self.__stopped = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+        self.__lock = threading.Lock()
+        self.__request_ids = itertools.count()
+        self.__pending: Dict[int, Tuple[threading.Event, List]] = dict()
+
+        self.restarts = 0
+
+    def get_shard(self, airport_code: str) -> int:
+        """
+        Return the index of the shard of an airport.
+        """
+        for index, shard in enumerate(self.shards):
+            if airport_code in shard:
+                return index
+
+        raise KeyError(airport_code)
+
+    def __start_process(self, index: int) -> None:
+        process = self.__context.Process(
+            target=self.worker,
+            args=(ShardConnection(index, self.shards[index], self.__commands[index], self.__messages),),
+            name=f"shard-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.__processes[index] = process
+
+    def start(self) -> None:
+        """
+        Start the worker processes, then the thread handling their messages.
+        """
+        self.__stopped.clear()
+
+        for index in range(len(self.shards)):
+            self.__start_process(index)
+
+        self.__thread = threading.Thread(target=self.__run, name="shard-pool", daemon=True)
+        self.__thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Ask the worker processes to stop after their current update, and wait for them.
+        """
+        self.__stopped.set()
+        self.broadcast(("stop",))
+
+        for process in self.__processes:
+            if process is not None:
+                process.join(timeout)
+
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+    def send(self, index: int, command: Tuple) -> None:
+        """
+        Send a command to the worker process of a shard.
+        """
+        self.__commands[index].put(command)
+
+    def broadcast(self, command: Tuple) -> None:
+        """
+        Send a command to all the worker processes.
+        """
+        for index in range(len(self.shards)):
+            self.send(index, command)
+
+    def call(self, airport_code: str, chat_id: str, method: str, *args: Any) -> Any:
+        """
+        Call a method of the state of a chat at an airport in the worker process of the airport, and return its result.
+
+        :raises TimeoutError: If the worker doesn't reply in time, e.g. while it's busy with a long update
+        """
+        event = threading.Event()
+        result: List = list()
+
+        with self.__lock:
+            request_id = next(self.__request_ids)
+            self.__pending[request_id] = (event, result)
+
+        self.send(self.get_shard(airport_code), ("call", request_id, airport_code, chat_id, method, args))
+
+        if not event.wait(self.call_timeout):
+            with self.__lock:
+                self.__pending.pop(request_id, None)
+            raise TimeoutError(f"No reply from the worker of '{airport_code}' after {self.call_timeout} seconds")
+
+        value, error = result
+
+        if error is not None:
+            raise error
+
+        return value
+
+    def __check_processes(self) -> None:
+        for index, process in enumerate(self.__processes):
+            if process is not None and not process.is_alive() and not self.__stopped.is_set():
+                logger.error("Shard %s exited with code %s, restarting it", index, process.exitcode)
+                self.restarts += 1
+                self.__start_process(index)
+
+    def __run(self) -> None:
+        next_check = time.monotonic() + 1
+
+        while not self.__stopped.is_set():
+            # The workers are checked every second, even while they keep sending messages.
+            if time.monotonic() >= next_check:
+                self.__check_processes()
+                next_check = time.monotonic() + 1
+
+            try:
+                message = self.__messages.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            if message[0] == "result":
+                _, request_id, value, error = message
+
+                with self.__lock:
+                    pending = self.__pending.pop(request_id, None)
+
+                if pending is not None:
+                    pending[1].extend((value, error))
+                    pending[0].set()
+                continue
+
+            try:
+                self.on_message(message[1])
+            except Exception:
+                logger.exception("Error when handling a message of a shard!")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Return the airports of each shard, the number of workers alive and the number of restarts.
+        """
+        return {
+            "shards": self.shards,
+            "alive": sum(1 for process in self.__processes if process is not None and process.is_alive()),
+            "restarts": self.restarts,
+        }
+
+
+class ShardStateStore(object):
+    """
+    Tables of the state of a chat at an airport owned by a worker process, read and replaced through its pool.
+    """
+    def __init__(self, pool: ShardPool, airport_code: str, chat_id: str):
+        """
+        Constructor of the ShardStateStore class.
+
+        :param pool: Pool of the worker processes
+        :param airport_code: Airport whose state is read and replaced
+        :param chat_id: Chat whose state is read and replaced
+        """
+        self.pool = pool
+        self.airport_code = airport_code
+        self.chat_id = chat_id
+
+    def get_table(self, name: str) -> Any:
+        """
+        Return a copy of a table, see FilterStateStore.get_table().
+        """
+        return self.pool.call(self.airport_code, self.chat_id, "get_table", name)
+
+    def replace_table(self, name: str, table: Any) -> None:
+        """
+        Replace a table and write it, see FilterStateStore.replace_table().
+        """
+        self.pool.call(self.airport_code, self.chat_id, "replace_table", name, table)
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, Dict, Optional, Tuple
+
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from .state import ExclusionSet, WatchlistIndex
+
+
+class SqliteStateStore(object):
+    """
+    State of the filters kept in an SQLite database, with the same interface as FilterStateStore.
+
+    Every lookup goes through an index, except the exclusion list and the watchlists which are held
+    in memory until refresh() sees a change. The entries of the watchlists may be patterns, see
+    WatchlistIndex. Changes made while checking the arrivals belong to a single transaction,
+    committed by flush(), usually at the end of each update.
+    """
+    __schema = """
+        CREATE TABLE IF NOT EXISTS exclusion_list (
+            "Airline" TEXT, "Registration" TEXT, "Description" TEXT
+        );
+        CREATE INDEX IF NOT EXISTS exclusion_list_registration ON exclusion_list ("Registration");
+
+        CREATE TABLE IF NOT EXISTS special_livery_history (
+            "Registration" TEXT PRIMARY KEY, "Time" INTEGER
+        );
+
+        CREATE TABLE IF NOT EXISTS rare_plane_history (
+            "Airline" TEXT, "Aircraft Type" TEXT, "Time" INTEGER,
+            PRIMARY KEY ("Airline", "Aircraft Type")
+        );
+
+        CREATE TABLE IF NOT EXISTS rego_watchlist (
+            "Airline" TEXT, "Registration" TEXT, "Description" TEXT, "Time" REAL
+        );
+        CREATE INDEX IF NOT EXISTS rego_watchlist_registration ON rego_watchlist ("Registration");
+
+        CREATE TABLE IF NOT EXISTS type_watchlist (
+            "Airline" TEXT, "Aircraft Type" TEXT, "Time" REAL
+        );
+        CREATE INDEX IF NOT EXISTS type_watchlist_airline_type ON type_watchlist ("Airline", "Aircraft Type");
+
+        CREATE TABLE IF NOT EXISTS notifi_record (
+            "Registration" TEXT PRIMARY KEY, "Flight Status" TEXT, "Time" INTEGER
+        );
+
+        CREATE TABLE IF NOT EXISTS metadata (
+            "Name" TEXT PRIMARY KEY, "Value" REAL
+        );
+    """
+
+    # Columns of each table, in the order they are displayed and exported.
+    columns = {
+        "exclusion_list": ["Airline", "Registration", "Description"],
+        "special_livery_history": ["Registration", "Time"],
+        "rare_plane_history": ["Airline", "Aircraft Type", "Time"],
+        "rego_watchlist": ["Airline", "Registration", "Description", "Time"],
+        "type_watchlist": ["Airline", "Aircraft Type", "Time"],
+        "notifi_record": ["Registration", "Flight Status", "Time"],
+    }
+
+    def __init__(self, db_path: str):
+        """
+        Constructor of the SqliteStateStore class.
+
+        :param db_path: Path of the database file. It's created if it doesn't exist
+        """
+        self.db_path = db_path
+
+        self.__lock = threading.RLock()
+        self.__connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.__connection.executescript(self.__schema)
+
+        # Changed every time a table is replaced or reloaded, e.g. from the /filters menu.
+        self.version = 0
+
+        self.__exclusion = ExclusionSet()
+        self.__watchlists = WatchlistIndex()
+        self.__data_version: Optional[int] = None
+        self.__load_cache()
+
+    def close(self) -> None:
+        """
+        Commit the pending changes and close the database.
+        """
+        with self.__lock:
+            self.__connection.commit()
+            self.__connection.close()
+
+    def __get_data_version(self) -> int:
+        return self.__connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def __load_cache(self) -> None:
+        self.__exclusion.set_rows(self.get_table("exclusion_list").to_dict("records"))
+        self.__watchlists.set_rego_rows(self.get_table("rego_watchlist").to_dict("records"))
+        self.__watchlists.set_type_rows(self.get_table("type_watchlist").to_dict("records"))
+        self.__data_version = self.__get_data_version()
+        self.version += 1
+
+    def refresh(self) -> None:
+        """
+        Reload the exclusion list and the watchlists if the database was modified by another connection since it was read.
+        """
+        with self.__lock:
+            if self.__get_data_version() != self.__data_version:
+                self.__load_cache()
+
+    def import_csv(self, paths: Dict[str, str]) -> None:
+        """
+        Copy the CSV files used by FilterStateStore into the database, replacing the tables.
+
+        :param paths: Path of the CSV file of each table. Missing files are skipped
+        """
+        with self.__lock:
+            for name, path in paths.items():
+                if not os.path.isfile(path):
+                    continue
+
+                df_table = pd.read_csv(path, header=0)
+
+                # The database keeps a single row per key of the history tables.
+                if name == "rare_plane_history":
+                    df_table = df_table.sort_values("Time").drop_duplicates(["Airline", "Aircraft Type"], keep="last")
+                elif name in ("special_livery_history", "notifi_record"):
+                    df_table = df_table.drop_duplicates(["Registration"], keep="first")
+
+                self.__replace_rows(name, df_table)
+
+            self.__connection.commit()
+            self.__load_cache()
+
+    def flush(self) -> None:
+        """
+        Commit the changes made since the last flush.
+        """
+        with self.__lock:
+            self.__connection.commit()
+
+    def get_table(self, name: str) -> pd.DataFrame:
+        """
+        Return a copy of a table as a DataFrame.
+        """
+        with self.__lock:
+            columns = ", ".join(f'"{column}"' for column in self.columns[name])
+            return pd.read_sql_query(f"SELECT {columns} FROM {name} ORDER BY rowid", self.__connection)
+
+    def replace_table(self, name: str, df_table: pd.DataFrame) -> None:
+        """
+        Replace all the rows of a table and commit it at once, e.g. after it was edited from Telegram.
+        """
+        with self.__lock:
+            self.__replace_rows(name, df_table)
+            self.__connection.commit()
+
+            if name in ("exclusion_list", "rego_watchlist", "type_watchlist"):
+                self.__load_cache()
+            else:
+                self.version += 1
+
+    def __replace_rows(self, name: str, df_table: pd.DataFrame) -> None:
+        columns = self.columns[name]
+        rows = [
+            tuple(None if pd.isna(row.get(column)) else row.get(column) for column in columns)
+            for row in df_table.to_dict("records")
+        ]
+
+        self.__connection.execute(f"DELETE FROM {name}")
+        self.__connection.executemany(
+            "INSERT INTO {} ({}) VALUES ({})".format(
+                name, ", ".join(f'"{column}"' for column in columns), ", ".join("?" * len(columns))
+            ),
+            rows
+        )
+
+    def __fetch_one(self, query: str, parameters: tuple) -> Optional[Dict[str, Any]]:
+        cursor = self.__connection.execute(query, parameters)
+        row = cursor.fetchone()
+
+        if row is None:
+            return None
+        return {description[0]: value for description, value in zip(cursor.description, row)}
+
+    # Exclusion list.
+
+    def is_excluded(self, registration: str, airline: Optional[str] = None) -> bool:
+        """
+        Check if a registration, or the airline operating it, is in the exclusion list.
+        """
+        return self.__exclusion.contains(registration, airline)
+
+    # Special livery history.
+
+    def get_livery_time(self, registration: str) -> Optional[float]:
+        """
+        Return when a special livery plane was last seen, or None if it never was.
+        """
+        with self.__lock:
+            row = self.__fetch_one('SELECT "Time" FROM special_livery_history WHERE "Registration" = ?', (registration,))
+            return row["Time"] if row is not None else None
+
+    def set_livery_time(self, registration: str, time: int) -> None:
+        """
+        Set when a special livery plane was last seen.
+        """
+        with self.__lock:
+            self.__connection.execute(
+                'INSERT OR REPLACE INTO special_livery_history ("Registration", "Time") VALUES (?, ?)', (registration, time)
+            )
+
+    # Rare plane history.
+
+    def get_rare_plane_time(self, airline: str, aircraft_type: str) -> Optional[float]:
+        """
+        Return when an aircraft type of an airline was last seen, or None if it never was.
+        """
+        with self.__lock:
+            row = self.__fetch_one(
+                'SELECT "Time" FROM rare_plane_history WHERE "Airline" = ? AND "Aircraft Type" = ?', (airline, aircraft_type)
+            )
+            return row["Time"] if row is not None else None
+
+    def set_rare_plane_time(self, airline: str, aircraft_type: str, time: int) -> None:
+        """
+        Set when an aircraft type of an airline was last seen.
+        """
+        with self.__lock:
+            self.__connection.execute(
+                'INSERT OR REPLACE INTO rare_plane_history ("Airline", "Aircraft Type", "Time") VALUES (?, ?, ?)',
+                (airline, aircraft_type, time)
+            )
+
+    def get_rare_plane_watermark(self) -> Optional[float]:
+        """
+        Return the latest time of the rare plane history, or None if it's empty.
+        """
+        with self.__lock:
+            return self.__connection.execute('SELECT MAX("Time") FROM rare_plane_history').fetchone()[0]
+
+    def get_rare_plane_low_watermark(self) -> Optional[float]:
+        """
+        Return the time back to which the arrivals history was read without a gap into the rare plane history,
+        0 if it was read to its end, or None if it's not known.
+        """
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT "Value" FROM metadata WHERE "Name" = ?', ("rare_plane_low_watermark",)
+            ).fetchone()
+            return row[0] if row is not None else None
+
+    def set_rare_plane_low_watermark(self, time: float) -> None:
+        """
+        Set the time back to which the arrivals history was read without a gap, see get_rare_plane_low_watermark().
+        """
+        with self.__lock:
+            self.__connection.execute(
+                'INSERT OR REPLACE INTO metadata ("Name", "Value") VALUES (?, ?)', ("rare_plane_low_watermark", time)
+            )
+
+    def get_rare_plane_gap(self) -> Optional[Tuple[float, float]]:
+        """
+        Return the times between which the arrivals history is still to be read into the rare plane history,
+        e.g. after a reading stopped at a page that could not be fetched, or None if there's no gap.
+        """
+        with self.__lock:
+            values = dict(self.__connection.execute(
+                'SELECT "Name", "Value" FROM metadata WHERE "Name" IN (?, ?)', ("rare_plane_gap_since", "rare_plane_gap_until")
+            ).fetchall())
+
+        if len(values) < 2:
+            return None
+
+        return values["rare_plane_gap_since"], values["rare_plane_gap_until"]
+
+    def set_rare_plane_gap(self, gap: Optional[Tuple[float, float]]) -> None:
+        """
+        Set the times between which the arrivals history is still to be read, see get_rare_plane_gap().
+        """
+        with self.__lock:
+            if gap is None:
+                self.__connection.execute(
+                    'DELETE FROM metadata WHERE "Name" IN (?, ?)', ("rare_plane_gap_since", "rare_plane_gap_until")
+                )
+            else:
+                self.__connection.executemany(
+                    'INSERT OR REPLACE INTO metadata ("Name", "Value") VALUES (?, ?)',
+                    [("rare_plane_gap_since", gap[0]), ("rare_plane_gap_until", gap[1])]
+                )
+
+    def merge_rare_plane_times(self, times: Dict[Tuple[str, str], int]) -> None:
+        """
+        Set the time of several (airline, aircraft type) of the rare plane history, keeping the latest time of each one.
+        """
+        with self.__lock:
+            self.__connection.executemany(
+                'INSERT INTO rare_plane_history ("Airline", "Aircraft Type", "Time") VALUES (?, ?, ?) '
+                'ON CONFLICT ("Airline", "Aircraft Type") DO UPDATE SET "Time" = excluded."Time" '
+                'WHERE rare_plane_history."Time" IS NULL OR rare_plane_history."Time" < excluded."Time"',
+                [(airline, aircraft_type, time) for (airline, aircraft_type), time in times.items()]
+            )
+
+    def compact_rare_plane_history(self, min_time: Optional[int] = None) -> int:
+        """
+        Remove the keys of the rare plane history last seen before a timestamp, and return the number of rows removed.
+
+        The table already keeps a single row per (airline, aircraft type).
+
+        :param min_time: Timestamp before which the keys are removed. If None, nothing is removed
+        """
+        if min_time is None:
+            return 0
+
+        with self.__lock:
+            return self.__connection.execute('DELETE FROM rare_plane_history WHERE "Time" < ?', (min_time,)).rowcount
+
+    # Watchlists.
+
+    def get_rego_watchlist_entry(self, registration: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a copy of the rego watchlist entry matching a registration, or None if it's not watched.
+        """
+        with self.__lock:
+            key = self.__watchlists.match_registration(registration)
+
+            if key is None:
+                return None
+            return self.__fetch_one(
+                'SELECT * FROM rego_watchlist WHERE "Registration" = ? ORDER BY rowid LIMIT 1', (key,)
+            )
+
+    def set_rego_watchlist_time(self, registration: str, time: int) -> None:
+        """
+        Set when a watched registration was last seen, in the entry matching it. Nothing is done if it's not watched.
+        """
+        with self.__lock:
+            key = self.__watchlists.match_registration(registration)
+
+            if key is None:
+                return
+            self.__connection.execute(
+                'UPDATE rego_watchlist SET "Time" = ? WHERE rowid = '
+                '(SELECT rowid FROM rego_watchlist WHERE "Registration" = ? ORDER BY rowid LIMIT 1)',
+                (time, key)
+            )
+
+    def get_type_watchlist_entry(self, airline: str, aircraft_type: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a copy of the type watchlist entry matching an aircraft type of an airline, or None if it's not watched.
+        """
+        with self.__lock:
+            key = self.__watchlists.match_type(airline, aircraft_type)
+
+            if key is None:
+                return None
+            return self.__fetch_one(
+                'SELECT * FROM type_watchlist WHERE "Airline" = ? AND "Aircraft Type" = ? ORDER BY rowid LIMIT 1', key
+            )
+
+    def set_type_watchlist_time(self, airline: str, aircraft_type: str, time: int) -> None:
+        """
+        Set when a watched aircraft type of an airline was last seen, in the entry matching it. Nothing is done
+        if it's not watched.
+        """
+        with self.__lock:
+            key = self.__watchlists.match_type(airline, aircraft_type)
+
+            if key is None:
+                return
+            self.__connection.execute(
+                'UPDATE type_watchlist SET "Time" = ? WHERE rowid = '
+                '(SELECT rowid FROM type_watchlist WHERE "Airline" = ? AND "Aircraft Type" = ? ORDER BY rowid LIMIT 1)',
+                (time, *key)
+            )
+
+    # Notification record.
+
+    def get_notification_record(self, registration: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a copy of the notification record of a registration, or None if there isn't one.
+        """
+        with self.__lock:
+            return self.__fetch_one('SELECT * FROM notifi_record WHERE "Registration" = ?', (registration,))
+
+    def set_notification_record(self, registration: str, flight_status: str, time: int) -> None:
+        """
+        Record the status of a notified plane.
+        """
+        with self.__lock:
+            self.__connection.execute(
+                'INSERT OR REPLACE INTO notifi_record ("Registration", "Flight Status", "Time") VALUES (?, ?, ?)',
+                (registration, flight_status, time)
+            )
+
+    def delete_notification_record(self, registration: str) -> None:
+        """
+        Delete the notification record of a registration.
+        """
+        with self.__lock:
+            self.__connection.execute('DELETE FROM notifi_record WHERE "Registration" = ?', (registration,))
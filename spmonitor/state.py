@@ -0,0 +1,629 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+import json
+import math
+import os
+import threading
+
+import pandas as pd
+
+
+class CsvTable(object):
+    """
+    A CSV file loaded in memory, with an index on its key columns.
+    """
+    def __init__(
+        self,
+        path: str,
+        columns: Sequence[str],
+        key_columns: Sequence[str],
+        *,
+        keep_latest: bool = False,
+        placeholder: bool = False
+    ):
+        """
+        Constructor of the CsvTable class.
+
+        :param path: Path of the CSV file
+        :param columns: Columns of the table, in the order they are written
+        :param key_columns: Columns identifying a row
+        :param keep_latest: If True, the index points to the row with the highest Time of each key. Otherwise, to the first one
+        :param placeholder: If True and the file doesn't exist, it's created with an empty row, so it can be edited from Telegram
+        """
+        self.path = path
+        self.columns = list(columns)
+        self.key_columns = list(key_columns)
+        self.keep_latest = keep_latest
+        self.placeholder = placeholder
+
+        self.rows: List[Dict[str, Any]] = list()
+        self.dirty = False
+
+        self.__index: Dict[Hashable, int] = dict()
+
+    def get_key(self, row: Dict[str, Any]) -> Hashable:
+        """
+        Return the key of a row.
+        """
+        if len(self.key_columns) == 1:
+            return row[self.key_columns[0]]
+        return tuple(row[column] for column in self.key_columns)
+
+    def load(self) -> None:
+        """
+        Read the CSV file, creating it if needed.
+        """
+        if not os.path.isfile(self.path):
+            if not self.placeholder:
+                self.set_rows(list())
+                self.dirty = False
+                return
+
+            empty_row = {column: '' for column in self.columns}
+            pd.DataFrame(data=empty_row, index=[0]).to_csv(self.path, index=False)
+
+        self.set_rows(pd.read_csv(self.path, header=0).to_dict("records"))
+        self.dirty = False
+
+    def save(self) -> None:
+        """
+        Write the table to the CSV file.
+        """
+        pd.DataFrame(self.rows, columns=self.columns).to_csv(self.path, index=False)
+        self.dirty = False
+
+    def set_rows(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Replace all the rows of the table and rebuild the index.
+        """
+        self.rows = rows
+        self.__index = dict()
+
+        for position, row in enumerate(self.rows):
+            key = self.get_key(row)
+            current = self.__index.get(key)
+
+            if current is None or (self.keep_latest and row["Time"] > self.rows[current]["Time"]):
+                self.__index[key] = position
+
+        self.dirty = True
+
+    def find(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """
+        Return the row of a key, or None if there isn't one.
+        """
+        position = self.__index.get(key)
+        return self.rows[position] if position is not None else None
+
+    def upsert(self, row: Dict[str, Any]) -> None:
+        """
+        Update the indexed row of the key of a row, or append it.
+        """
+        key = self.get_key(row)
+        current = self.find(key)
+
+        if current is not None:
+            current.update(row)
+        else:
+            self.__index[key] = len(self.rows)
+            self.rows.append({column: row.get(column) for column in self.columns})
+
+        self.dirty = True
+
+    def delete(self, key: Hashable) -> None:
+        """
+        Delete the indexed row of a key.
+        """
+        position = self.__index.get(key)
+
+        if position is not None:
+            self.set_rows(self.rows[:position] + self.rows[position + 1:])
+
+
+class ExclusionSet(object):
+    """
+    Registrations and airlines of the exclusion list, held in hash sets.
+
+    Rows without a registration exclude every plane of their airline.
+    """
+    def __init__(self):
+        """
+        Constructor of the ExclusionSet class.
+        """
+        self.registrations: Set[str] = set()
+        self.airlines: Set[str] = set()
+
+    def contains(self, registration: str, airline: Optional[str] = None) -> bool:
+        """
+        Check if a registration, or the airline operating it, is excluded.
+        """
+        return registration in self.registrations or (airline is not None and airline in self.airlines)
+
+    def set_rows(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """
+        Replace the content of the sets with the rows of the exclusion list.
+        """
+        registrations = set()
+        airlines = set()
+
+        for row in rows:
+            if not is_missing(row.get("Registration")):
+                registrations.add(row["Registration"])
+            elif not is_missing(row.get("Airline")):
+                airlines.add(row["Airline"])
+
+        self.registrations = registrations
+        self.airlines = airlines
+
+
+# Key of the value of the pattern ending at a node of the trie. Characters are strings, so it can't clash.
+_END = None
+
+
+class PatternMap(object):
+    """
+    Values by pattern, where a pattern is either an exact key or a prefix followed by *. A lone * matches every key.
+
+    The exact keys are in a hash map and the prefixes in a trie, so a lookup takes a time proportional to
+    the length of the key, whatever the number of patterns.
+    """
+    def __init__(self):
+        """
+        Constructor of the PatternMap class.
+        """
+        self.__exact: Dict[str, Any] = dict()
+        self.__trie: Dict[Any, Any] = dict()
+        self.__size = 0
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def add(self, pattern: str, value: Any) -> None:
+        """
+        Add a pattern. If the pattern was already added, the first value is kept.
+        """
+        if not pattern.endswith("*"):
+            if pattern not in self.__exact:
+                self.__exact[pattern] = value
+                self.__size += 1
+            return
+
+        node = self.__trie
+
+        for character in pattern[:-1]:
+            node = node.setdefault(character, dict())
+
+        if _END not in node:
+            node[_END] = value
+            self.__size += 1
+
+    def match(self, key: str) -> Iterator[Any]:
+        """
+        Yield the values of the patterns matching a key, the most specific first: the exact key, then the longest prefixes.
+        """
+        if key in self.__exact:
+            yield self.__exact[key]
+
+        matches = list()
+        node = self.__trie
+
+        if _END in node:
+            matches.append(node[_END])
+
+        for character in key:
+            node = node.get(character)
+
+            if node is None:
+                break
+            if _END in node:
+                matches.append(node[_END])
+
+        yield from reversed(matches)
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Return the value of the most specific pattern matching a key, or None if there isn't any.
+        """
+        return next(self.match(key), None)
+
+
+class WatchlistIndex(object):
+    """
+    Rego and type watchlists compiled for lookups.
+
+    The registrations, airlines and aircraft types of the entries may be patterns such as VH-* or B7*,
+    and * matches any of them, e.g. *,A388 watches the A388 of every airline. A lookup returns the key of
+    the most specific entry matching a plane, so the Time of that entry can be read and updated.
+    """
+    def __init__(self):
+        """
+        Constructor of the WatchlistIndex class.
+        """
+        self.registrations: PatternMap = PatternMap()
+        self.types: PatternMap = PatternMap()
+
+    def set_rego_rows(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """
+        Replace the rego watchlist with its rows.
+        """
+        registrations: PatternMap = PatternMap()
+
+        for row in rows:
+            registration = row.get("Registration")
+
+            if not is_missing(registration):
+                registrations.add(str(registration), registration)
+
+        self.registrations = registrations
+
+    def set_type_rows(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """
+        Replace the type watchlist with its rows.
+        """
+        airlines: Dict[str, PatternMap] = dict()
+        types: PatternMap = PatternMap()
+
+        for row in rows:
+            airline, aircraft_type = row.get("Airline"), row.get("Aircraft Type")
+
+            if is_missing(airline) or is_missing(aircraft_type):
+                continue
+
+            if airline not in airlines:
+                airlines[airline] = PatternMap()
+                types.add(str(airline), (airline, airlines[airline]))
+
+            airlines[airline].add(str(aircraft_type), aircraft_type)
+
+        self.types = types
+
+    def match_registration(self, registration: Optional[str]) -> Optional[str]:
+        """
+        Return the Registration of the rego watchlist entry matching a registration, or None if it's not watched.
+        """
+        if registration is None:
+            return None
+
+        return self.registrations.get(registration)
+
+    def match_type(self, airline: Optional[str], aircraft_type: Optional[str]) -> Optional[Tuple[str, str]]:
+        """
+        Return the Airline and Aircraft Type of the type watchlist entry matching an aircraft type of an airline,
+        or None if it's not watched. The most specific airline is tried first.
+        """
+        if airline is None or aircraft_type is None:
+            return None
+
+        for airline_key, airline_types in self.types.match(airline):
+            type_key = airline_types.get(aircraft_type)
+
+            if type_key is not None:
+                return airline_key, type_key
+
+        return None
+
+
+class FilterStateStore(object):
+    """
+    In-memory state of the filters, backed by their CSV files.
+
+    All the files are read once, except the exclusion list which refresh() reads again when its file
+    changes. The watchlists are compiled into a WatchlistIndex, so their entries may be patterns.
+    Changes made while checking the arrivals are kept in memory and written in a single batch by
+    flush(), usually at the end of each update.
+    """
+    def __init__(self, paths: Dict[str, str]):
+        """
+        Constructor of the FilterStateStore class.
+
+        :param paths: Path of the CSV file of each table: exclusion_list, special_livery_history,
+                      rare_plane_history, rego_watchlist, type_watchlist and notifi_record. The low watermark
+                      of the rare plane history is kept in a JSON file next to its CSV file
+        """
+        self.__lock = threading.RLock()
+        self.__tables = {
+            "exclusion_list": CsvTable(
+                paths["exclusion_list"], ["Airline", "Registration", "Description"], ["Registration"], placeholder=True
+            ),
+            "special_livery_history": CsvTable(
+                paths["special_livery_history"], ["Registration", "Time"], ["Registration"]
+            ),
+            "rare_plane_history": CsvTable(
+                paths["rare_plane_history"], ["Airline", "Aircraft Type", "Time"], ["Airline", "Aircraft Type"], keep_latest=True
+            ),
+            "rego_watchlist": CsvTable(
+                paths["rego_watchlist"], ["Airline", "Registration", "Description", "Time"], ["Registration"], placeholder=True
+            ),
+            "type_watchlist": CsvTable(
+                paths["type_watchlist"], ["Airline", "Aircraft Type", "Time"], ["Airline", "Aircraft Type"], placeholder=True
+            ),
+            "notifi_record": CsvTable(
+                paths["notifi_record"], ["Registration", "Flight Status", "Time"], ["Registration"]
+            ),
+        }
+
+        for table in self.__tables.values():
+            table.load()
+
+        self.__low_watermark_path = os.path.splitext(paths["rare_plane_history"])[0] + "_low_watermark.json"
+        self.__low_watermark: Optional[float] = None
+        self.__gap: Optional[Tuple[float, float]] = None
+        self.__read_state_dirty = False
+
+        if os.path.isfile(self.__low_watermark_path):
+            try:
+                with open(self.__low_watermark_path, encoding="utf-8") as file:
+                    read_state = json.load(file)
+
+                self.__low_watermark = read_state["low_watermark"]
+                self.__gap = tuple(read_state["gap"]) if read_state.get("gap") else None
+            except (OSError, ValueError, KeyError, TypeError):
+                # The history is then taken as complete, like one built before the low watermark was kept.
+                self.__low_watermark, self.__gap = None, None
+
+        # Changed every time a table is replaced or reloaded, e.g. from the /filters menu.
+        self.version = 0
+
+        self.__exclusion = ExclusionSet()
+        self.__exclusion_mtime: Optional[float] = None
+        self.__load_exclusion()
+
+        self.__watchlists = WatchlistIndex()
+        self.__load_watchlists()
+
+    def __get_mtime(self, name: str) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.__tables[name].path)
+        except OSError:
+            return None
+
+    def __load_exclusion(self) -> None:
+        self.__exclusion.set_rows(self.__tables["exclusion_list"].rows)
+        self.__exclusion_mtime = self.__get_mtime("exclusion_list")
+        self.version += 1
+
+    def __load_watchlists(self) -> None:
+        self.__watchlists.set_rego_rows(self.__tables["rego_watchlist"].rows)
+        self.__watchlists.set_type_rows(self.__tables["type_watchlist"].rows)
+
+    def refresh(self) -> None:
+        """
+        Reload the exclusion list if its file was modified since it was read.
+        """
+        with self.__lock:
+            if self.__get_mtime("exclusion_list") != self.__exclusion_mtime:
+                self.__tables["exclusion_list"].load()
+                self.__load_exclusion()
+
+    def flush(self) -> None:
+        """
+        Write the tables changed since the last flush to their files.
+        """
+        with self.__lock:
+            for table in self.__tables.values():
+                if table.dirty: table.save()
+
+            if self.__read_state_dirty:
+                temporary_path = self.__low_watermark_path + ".tmp"
+
+                with open(temporary_path, "w", encoding="utf-8") as file:
+                    json.dump({"low_watermark": self.__low_watermark, "gap": self.__gap}, file)
+
+                os.replace(temporary_path, self.__low_watermark_path)
+                self.__read_state_dirty = False
+
+    def get_table(self, name: str) -> pd.DataFrame:
+        """
+        Return a copy of a table as a DataFrame.
+        """
+        with self.__lock:
+            table = self.__tables[name]
+            return pd.DataFrame([row.copy() for row in table.rows], columns=table.columns)
+
+    def replace_table(self, name: str, df_table: pd.DataFrame) -> None:
+        """
+        Replace all the rows of a table and write it at once, e.g. after it was edited from Telegram.
+        """
+        with self.__lock:
+            table = self.__tables[name]
+            table.set_rows(df_table.to_dict("records"))
+            table.save()
+
+            if name == "exclusion_list":
+                self.__load_exclusion()
+            else:
+                if name in ("rego_watchlist", "type_watchlist"):
+                    self.__load_watchlists()
+                self.version += 1
+
+    # Exclusion list.
+
+    def is_excluded(self, registration: str, airline: Optional[str] = None) -> bool:
+        """
+        Check if a registration, or the airline operating it, is in the exclusion list.
+        """
+        return self.__exclusion.contains(registration, airline)
+
+    # Special livery history.
+
+    def get_livery_time(self, registration: str) -> Optional[float]:
+        """
+        Return when a special livery plane was last seen, or None if it never was.
+        """
+        with self.__lock:
+            row = self.__tables["special_livery_history"].find(registration)
+            return row["Time"] if row is not None else None
+
+    def set_livery_time(self, registration: str, time: int) -> None:
+        """
+        Set when a special livery plane was last seen.
+        """
+        with self.__lock:
+            self.__tables["special_livery_history"].upsert({"Registration": registration, "Time": time})
+
+    # Rare plane history.
+
+    def get_rare_plane_time(self, airline: str, aircraft_type: str) -> Optional[float]:
+        """
+        Return when an aircraft type of an airline was last seen, or None if it never was.
+        """
+        with self.__lock:
+            row = self.__tables["rare_plane_history"].find((airline, aircraft_type))
+            return row["Time"] if row is not None else None
+
+    def set_rare_plane_time(self, airline: str, aircraft_type: str, time: int) -> None:
+        """
+        Set when an aircraft type of an airline was last seen.
+        """
+        with self.__lock:
+            self.__tables["rare_plane_history"].upsert({"Airline": airline, "Aircraft Type": aircraft_type, "Time": time})
+
+    def get_rare_plane_watermark(self) -> Optional[float]:
+        """
+        Return the latest time of the rare plane history, or None if it's empty.
+        """
+        with self.__lock:
+            times = [row["Time"] for row in self.__tables["rare_plane_history"].rows if not is_missing(row["Time"])]
+            return max(times) if times else None
+
+    def get_rare_plane_low_watermark(self) -> Optional[float]:
+        """
+        Return the time back to which the arrivals history was read without a gap into the rare plane history,
+        0 if it was read to its end, or None if it's not known.
+        """
+        with self.__lock:
+            return self.__low_watermark
+
+    def set_rare_plane_low_watermark(self, time: float) -> None:
+        """
+        Set the time back to which the arrivals history was read without a gap, see get_rare_plane_low_watermark().
+        """
+        with self.__lock:
+            if self.__low_watermark != time:
+                self.__low_watermark = time
+                self.__read_state_dirty = True
+
+    def get_rare_plane_gap(self) -> Optional[Tuple[float, float]]:
+        """
+        Return the times between which the arrivals history is still to be read into the rare plane history,
+        e.g. after a reading stopped at a page that could not be fetched, or None if there's no gap.
+        """
+        with self.__lock:
+            return self.__gap
+
+    def set_rare_plane_gap(self, gap: Optional[Tuple[float, float]]) -> None:
+        """
+        Set the times between which the arrivals history is still to be read, see get_rare_plane_gap().
+        """
+        with self.__lock:
+            gap = tuple(gap) if gap is not None else None
+
+            if self.__gap != gap:
+                self.__gap = gap
+                self.__read_state_dirty = True
+
+    def merge_rare_plane_times(self, times: Dict[Tuple[str, str], int]) -> None:
+        """
+        Set the time of several (airline, aircraft type) of the rare plane history, keeping the latest time of each one.
+        """
+        with self.__lock:
+            table = self.__tables["rare_plane_history"]
+
+            for (airline, aircraft_type), time in times.items():
+                row = table.find((airline, aircraft_type))
+
+                if row is None or is_missing(row["Time"]) or row["Time"] < time:
+                    table.upsert({"Airline": airline, "Aircraft Type": aircraft_type, "Time": time})
+
+    def compact_rare_plane_history(self, min_time: Optional[int] = None) -> int:
+        """
+        Keep only the latest row of each (airline, aircraft type) of the rare plane history, and return the number of rows removed.
+
+        :param min_time: If given, the keys last seen before this timestamp are removed too
+        """
+        with self.__lock:
+            table = self.__tables["rare_plane_history"]
+            rows = [
+                row for row in table.rows
+                if table.find(table.get_key(row)) is row and (min_time is None or is_missing(row["Time"]) or row["Time"] >= min_time)
+            ]
+            removed = len(table.rows) - len(rows)
+
+            if removed:
+                table.set_rows(rows)
+
+            return removed
+
+    # Watchlists.
+
+    def get_rego_watchlist_entry(self, registration: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a copy of the rego watchlist entry matching a registration, or None if it's not watched.
+        """
+        with self.__lock:
+            key = self.__watchlists.match_registration(registration)
+            row = self.__tables["rego_watchlist"].find(key) if key is not None else None
+            return row.copy() if row is not None else None
+
+    def set_rego_watchlist_time(self, registration: str, time: int) -> None:
+        """
+        Set when a watched registration was last seen, in the entry matching it. Nothing is done if it's not watched.
+        """
+        with self.__lock:
+            key = self.__watchlists.match_registration(registration)
+
+            if key is not None:
+                self.__tables["rego_watchlist"].upsert({"Registration": key, "Time": time})
+
+    def get_type_watchlist_entry(self, airline: str, aircraft_type: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a copy of the type watchlist entry matching an aircraft type of an airline, or None if it's not watched.
+        """
+        with self.__lock:
+            key = self.__watchlists.match_type(airline, aircraft_type)
+            row = self.__tables["type_watchlist"].find(key) if key is not None else None
+            return row.copy() if row is not None else None
+
+    def set_type_watchlist_time(self, airline: str, aircraft_type: str, time: int) -> None:
+        """
+        Set when a watched aircraft type of an airline was last seen, in the entry matching it. Nothing is done
+        if it's not watched.
+        """
+        with self.__lock:
+            key = self.__watchlists.match_type(airline, aircraft_type)
+
+            if key is not None:
+                self.__tables["type_watchlist"].upsert({"Airline": key[0], "Aircraft Type": key[1], "Time": time})
+
+    # Notification record.
+
+    def get_notification_record(self, registration: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a copy of the notification record of a registration, or None if there isn't one.
+        """
+        with self.__lock:
+            row = self.__tables["notifi_record"].find(registration)
+            return row.copy() if row is not None else None
+
+    def set_notification_record(self, registration: str, flight_status: str, time: int) -> None:
+        """
+        Record the status of a notified plane.
+        """
+        with self.__lock:
+            self.__tables["notifi_record"].upsert({"Registration": registration, "Flight Status": flight_status, "Time": time})
+
+    def delete_notification_record(self, registration: str) -> None:
+        """
+        Delete the notification record of a registration.
+        """
+        with self.__lock:
+            self.__tables["notifi_record"].delete(registration)
+
+
+def is_missing(value: Any) -> bool:
+    """
+    Check if a value read from a table is empty.
+    """
+    return value is None or (isinstance(value, float) and math.isnan(value))
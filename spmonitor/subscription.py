@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, Optional
+
+import dataclasses
+
+from .seen import SeenFlightCache
+
+
+@dataclasses.dataclass
+class FilterSettings(object):
+    """
+    Data class with when a filter notifies: the interval before the same plane is notified again,
+    the weekdays as a mask made by get_weekday_mask() and the time of day (All, Daylight or Off).
+    """
+    time_interval: int
+    weekdays: Optional[int]
+    notification_time: str
+
+
+@dataclasses.dataclass
+class Subscription(object):
+    """
+    Data class with a chat notified of the arrivals of an airport: its filter settings, its filters and history,
+    and the arrivals it already processed.
+    """
+    chat_id: str
+    livery: FilterSettings
+    rare_plane: FilterSettings
+    rego_watchlist: FilterSettings
+    type_watchlist: FilterSettings
+    state_store: Any
+    seen_flights: SeenFlightCache
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+from typing import Dict, Optional, Tuple
+
+import datetime
+import threading
+
+from astral import Observer
+from astral.sun import sun
+
+from .time_helper import AirportClock
+
+
+class SunTable(object):
+    """
+    Dawn and dusk timestamps of a location, precomputed for a rolling window of local dates.
+    """
+    def __init__(self, latitude: float, longitude: float, timezone: str, days: int = 30):
+        """
+        Constructor of the SunTable class.
+
+        :param latitude: Latitude of the location
+        :param longitude: Longitude of the location
+        :param timezone: Name of the time zone of the location
+        :param days: Number of days computed ahead of the current local date
+        """
+        self.timezone = timezone
+        self.days = days
+
+        self.__observer = Observer(latitude, longitude)
+        self.__clock = AirportClock(timezone)
+        self.__lock = threading.Lock()
+        self.__table: Dict[datetime.date, Optional[Tuple[int, int]]] = dict()
+
+        self.refresh()
+
+    def __compute(self, date: datetime.date) -> Optional[Tuple[int, int]]:
+        try:
+            sun_info = sun(self.__observer, date=date, tzinfo=self.timezone)
+        except ValueError:
+            # The sun doesn't reach the depression of dawn or dusk on this date, e.g. in polar regions.
+            return None
+
+        return int(sun_info["dawn"].timestamp()), int(sun_info["dusk"].timestamp())
+
+    def refresh(self) -> None:
+        """
+        Compute the window starting the day before the current local date, and drop the dates before it.
+        """
+        first_date = datetime.datetime.now(self.__clock.tzinfo).date() - datetime.timedelta(days=1)
+
+        with self.__lock:
+            previous_table = self.__table
+
+        table: Dict[datetime.date, Optional[Tuple[int, int]]] = dict()
+
+        for offset in range(self.days + 2):
+            date = first_date + datetime.timedelta(days=offset)
+            table[date] = previous_table[date] if date in previous_table else self.__compute(date)
+
+        with self.__lock:
+            self.__table = table
+
+    def get_dawn_dusk(self, date: datetime.date) -> Optional[Tuple[int, int]]:
+        """
+        Return the dawn and dusk timestamps of a local date, or None if there aren't any.
+
+        Dates out of the window are computed and kept until the next refresh.
+        """
+        with self.__lock:
+            if date in self.__table:
+                return self.__table[date]
+
+        dawn_dusk = self.__compute(date)
+
+        with self.__lock:
+            self.__table[date] = dawn_dusk
+
+        return dawn_dusk
+
+    def is_daylight(self, timestamp: int) -> Optional[bool]:
+        """
+        Check if a timestamp is between the dawn and the dusk of its local date, or return None if they're unknown.
+        """
+        dawn_dusk = self.get_dawn_dusk(self.__clock.get_local_date(timestamp))
+
+        if dawn_dusk is None:
+            return None
+
+        return dawn_dusk[0] < timestamp < dawn_dusk[1]
+
+
+class SunTableRegistry(object):
+    """
+    Sun tables shared by the locations close to each other, e.g. the airports of a city.
+    """
+    def __init__(self, days: int = 30, precision: int = 1):
+        """
+        Constructor of the SunTableRegistry class.
+
+        :param days: Number of days computed ahead by each table
+        :param precision: Number of decimals the coordinates are rounded to before looking a table up.
+                          One decimal is about 10 km, which moves the dawn and dusk by less than a minute
+        """
+        self.days = days
+        self.precision = precision
+
+        self.__lock = threading.Lock()
+        self.__tables: Dict[Tuple[float, float, str], SunTable] = dict()
+
+    def __len__(self) -> int:
+        return len(self.__tables)
+
+    def get(self, latitude: float, longitude: float, timezone: str) -> SunTable:
+        """
+        Return the sun table of a location, creating it if no location close to it has one yet.
+        """
+        key = (round(latitude, self.precision), round(longitude, self.precision), timezone)
+
+        with self.__lock:
+            table = self.__tables.get(key)
+
+            if table is None:
+                table = SunTable(key[0], key[1], timezone, self.days)
+                self.__tables[key] = table
+
+        return table
+
+    def refresh(self) -> None:
+        """
+        Move the window of all the tables to the current day.
+        """
+        with self.__lock:
+            tables = list(self.__tables.values())
+
+        for table in tables:
+            table.refresh()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+from typing import Dict, Iterable, Optional
+
+import datetime
+import threading
+
+import pytz
+
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+_SECONDS_PER_DAY = 24 * 60 * 60
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_EPOCH_WEEKDAY = datetime.date(1970, 1, 1).weekday()
+
+
+def get_weekday_mask(days: Iterable[str]) -> Optional[int]:
+    """
+    Return the bitmask of a list of weekday names (Mon, Tue, ...), or None if the list is empty.
+
+    Bit 0 is Monday. Unknown names don't set any bit.
+    """
+    days = [day.strip() for day in days if day.strip()]
+
+    if not days:
+        return None
+
+    mask = 0
+
+    for day in days:
+        if day in WEEKDAYS:
+            mask |= 1 << WEEKDAYS.index(day)
+
+    return mask
+
+
+class AirportClock(object):
+    """
+    Local time of a time zone, with its UTC offset cached for each day.
+    """
+    def __init__(self, timezone: str, cache_size: int = 366):
+        """
+        Constructor of the AirportClock class.
+
+        :param timezone: Name of the time zone
+        :param cache_size: Maximum number of days whose UTC offset is cached
+        """
+        self.timezone = timezone
+        self.tzinfo = pytz.timezone(timezone)
+        self.cache_size = cache_size
+
+        self.__lock = threading.Lock()
+        self.__offsets: Dict[int, Optional[int]] = dict()
+
+    def __get_offset_at(self, timestamp: int) -> int:
+        return int(datetime.datetime.fromtimestamp(timestamp, self.tzinfo).utcoffset().total_seconds())
+
+    def get_utc_offset(self, timestamp: int) -> int:
+        """
+        Return the UTC offset of the time zone at a timestamp, in seconds.
+        """
+        day = timestamp // _SECONDS_PER_DAY
+
+        with self.__lock:
+            cached = day in self.__offsets
+            offset = self.__offsets.get(day)
+
+        if not cached:
+            # The offset is only cached for the days without a transition, e.g. to daylight saving time.
+            day_start = day * _SECONDS_PER_DAY
+            offset = self.__get_offset_at(day_start)
+
+            if offset != self.__get_offset_at(day_start + _SECONDS_PER_DAY - 1):
+                offset = None
+
+            with self.__lock:
+                if len(self.__offsets) >= self.cache_size:
+                    self.__offsets.clear()
+                self.__offsets[day] = offset
+
+        if offset is None:
+            return self.__get_offset_at(timestamp)
+
+        return offset
+
+    def get_local_date(self, timestamp: int) -> datetime.date:
+        """
+        Return the local date of a timestamp.
+        """
+        timestamp = int(timestamp)
+        return datetime.date.fromordinal(_EPOCH_ORDINAL + (timestamp + self.get_utc_offset(timestamp)) // _SECONDS_PER_DAY)
+
+    def get_local_time(self, timestamp: int) -> datetime.datetime:
+        """
+        Return a timestamp as an aware datetime in the time zone.
+        """
+        return datetime.datetime.fromtimestamp(timestamp, self.tzinfo)
+
+    def get_local_hour(self, timestamp: int) -> int:
+        """
+        Return the local hour of a timestamp, from 0 to 23.
+        """
+        timestamp = int(timestamp)
+        return (timestamp + self.get_utc_offset(timestamp)) % _SECONDS_PER_DAY // 3600
+
+    def get_local_weekday(self, timestamp: int) -> int:
+        """
+        Return the local weekday of a timestamp, Monday being 0.
+        """
+        timestamp = int(timestamp)
+        return ((timestamp + self.get_utc_offset(timestamp)) // _SECONDS_PER_DAY + _EPOCH_WEEKDAY) % 7
+
+    def format_local_time(self, timestamp: int) -> str:
+        """
+        Return the local weekday and time of a timestamp, e.g. "Mon 14:05".
+        """
+        timestamp = int(timestamp)
+        local_seconds = timestamp + self.get_utc_offset(timestamp)
+        weekday = (local_seconds // _SECONDS_PER_DAY + _EPOCH_WEEKDAY) % 7
+        minutes = local_seconds % _SECONDS_PER_DAY // 60
+
+        return f"{WEEKDAYS[weekday]} {minutes // 60:02d}:{minutes % 60:02d}"
+
+    def is_on_weekdays(self, timestamp: int, mask: Optional[int]) -> bool:
+        """
+        Check if the local weekday of a timestamp is in a bitmask made by get_weekday_mask(). A None mask matches all days.
+        """
+        return mask is None or bool(mask & (1 << self.get_local_weekday(timestamp)))